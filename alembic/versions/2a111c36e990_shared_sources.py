@@ -0,0 +1,186 @@
+"""Shared sources
+
+Feeds become per-user subscriptions to a source, which is fetched once no
+matter how many users subscribe to it. Items belong to sources, and the
+per-user read state moves to entries.
+
+Revision ID: 2a111c36e990
+Revises: 44191d13db28
+Create Date: 2026-10-18 10:12:31.402113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "2a111c36e990"
+down_revision: Union[str, None] = "44191d13db28"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+FEED_STATUS = postgresql.ENUM(
+    "OK",
+    "FETCHING",
+    "GONE",
+    "NOT_FOUND",
+    "FAILED",
+    "TRY_LATER",
+    name="feedstatus",
+    create_type=False,
+)
+
+
+def upgrade() -> None:
+    op.create_table(
+        "source",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("actual_url", sa.String(), nullable=True),
+        sa.Column("etag", sa.String(), nullable=True),
+        sa.Column("last_modified", sa.String(), nullable=True),
+        sa.Column("status", FEED_STATUS, nullable=True),
+        sa.Column("last_fetch", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("url"),
+    )
+    op.execute(
+        """
+    INSERT INTO source (url, actual_url, etag, last_modified, status, last_fetch)
+    SELECT DISTINCT ON (source)
+        source, actual_source, etag, last_modified, status, last_fetch
+    FROM feed
+    ORDER BY source, last_fetch DESC NULLS LAST
+    """
+    )
+
+    op.add_column("feed", sa.Column("source_id", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE feed SET source_id = s.id FROM source AS s WHERE s.url = feed.source"
+    )
+    op.alter_column("feed", "source_id", nullable=False)
+    op.create_foreign_key(None, "feed", "source", ["source_id"], ["id"])
+
+    op.add_column("item", sa.Column("source_id", sa.Integer(), nullable=True))
+    op.execute(
+        "UPDATE item SET source_id = f.source_id FROM feed AS f WHERE f.id = item.feed_id"
+    )
+
+    op.create_table(
+        "entry",
+        sa.Column("feed_id", sa.Integer(), nullable=False),
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("updated", sa.DateTime(), nullable=False),
+        sa.Column("read", sa.Boolean(), nullable=False, server_default="False"),
+        sa.ForeignKeyConstraint(["feed_id"], ["feed.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["item_id"], ["item.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("feed_id", "item_id"),
+    )
+    # Several feeds of the same source may have stored the same item. Keep
+    # the oldest copy, and give every subscriber an entry for it - carrying
+    # over the read flag of the subscriber's own copy, if it had one.
+    op.execute(
+        """
+    WITH canonical AS (
+        SELECT DISTINCT ON (source_id, item_id) id, source_id, item_id, updated
+        FROM item
+        ORDER BY source_id, item_id, id
+    )
+    INSERT INTO entry (feed_id, item_id, user_id, updated, read)
+    SELECT f.id, c.id, f.user_id, c.updated, COALESCE(own.read, False)
+    FROM canonical AS c
+    JOIN feed AS f ON f.source_id = c.source_id
+    LEFT JOIN item AS own
+        ON own.feed_id = f.id AND own.item_id IS NOT DISTINCT FROM c.item_id
+    """
+    )
+    op.execute(
+        """
+    DELETE FROM item AS i
+    USING item AS c
+    WHERE c.source_id = i.source_id
+        AND c.item_id IS NOT DISTINCT FROM i.item_id
+        AND c.id < i.id
+    """
+    )
+
+    op.drop_constraint("item_item_id_key", "item", type_="unique")
+    op.drop_constraint("item_feed_id_item_id_key", "item", type_="unique")
+    op.drop_column("item", "feed_id")
+    op.drop_column("item", "read")
+    op.alter_column("item", "source_id", nullable=False)
+    op.create_foreign_key(
+        None, "item", "source", ["source_id"], ["id"], ondelete="CASCADE"
+    )
+    op.create_unique_constraint(None, "item", ["source_id", "item_id"])
+
+    op.drop_column("feed", "source")
+    op.drop_column("feed", "actual_source")
+    op.drop_column("feed", "etag")
+    op.drop_column("feed", "last_modified")
+    op.drop_column("feed", "status")
+    op.drop_column("feed", "last_fetch")
+
+
+def downgrade() -> None:
+    # This is lossy: every item goes back to a single feed (the oldest
+    # subscriber), and other subscribers lose their copy.
+    op.add_column("feed", sa.Column("last_fetch", sa.DateTime(), nullable=True))
+    op.add_column("feed", sa.Column("status", FEED_STATUS, nullable=True))
+    op.add_column("feed", sa.Column("last_modified", sa.String(), nullable=True))
+    op.add_column("feed", sa.Column("etag", sa.String(), nullable=True))
+    op.add_column("feed", sa.Column("actual_source", sa.String(), nullable=True))
+    op.add_column("feed", sa.Column("source", sa.String(), nullable=True))
+    op.execute(
+        """
+    UPDATE feed
+    SET source = s.url,
+        actual_source = s.actual_url,
+        etag = s.etag,
+        last_modified = s.last_modified,
+        status = s.status,
+        last_fetch = s.last_fetch
+    FROM source AS s
+    WHERE s.id = feed.source_id
+    """
+    )
+    op.alter_column("feed", "source", nullable=False)
+
+    op.add_column("item", sa.Column("feed_id", sa.Integer(), nullable=True))
+    op.add_column(
+        "item",
+        sa.Column("read", sa.Boolean(), nullable=False, server_default="False"),
+    )
+    op.execute(
+        """
+    UPDATE item
+    SET feed_id = e.feed_id, read = e.read
+    FROM (
+        SELECT DISTINCT ON (item_id) item_id, feed_id, read
+        FROM entry
+        ORDER BY item_id, feed_id
+    ) AS e
+    WHERE e.item_id = item.id
+    """
+    )
+    op.execute("DELETE FROM item WHERE feed_id IS NULL")
+    op.drop_table("entry")
+
+    op.drop_constraint("item_source_id_item_id_key", "item", type_="unique")
+    op.drop_constraint("item_source_id_fkey", "item", type_="foreignkey")
+    op.drop_column("item", "source_id")
+    op.alter_column("item", "feed_id", nullable=False)
+    op.create_foreign_key(
+        "item_feed_id_fkey", "item", "feed", ["feed_id"], ["id"], ondelete="CASCADE"
+    )
+    op.create_unique_constraint(None, "item", ["feed_id", "item_id"])
+    op.create_unique_constraint(None, "item", ["item_id"])
+
+    op.drop_constraint("feed_source_id_fkey", "feed", type_="foreignkey")
+    op.drop_column("feed", "source_id")
+    op.drop_table("source")
@@ -0,0 +1,125 @@
+"""Feed versions
+
+Revision ID: 43bee763c842
+Revises: 845b2ec7bbdf
+Create Date: 2026-10-18 16:20:37.615049
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "43bee763c842"
+down_revision: Union[str, None] = "845b2ec7bbdf"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# The counting triggers now also bump the feed's version on every change to
+# its entries - including the fan-out of updated items, which doesn't change
+# any counts.
+COUNT_FUNCTION = """
+CREATE OR REPLACE FUNCTION entry_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE feed
+        SET item_count = item_count + delta.items,
+            unread_count = unread_count + delta.unread,
+            version = version + 1,
+            changed_at = now()
+        FROM (
+            SELECT feed_id, count(*) AS items,
+                count(*) FILTER (WHERE NOT read) AS unread
+            FROM new_entries GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE feed
+        SET item_count = item_count - delta.items,
+            unread_count = unread_count - delta.unread,
+            version = version + 1,
+            changed_at = now()
+        FROM (
+            SELECT feed_id, count(*) AS items,
+                count(*) FILTER (WHERE NOT read) AS unread
+            FROM old_entries GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    ELSE
+        UPDATE feed
+        SET unread_count = unread_count + delta.unread,
+            version = version + 1,
+            changed_at = now()
+        FROM (
+            SELECT feed_id,
+                count(*) FILTER (WHERE NOT after.read)
+                - count(*) FILTER (WHERE NOT before.read) AS unread
+            FROM new_entries AS after
+            JOIN old_entries AS before USING (feed_id, item_id)
+            GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+PREVIOUS_FUNCTION = """
+CREATE OR REPLACE FUNCTION entry_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE feed
+        SET item_count = item_count + delta.items,
+            unread_count = unread_count + delta.unread
+        FROM (
+            SELECT feed_id, count(*) AS items,
+                count(*) FILTER (WHERE NOT read) AS unread
+            FROM new_entries GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE feed
+        SET item_count = item_count - delta.items,
+            unread_count = unread_count - delta.unread
+        FROM (
+            SELECT feed_id, count(*) AS items,
+                count(*) FILTER (WHERE NOT read) AS unread
+            FROM old_entries GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    ELSE
+        UPDATE feed
+        SET unread_count = unread_count + delta.unread
+        FROM (
+            SELECT feed_id,
+                count(*) FILTER (WHERE NOT after.read)
+                - count(*) FILTER (WHERE NOT before.read) AS unread
+            FROM new_entries AS after
+            JOIN old_entries AS before USING (feed_id, item_id)
+            WHERE after.read <> before.read
+            GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def upgrade() -> None:
+    op.add_column(
+        "feed", sa.Column("version", sa.Integer(), server_default="0", nullable=False)
+    )
+    op.add_column("feed", sa.Column("changed_at", sa.DateTime(), nullable=True))
+    op.execute(COUNT_FUNCTION)
+
+
+def downgrade() -> None:
+    op.execute(PREVIOUS_FUNCTION)
+    op.drop_column("feed", "changed_at")
+    op.drop_column("feed", "version")
@@ -0,0 +1,66 @@
+"""Item content table
+
+Revision ID: 647204007699
+Revises: da62764dafab
+Create Date: 2026-10-18 14:22:41.508316
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "647204007699"
+down_revision: Union[str, None] = "da62764dafab"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "item_content",
+        sa.Column("item_id", sa.Integer(), nullable=False),
+        sa.Column("content", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.ForeignKeyConstraint(["item_id"], ["item.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("item_id"),
+    )
+    # pglz is the default, lz4 (Postgres 14+) is a lot faster to decompress,
+    # and that's what reading an item mostly is. Not every server is built
+    # with it though, and those keep pglz.
+    lz4_supported = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT 'lz4' = ANY(enumvals) FROM pg_settings"
+                " WHERE name = 'default_toast_compression'"
+            )
+        )
+        .scalar()
+    )
+    if lz4_supported:
+        op.execute("ALTER TABLE item_content ALTER COLUMN content SET COMPRESSION lz4")
+    op.execute(
+        "INSERT INTO item_content (item_id, content) SELECT id, content FROM item"
+    )
+    op.drop_column("item", "content")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "item",
+        sa.Column(
+            "content",
+            postgresql.JSONB(astext_type=sa.Text()),
+            server_default="[]",
+            nullable=False,
+        ),
+    )
+    op.execute(
+        "UPDATE item SET content = item_content.content"
+        " FROM item_content WHERE item_content.item_id = item.id"
+    )
+    op.alter_column("item", "content", server_default=None)
+    op.drop_table("item_content")
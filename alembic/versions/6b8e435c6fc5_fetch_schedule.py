@@ -0,0 +1,74 @@
+"""Per-source fetch schedule
+
+Revision ID: 6b8e435c6fc5
+Revises: fec9795bd2fa
+Create Date: 2026-10-18 12:20:53.904216
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "6b8e435c6fc5"
+down_revision: Union[str, None] = "fec9795bd2fa"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "source",
+        sa.Column(
+            "next_fetch_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+    op.add_column("source", sa.Column("fetch_interval", sa.Integer(), nullable=True))
+    op.add_column(
+        "source",
+        sa.Column("failure_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.add_column("source", sa.Column("ttl", sa.Integer(), nullable=True))
+    op.add_column(
+        "source",
+        sa.Column("skip_hours", postgresql.ARRAY(sa.Integer()), nullable=True),
+    )
+    # Keep the old 5 minute cadence until the first fetch, spread over it.
+    op.execute("""
+    UPDATE source
+    SET next_fetch_at = last_fetch + interval '5 minutes' * (1 + random() / 10)
+    WHERE last_fetch IS NOT NULL
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_source_next_fetch_at",
+            "source",
+            ["next_fetch_at"],
+            postgresql_where=sa.text("status IS NULL OR status IN ('OK', 'TRY_LATER')"),
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_source_due", table_name="source", postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    op.create_index(
+        "ix_source_due",
+        "source",
+        ["last_fetch"],
+        postgresql_where=sa.text("status IS NULL OR status = 'OK'"),
+    )
+    op.drop_index("ix_source_next_fetch_at", table_name="source")
+    op.drop_column("source", "skip_hours")
+    op.drop_column("source", "ttl")
+    op.drop_column("source", "failure_count")
+    op.drop_column("source", "fetch_interval")
+    op.drop_column("source", "next_fetch_at")
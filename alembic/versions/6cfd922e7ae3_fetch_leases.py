@@ -0,0 +1,38 @@
+"""Fetch leases
+
+Revision ID: 6cfd922e7ae3
+Revises: 6b8e435c6fc5
+Create Date: 2026-10-18 13:05:12.671920
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "6cfd922e7ae3"
+down_revision: Union[str, None] = "6b8e435c6fc5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("source", sa.Column("lease_expires_at", sa.DateTime(), nullable=True))
+    # Whatever got stuck fetching before leases existed is up for grabs.
+    op.execute("UPDATE source SET lease_expires_at = now() WHERE status = 'FETCHING'")
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_source_lease_expires_at",
+            "source",
+            ["lease_expires_at"],
+            postgresql_where=sa.text("status = 'FETCHING'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_source_lease_expires_at", table_name="source")
+    op.drop_column("source", "lease_expires_at")
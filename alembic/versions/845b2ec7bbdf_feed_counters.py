@@ -0,0 +1,119 @@
+"""Feed counters
+
+Revision ID: 845b2ec7bbdf
+Revises: 867e7d619c82
+Create Date: 2026-10-18 15:46:13.382907
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "845b2ec7bbdf"
+down_revision: Union[str, None] = "867e7d619c82"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Statement level, so that the fan-out of a fetch updates each feed once, not
+# once per item. Updates only count when read changes - the fan-out of
+# updated items sets nothing else, and transition tables can't be combined
+# with UPDATE OF.
+COUNT_FUNCTION = """
+CREATE FUNCTION entry_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE feed
+        SET item_count = item_count + delta.items,
+            unread_count = unread_count + delta.unread
+        FROM (
+            SELECT feed_id, count(*) AS items,
+                count(*) FILTER (WHERE NOT read) AS unread
+            FROM new_entries GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE feed
+        SET item_count = item_count - delta.items,
+            unread_count = unread_count - delta.unread
+        FROM (
+            SELECT feed_id, count(*) AS items,
+                count(*) FILTER (WHERE NOT read) AS unread
+            FROM old_entries GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    ELSE
+        UPDATE feed
+        SET unread_count = unread_count + delta.unread
+        FROM (
+            SELECT feed_id,
+                count(*) FILTER (WHERE NOT after.read)
+                - count(*) FILTER (WHERE NOT before.read) AS unread
+            FROM new_entries AS after
+            JOIN old_entries AS before USING (feed_id, item_id)
+            WHERE after.read <> before.read
+            GROUP BY feed_id
+        ) AS delta
+        WHERE feed.id = delta.feed_id;
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+TRIGGERS = [
+    """
+    CREATE TRIGGER entry_counts_insert AFTER INSERT ON entry
+    REFERENCING NEW TABLE AS new_entries
+    FOR EACH STATEMENT EXECUTE FUNCTION entry_counts()
+    """,
+    """
+    CREATE TRIGGER entry_counts_update AFTER UPDATE ON entry
+    REFERENCING OLD TABLE AS old_entries NEW TABLE AS new_entries
+    FOR EACH STATEMENT EXECUTE FUNCTION entry_counts()
+    """,
+    """
+    CREATE TRIGGER entry_counts_delete AFTER DELETE ON entry
+    REFERENCING OLD TABLE AS old_entries
+    FOR EACH STATEMENT EXECUTE FUNCTION entry_counts()
+    """,
+]
+
+
+def upgrade() -> None:
+    op.add_column(
+        "feed",
+        sa.Column("item_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "feed",
+        sa.Column("unread_count", sa.Integer(), server_default="0", nullable=False),
+    )
+    op.execute(COUNT_FUNCTION)
+    # Nothing may change entries between counting them and the triggers
+    # taking over.
+    op.execute("LOCK TABLE entry IN SHARE MODE")
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    op.execute("""
+        UPDATE feed
+        SET item_count = counts.items, unread_count = counts.unread
+        FROM (
+            SELECT feed_id, count(*) AS items,
+                count(*) FILTER (WHERE NOT read) AS unread
+            FROM entry GROUP BY feed_id
+        ) AS counts
+        WHERE feed.id = counts.feed_id
+        """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER entry_counts_delete ON entry")
+    op.execute("DROP TRIGGER entry_counts_update ON entry")
+    op.execute("DROP TRIGGER entry_counts_insert ON entry")
+    op.execute("DROP FUNCTION entry_counts()")
+    op.drop_column("feed", "unread_count")
+    op.drop_column("feed", "item_count")
@@ -0,0 +1,40 @@
+"""Timeline indexes
+
+Revision ID: 867e7d619c82
+Revises: de266800a73c
+Create Date: 2026-10-18 15:17:52.904116
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "867e7d619c82"
+down_revision: Union[str, None] = "de266800a73c"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_entry_user_updated",
+            "entry",
+            ["user_id", "updated", "item_id", "feed_id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_entry_user_unread",
+            "entry",
+            ["user_id", "updated", "item_id", "feed_id"],
+            postgresql_where=sa.text("NOT read"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_entry_user_unread", table_name="entry")
+    op.drop_index("ix_entry_user_updated", table_name="entry")
@@ -0,0 +1,41 @@
+"""Change sequence
+
+Revision ID: 957a64ef4a30
+Revises: 43bee763c842
+Create Date: 2026-10-18 16:58:24.120573
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "957a64ef4a30"
+down_revision: Union[str, None] = "43bee763c842"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("change_seq")))
+    # Rewrites the table, numbering every existing entry.
+    op.add_column(
+        "entry",
+        sa.Column(
+            "change_seq",
+            sa.BigInteger(),
+            server_default=sa.text("nextval('change_seq')"),
+            nullable=False,
+        ),
+    )
+    op.create_index(
+        "ix_entry_user_change_seq", "entry", ["user_id", "change_seq"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_entry_user_change_seq", table_name="entry")
+    op.drop_column("entry", "change_seq")
+    op.execute(sa.schema.DropSequence(sa.Sequence("change_seq")))
@@ -0,0 +1,65 @@
+"""Indexes for the scheduler and read paths
+
+Revision ID: a77ee3c2e700
+Revises: 2a111c36e990
+Create Date: 2026-10-18 11:02:47.118230
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "a77ee3c2e700"
+down_revision: Union[str, None] = "2a111c36e990"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently, so that upgrading doesn't lock out the fetchers.
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_email", "user", ["email"], postgresql_concurrently=True
+        )
+        op.create_index(
+            "ix_feed_user_id", "feed", ["user_id", "id"], postgresql_concurrently=True
+        )
+        op.create_index(
+            "ix_feed_source_id", "feed", ["source_id"], postgresql_concurrently=True
+        )
+        op.create_index(
+            "ix_source_due",
+            "source",
+            ["last_fetch"],
+            postgresql_where=sa.text("status IS NULL OR status = 'OK'"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_entry_feed_updated",
+            "entry",
+            ["feed_id", "updated", "item_id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_entry_feed_unread",
+            "entry",
+            ["feed_id", "updated", "item_id"],
+            postgresql_where=sa.text("NOT read"),
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_entry_item_id", "entry", ["item_id"], postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_entry_item_id", table_name="entry")
+    op.drop_index("ix_entry_feed_unread", table_name="entry")
+    op.drop_index("ix_entry_feed_updated", table_name="entry")
+    op.drop_index("ix_source_due", table_name="source")
+    op.drop_index("ix_feed_source_id", table_name="feed")
+    op.drop_index("ix_feed_user_id", table_name="feed")
+    op.drop_index("ix_user_email", table_name="user")
@@ -0,0 +1,48 @@
+"""WebSub
+
+Revision ID: b3e91c5d7a24
+Revises: 957a64ef4a30
+Create Date: 2026-10-18 17:41:09.381526
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "b3e91c5d7a24"
+down_revision: Union[str, None] = "957a64ef4a30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("source", sa.Column("websub_hub", sa.String(), nullable=True))
+    op.add_column("source", sa.Column("websub_topic", sa.String(), nullable=True))
+    op.add_column("source", sa.Column("websub_secret", sa.String(), nullable=True))
+    op.add_column(
+        "source", sa.Column("websub_requested_at", sa.DateTime(), nullable=True)
+    )
+    op.add_column(
+        "source", sa.Column("websub_expires_at", sa.DateTime(), nullable=True)
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_source_websub_expires_at",
+            "source",
+            [sa.text("websub_expires_at NULLS FIRST")],
+            postgresql_where=sa.text("websub_hub IS NOT NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_source_websub_expires_at", table_name="source")
+    op.drop_column("source", "websub_expires_at")
+    op.drop_column("source", "websub_requested_at")
+    op.drop_column("source", "websub_secret")
+    op.drop_column("source", "websub_topic")
+    op.drop_column("source", "websub_hub")
@@ -0,0 +1,48 @@
+"""Per-host limits
+
+Revision ID: da62764dafab
+Revises: 6cfd922e7ae3
+Create Date: 2026-10-18 13:48:30.215774
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "da62764dafab"
+down_revision: Union[str, None] = "6cfd922e7ae3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "host",
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("tokens_updated", sa.DateTime(), nullable=False),
+        sa.Column("paused_until", sa.DateTime(), nullable=True),
+        sa.Column("rate", sa.Float(), nullable=True),
+        sa.Column("burst", sa.Integer(), nullable=True),
+        sa.Column("max_concurrency", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.create_table(
+        "host_slot",
+        sa.Column("source_id", sa.Integer(), nullable=False),
+        sa.Column("host", sa.String(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["host"], ["host.name"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["source_id"], ["source.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("source_id"),
+    )
+    op.create_index("ix_host_slot_host", "host_slot", ["host", "expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_host_slot_host", table_name="host_slot")
+    op.drop_table("host_slot")
+    op.drop_table("host")
@@ -0,0 +1,45 @@
+"""Item search
+
+Revision ID: de266800a73c
+Revises: 647204007699
+Create Date: 2026-10-18 14:51:06.730295
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = "de266800a73c"
+down_revision: Union[str, None] = "647204007699"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("item", sa.Column("search", postgresql.TSVECTOR(), nullable=True))
+    # Filled in before the index exists, which is a lot quicker than keeping
+    # the index up to date row by row. Has to match czytacz.search.document,
+    # with the default configuration - `czytacz reindex-search` redoes it with
+    # another one.
+    op.execute("""
+        UPDATE item SET search =
+            setweight(to_tsvector('simple', coalesce(item.title, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(item.summary, '')), 'B')
+            || setweight(to_tsvector(
+                'simple', jsonb_path_query_array(item_content.content, '$[*].value')
+            ), 'C')
+        FROM item_content
+        WHERE item_content.item_id = item.id
+        """)
+    op.create_index(
+        "ix_item_search", "item", ["search"], unique=False, postgresql_using="gin"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_item_search", table_name="item", postgresql_using="gin")
+    op.drop_column("item", "search")
@@ -0,0 +1,29 @@
+"""Content digests
+
+Revision ID: fec9795bd2fa
+Revises: a77ee3c2e700
+Create Date: 2026-10-18 11:41:09.530817
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "fec9795bd2fa"
+down_revision: Union[str, None] = "a77ee3c2e700"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("source", sa.Column("content_digest", sa.String(), nullable=True))
+    # Existing items get theirs the next time they're seen.
+    op.add_column("item", sa.Column("digest", sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("item", "digest")
+    op.drop_column("source", "content_digest")
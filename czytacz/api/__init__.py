@@ -1,7 +1,20 @@
 from fastapi import FastAPI
 
-from czytacz.api.routers import authentication, feeds
+from czytacz.api.routers import (
+    authentication,
+    events,
+    feeds,
+    monitoring,
+    search,
+    sync,
+    websub,
+)
 
 app = FastAPI()
 app.include_router(authentication.router)
 app.include_router(feeds.router)
+app.include_router(monitoring.router)
+app.include_router(search.router)
+app.include_router(sync.router)
+app.include_router(events.router)
+app.include_router(websub.router)
@@ -1,21 +1,162 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
 from typing import Annotated, Optional
 
+import argon2
 from argon2 import PasswordHasher
 from fastapi import Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from fastapi.security import (
+    HTTPAuthorizationCredentials,
+    HTTPBasic,
+    HTTPBasicCredentials,
+    HTTPBearer,
+)
 from psycopg.errors import UniqueViolation
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from czytacz import dependencies, models, schemas
+from czytacz.settings import Settings
 
-security = HTTPBasic()
+basic_security = HTTPBasic(auto_error=False)
+bearer_security = HTTPBearer(auto_error=False)
 
 
 class EmailAlreadyUsedError(Exception):
     pass
 
 
+class CredentialCache:
+    """Remembers recently verified credentials for a short while.
+
+    Entries are keyed by an HMAC of the credentials, so neither the password
+    nor anything that could be brute-forced offline without the secret key
+    stays in memory. The stored hash is part of the key too - once the
+    password changes, what was remembered for the old one is never found.
+    """
+
+    def __init__(self, secret_key: str, ttl: float, maxsize: int):
+        self._key = secret_key.encode()
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._entries: OrderedDict[bytes, tuple[float, schemas.User]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, username: str, password: str, hashed_password: str) -> bytes:
+        message = b"\0".join(
+            [username.encode(), password.encode(), hashed_password.encode()]
+        )
+        return hmac.digest(self._key, message, hashlib.sha256)
+
+    def get(
+        self, username: str, password: str, hashed_password: str
+    ) -> Optional[schemas.User]:
+        key = self._digest(username, password, hashed_password)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, user = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(
+        self, username: str, password: str, hashed_password: str, user: schemas.User
+    ):
+        key = self._digest(username, password, hashed_password)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_credential_cache: Optional[CredentialCache] = None
+
+
+def get_credential_cache(
+    settings: Annotated[Settings, Depends(dependencies.get_settings)],
+) -> CredentialCache:
+    global _credential_cache
+    if _credential_cache is None:
+        _credential_cache = CredentialCache(
+            settings.SECRET_KEY,
+            ttl=settings.CREDENTIAL_CACHE_TTL,
+            maxsize=settings.CREDENTIAL_CACHE_SIZE,
+        )
+    return _credential_cache
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def create_access_token(settings: Settings, user: schemas.User) -> schemas.Token:
+    """Issue a signed bearer token for the user.
+
+    The token carries everything needed to identify the user, so checking it
+    takes an HMAC and no database access.
+    """
+    expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
+    )
+    payload = _b64encode(
+        json.dumps(
+            {"sub": user.email, "uid": user.id, "exp": int(expires.timestamp())},
+            separators=(",", ":"),
+        ).encode()
+    )
+    signature = hmac.digest(
+        settings.SECRET_KEY.encode(), payload.encode(), hashlib.sha256
+    )
+    return schemas.Token(
+        access_token=f"{payload}.{_b64encode(signature)}", token_type="bearer"
+    )
+
+
+def decode_access_token(settings: Settings, token: str) -> Optional[schemas.TokenData]:
+    """Verify the token, returning its contents if it's valid and current."""
+    try:
+        payload, signature = token.split(".")
+        expected = hmac.digest(
+            settings.SECRET_KEY.encode(), payload.encode(), hashlib.sha256
+        )
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        data = json.loads(_b64decode(payload))
+        # Signed, but not by us if anything is missing or off.
+        expires = datetime.datetime.fromtimestamp(data["exp"], datetime.timezone.utc)
+        token_data = schemas.TokenData(
+            username=data["sub"], user_id=data["uid"], expires=expires
+        )
+    except (ValueError, KeyError, TypeError, OverflowError, OSError):
+        return None
+
+    if expires < datetime.datetime.now(datetime.timezone.utc):
+        return None
+    return token_data
+
+
 def create_user(
     db: Session,
     password_hasher: PasswordHasher,
@@ -39,42 +180,111 @@ def create_user(
     return schemas.User.from_orm(db_user)
 
 
-def authenticate_user(
-    db: Session, password_hasher: PasswordHasher, email: str, password: str
+def _verify_password(
+    password_hasher: PasswordHasher, hashed_password: str, password: str
+) -> bool:
+    try:
+        return password_hasher.verify(hashed_password, password)
+    except (argon2.exceptions.VerificationError, argon2.exceptions.InvalidHashError):
+        return False
+
+
+async def authenticate_user(
+    db: AsyncSession,
+    password_hasher: PasswordHasher,
+    credential_cache: CredentialCache,
+    email: str,
+    password: str,
 ) -> Optional[schemas.User]:
-    user_db = db.query(models.User).filter(models.User.email == email).one_or_none()
+    user_db = (
+        await db.execute(select(models.User).where(models.User.email == email))
+    ).scalar_one_or_none()
 
     if user_db is None or user_db.hashed_password is None:
         return None
 
-    if password_hasher.verify(user_db.hashed_password, password):
-        return schemas.User.from_orm(user_db)
+    user = credential_cache.get(email, password, user_db.hashed_password)
+    if user is not None:
+        return user
 
-    return None
+    # argon2 is slow on purpose - keep it away from the event loop.
+    if not await asyncio.to_thread(
+        _verify_password, password_hasher, user_db.hashed_password, password
+    ):
+        return None
 
+    user = schemas.User.from_orm(user_db)
+    credential_cache.put(email, password, user_db.hashed_password, user)
+    return user
 
-def get_current_user(
-    credentials: Annotated[HTTPBasicCredentials, Depends(security)],
-    db: dependencies.DatabaseSession,
+
+async def get_basic_user(
+    credentials: Annotated[Optional[HTTPBasicCredentials], Depends(basic_security)],
+    db: dependencies.AsyncDatabaseSession,
     password_hasher: dependencies.PasswordHasher,
+    credential_cache: Annotated[CredentialCache, Depends(get_credential_cache)],
 ) -> Optional[schemas.User]:
-    return authenticate_user(
-        db, password_hasher, credentials.username, credentials.password
+    if credentials is None:
+        return None
+    return await authenticate_user(
+        db,
+        password_hasher,
+        credential_cache,
+        credentials.username,
+        credentials.password,
     )
 
 
+async def get_bearer_user(
+    credentials: Annotated[
+        Optional[HTTPAuthorizationCredentials], Depends(bearer_security)
+    ],
+    settings: Annotated[Settings, Depends(dependencies.get_settings)],
+) -> Optional[schemas.User]:
+    if credentials is None:
+        return None
+    token_data = decode_access_token(settings, credentials.credentials)
+    if token_data is None or token_data.user_id is None or token_data.username is None:
+        return None
+    return schemas.User(id=token_data.user_id, email=token_data.username)
+
+
+BasicUser = Annotated[Optional[schemas.User], Depends(get_basic_user)]
+BearerUser = Annotated[Optional[schemas.User], Depends(get_bearer_user)]
+
+
+async def get_current_user(
+    bearer_user: BearerUser, basic_user: BasicUser
+) -> Optional[schemas.User]:
+    return bearer_user if bearer_user is not None else basic_user
+
+
 CurrentUser = Annotated[Optional[schemas.User], Depends(get_current_user)]
 
 
-def require_user(current_user: CurrentUser) -> schemas.User:
+def _unauthorized() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or missing authentication credentials",
+        headers={"WWW-Authenticate": "Basic"},
+    )
+
+
+async def require_user(current_user: CurrentUser) -> schemas.User:
     if current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or missing authentication credentials",
-            headers={"WWW-Authenticate": "Basic"},
-        )
+        raise _unauthorized()
 
     return current_user
 
 
 RequireUser = Annotated[schemas.User, Depends(require_user)]
+
+
+async def require_basic_user(basic_user: BasicUser) -> schemas.User:
+    if basic_user is None:
+        raise _unauthorized()
+
+    return basic_user
+
+
+RequireBasicUser = Annotated[schemas.User, Depends(require_basic_user)]
@@ -0,0 +1,137 @@
+"""Events for the clients connected to this process, as Server-Sent Events.
+
+One connection per process listens for notifications (see czytacz.events),
+and hands them to the queues of the connected clients they concern. Idle
+clients cost a queue and a suspended generator each - no database
+connection, no thread.
+"""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator
+from typing import Any, Optional
+
+import orjson
+import psycopg
+from sqlalchemy import make_url, select
+
+from czytacz import database, events, models
+from czytacz.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Events a client may fall behind by, before it's told to resync instead.
+QUEUE_SIZE = 100
+# Seconds between keep-alive comments, for proxies that drop quiet
+# connections.
+KEEPALIVE = 15.0
+RECONNECT_DELAY = 5.0
+
+RESYNC = {"type": "resync"}
+
+
+def _conninfo() -> str:
+    # psycopg itself doesn't want to hear about SQLAlchemy's drivers.
+    url = make_url(str(settings.SQLALCHEMY_DATABASE_URI)).set(drivername="postgresql")
+    return url.render_as_string(hide_password=False)
+
+
+class Broker:
+    def __init__(self):
+        self._queues: dict[int, set[asyncio.Queue]] = {}
+        self._listener: Optional[asyncio.Task] = None
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        # Started with the first client, not on import - most processes that
+        # import the API never serve any.
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        queue: asyncio.Queue = asyncio.Queue(QUEUE_SIZE)
+        self._queues.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._queues.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._queues[user_id]
+
+    def _put(self, user_id: int, event: dict[str, Any]):
+        for queue in self._queues.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow to keep up - what's queued is no use anymore.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+
+    async def _dispatch(self, event: dict[str, Any]):
+        if "user_id" in event:
+            self._put(event.pop("user_id"), event)
+            return
+
+        source_id = event.pop("source_id")
+        if not self._queues:
+            return
+        async with database.get_async_session_factory()() as db:
+            feeds = (
+                await db.execute(
+                    select(models.Feed.id, models.Feed.user_id).where(
+                        models.Feed.source_id == source_id,
+                        models.Feed.user_id.in_(list(self._queues)),
+                    )
+                )
+            ).all()
+        for feed in feeds:
+            self._put(feed.user_id, {**event, "feed_id": feed.id})
+
+    async def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(
+                    _conninfo(), autocommit=True
+                ) as connection:
+                    await connection.execute(f"LISTEN {events.CHANNEL}")
+                    if connected_before:
+                        # Whatever happened in the meantime is lost.
+                        for user_id in list(self._queues):
+                            self._put(user_id, RESYNC)
+                    connected_before = True
+                    async for notify in connection.notifies():
+                        try:
+                            await self._dispatch(orjson.loads(notify.payload))
+                        except Exception:
+                            logger.exception("Dispatching %s failed", notify.payload)
+            except (psycopg.Error, OSError) as e:
+                logger.warning("Listening for events failed: %s", e)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+
+broker = Broker()
+
+
+def _format(event: dict[str, Any]) -> bytes:
+    data = {key: value for key, value in event.items() if key != "type"}
+    return b"event: %s\ndata: %s\n\n" % (event["type"].encode(), orjson.dumps(data))
+
+
+async def stream(user_id: int) -> AsyncIterator[bytes]:
+    """Stream the user's events, until the client goes away."""
+    queue = broker.subscribe(user_id)
+    try:
+        # Clients should sync when they connect - events only tell them about
+        # changes from now on.
+        yield _format(RESYNC)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield b": keep-alive\n\n"
+                continue
+            yield _format(event)
+    finally:
+        broker.unsubscribe(user_id, queue)
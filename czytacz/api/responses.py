@@ -0,0 +1,172 @@
+"""Fast JSON responses for the feed endpoints.
+
+Going through pydantic, the rows of a feed page get validated into models,
+dumped back, and validated once more against the response model, before the
+standard encoder gets to them. The rows come straight from our own database
+and already have the right shape, so here they go to orjson as they are.
+Bigger pages are serialized and compressed (with brotli or gzip) a few items
+at a time as the response goes out, instead of as one body up front. The
+rows themselves are loaded whole before that - pages are capped at
+MAX_PAGE_SIZE items, which doesn't call for more.
+
+Clients polling for changes get ETags, and a 304 when they send one that's
+still current.
+"""
+
+import datetime
+import email.utils
+import hashlib
+import zlib
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from typing import Any, Optional, Protocol
+
+import orjson
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+import brotli
+
+MEDIA_TYPE = "application/json"
+
+# Pages with more items than this are sent in chunks.
+STREAM_THRESHOLD = 50
+ITEMS_PER_CHUNK = 25
+# Smaller bodies aren't worth compressing.
+MIN_COMPRESSED_SIZE = 1024
+
+
+class Compressor(Protocol):
+    def compress(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class _Brotli:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+def _gzip() -> Compressor:
+    return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+ENCODINGS: dict[str, Any] = {"br": _Brotli, "gzip": _gzip}
+# Ours, best first.
+PREFERENCE = ["br", "gzip"]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best encoding we have that the client accepts, if any."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in PREFERENCE:
+        if encoding in ENCODINGS and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def _compressed(chunks: Iterable[bytes], compressor: Compressor) -> Iterator[bytes]:
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _page_chunks(
+    head: Mapping[str, Any], items: Sequence[Mapping[str, Any]], tail: Mapping[str, Any]
+) -> Iterator[bytes]:
+    """Serialize an object of `head`, the items, and `tail`, in pieces."""
+    opening = orjson.dumps(head)[:-1]
+    yield opening + (b',"items":[' if len(opening) > 1 else b'"items":[')
+    for start in range(0, len(items), ITEMS_PER_CHUNK):
+        chunk = b",".join(
+            orjson.dumps(item) for item in items[start : start + ITEMS_PER_CHUNK]
+        )
+        yield chunk if start == 0 else b"," + chunk
+    closing = orjson.dumps(tail)
+    yield b"]," + closing[1:] if len(closing) > 2 else b"]}"
+
+
+def page_response(
+    head: Mapping[str, Any],
+    items: Sequence[Mapping[str, Any]],
+    tail: Mapping[str, Any],
+    accept_encoding: Optional[str] = None,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """Serialize a page of items - `head` and `tail` go around the items.
+
+    Everything has to be serializable by orjson as it is: no validation
+    happens on the way.
+    """
+    encoding = choose_encoding(accept_encoding)
+    response_headers = {"Vary": "Accept-Encoding", **(headers or {})}
+
+    if len(items) > STREAM_THRESHOLD:
+        chunks: Iterator[bytes] = _page_chunks(head, items, tail)
+        if encoding is not None:
+            chunks = _compressed(chunks, ENCODINGS[encoding]())
+            response_headers["Content-Encoding"] = encoding
+        return StreamingResponse(
+            chunks, media_type=MEDIA_TYPE, headers=response_headers
+        )
+
+    body = b"".join(_page_chunks(head, items, tail))
+    if encoding is not None and len(body) >= MIN_COMPRESSED_SIZE:
+        body = b"".join(_compressed([body], ENCODINGS[encoding]()))
+        response_headers["Content-Encoding"] = encoding
+    return Response(body, media_type=MEDIA_TYPE, headers=response_headers)
+
+
+def etag(*parts: Any) -> str:
+    """Make a weak ETag for a response that depends on `parts` and nothing else.
+
+    Weak, as the same content gets sent compressed in different ways.
+    """
+    digest = hashlib.blake2b(
+        orjson.dumps(parts, default=str),
+        digest_size=12,
+    ).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(etag: str, if_none_match: Optional[str]) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, which is what If-None-Match calls for.
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+def http_date(when: datetime.datetime) -> str:
+    """Our timestamps, which are naive local time, as an HTTP date."""
+    return email.utils.format_datetime(
+        when.astimezone(datetime.timezone.utc), usegmt=True
+    )
+
+
+def not_modified(headers: Mapping[str, str]) -> Response:
+    return Response(status_code=304, headers={"Vary": "Accept-Encoding", **headers})
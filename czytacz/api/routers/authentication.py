@@ -1,7 +1,10 @@
-from fastapi import APIRouter, HTTPException, status
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException, status
 
 from czytacz import dependencies, schemas
 from czytacz.api import authentication
+from czytacz.settings import Settings
 
 router = APIRouter()
 
@@ -21,3 +24,16 @@ def create_user(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User email already registered",
         )
+
+
+@router.post("/token", response_model=schemas.Token)
+def create_token(
+    user: authentication.RequireBasicUser,
+    settings: Annotated[Settings, Depends(dependencies.get_settings)],
+):
+    """Exchange Basic credentials for a bearer token.
+
+    Bearer tokens are checked without touching the password hash, so clients
+    making many requests should prefer them.
+    """
+    return authentication.create_access_token(settings, user)
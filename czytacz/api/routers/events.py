@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from czytacz import dependencies
+from czytacz.api import authentication, events
+
+router = APIRouter()
+
+
+@router.get("/events", response_class=StreamingResponse)
+async def stream_events(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+):
+    """Stream Server-Sent Events about the user's feeds.
+
+    `items` when a feed gets new or updated items, `read` when read state
+    changes, and `resync` when the client should catch up with /sync - on
+    connecting, and whenever events may have been missed.
+    """
+    # The session was only needed to authenticate, and the stream can last
+    # for hours - its connection goes back to the pool right away.
+    await db.close()
+    return StreamingResponse(
+        events.stream(user.id),
+        media_type="text/event-stream",
+        # Buffering proxies would hold events back.
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,71 +1,203 @@
-from typing import Optional
-from fastapi import APIRouter, HTTPException, status
+from typing import Annotated, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, status
 
 from czytacz import dependencies, feeds, schemas
-from czytacz.api import authentication
+from czytacz.api import authentication, responses
+from czytacz.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError
 
 router = APIRouter()
 
 
 @router.post("/feeds/", response_model=schemas.Feed)
-def subscribe_feed(
-    db: dependencies.DatabaseSession,
+async def subscribe_feed(
+    db: dependencies.AsyncDatabaseSession,
     user: authentication.RequireUser,
     feed: schemas.FeedCreate,
 ):
-    return feeds.create_user_feed(db=db, feed=feed, user_id=user.id)
+    return await feeds.create_user_feed(db=db, feed=feed, user_id=user.id)
 
 
-@router.get("/feeds/", response_model=list[schemas.FeedForList])
-def list_feeds(
-    db: dependencies.DatabaseSession,
+PageSize = Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)]
+
+
+# These skip pydantic on the way out, see czytacz.api.responses. The
+# response models are there for the docs.
+
+# Clients have to revalidate, but they can do it with If-None-Match.
+CONDITIONAL_HEADERS = {"Cache-Control": "private, no-cache"}
+
+
+@router.get("/feeds/", response_model=schemas.Page[schemas.FeedForList])
+async def list_feeds(
+    db: dependencies.AsyncDatabaseSession,
     user: authentication.RequireUser,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
-    items = feeds.get_user_feeds(db, user_id=user.id, skip=skip, limit=limit)
-    return items
+    try:
+        rows, next_cursor = await feeds.get_user_feed_rows(
+            db, user_id=user.id, cursor=cursor, limit=limit
+        )
+    except InvalidCursorError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    # The page is just the feeds, no items - the version is the rows
+    # themselves, and a match saves serializing and sending them.
+    headers = {
+        **CONDITIONAL_HEADERS,
+        "ETag": responses.etag([tuple(row) for row in rows], next_cursor),
+    }
+    if responses.etag_matches(headers["ETag"], if_none_match):
+        return responses.not_modified(headers)
+    return responses.page_response(
+        {},
+        [row._asdict() for row in rows],
+        {"next_cursor": next_cursor},
+        accept_encoding=accept_encoding,
+        headers=headers,
+    )
 
 
 @router.get("/feeds/{feed_id}", response_model=schemas.Feed)
-def show_feed(
-    db: dependencies.DatabaseSession,
+async def show_feed(
+    db: dependencies.AsyncDatabaseSession,
     user: authentication.RequireUser,
     feed_id: int,
     read: Optional[bool] = None,
-    skip: int = 0,
-    limit: int = 100,
+    cursor: Optional[str] = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
+    # Checked before loading any items: the feed's version changes with
+    # anything that changes its entries, and the source with every fetch.
+    try:
+        version = await feeds.get_feed_version(db, user_id=user.id, feed_id=feed_id)
+    except feeds.NotFoundError:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    headers = {
+        **CONDITIONAL_HEADERS,
+        "ETag": responses.etag(feed_id, tuple(version), read, cursor, limit),
+    }
+    modified = max(
+        (when for when in (version.changed_at, version.last_fetch) if when),
+        default=None,
+    )
+    if modified is not None:
+        headers["Last-Modified"] = responses.http_date(modified)
+    if responses.etag_matches(headers["ETag"], if_none_match):
+        return responses.not_modified(headers)
+
     try:
-        feed = feeds.get_feed(
-            db, feed_id=feed_id, user_id=user.id, read=read, skip=skip, limit=limit
+        feed, items, next_cursor = await feeds.get_feed_rows(
+            db, feed_id=feed_id, user_id=user.id, read=read, cursor=cursor, limit=limit
         )
     except feeds.NotFoundError:
         raise HTTPException(status.HTTP_404_NOT_FOUND)
+    except InvalidCursorError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    return responses.page_response(
+        feed._asdict(),
+        [item._asdict() for item in items],
+        {"next_cursor": next_cursor},
+        accept_encoding=accept_encoding,
+        headers=headers,
+    )
+
+
+@router.get("/items", response_model=schemas.Page[schemas.ItemInFeed])
+async def list_items(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+    read: Optional[bool] = None,
+    feed_id: Annotated[Optional[list[int]], Query()] = None,
+    cursor: Optional[str] = None,
+    limit: PageSize = DEFAULT_PAGE_SIZE,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+):
+    """Items from all of the user's feeds, or from those given as `feed_id`."""
+    try:
+        items, next_cursor = await feeds.get_user_item_rows(
+            db, user.id, read=read, feed_ids=feed_id, cursor=cursor, limit=limit
+        )
+    except InvalidCursorError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    return responses.page_response(
+        {},
+        [item._asdict() for item in items],
+        {"next_cursor": next_cursor},
+        accept_encoding=accept_encoding,
+    )
+
 
-    return feed
+@router.post("/items/mark_read")
+async def mark_items(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+    items: schemas.ItemsForUpdate,
+) -> schemas.UpdatedCount:
+    """Mark the given items as read, or unread with `read` false."""
+    updated = await feeds.mark_items(db, user.id, items.item_ids, items.read)
+    return schemas.UpdatedCount(updated=updated)
+
+
+@router.post("/feeds/mark_read")
+async def mark_all_read(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+    mark: schemas.MarkRead,
+) -> schemas.UpdatedCount:
+    """Mark items of all feeds as read - `cursor` is one from GET /items."""
+    try:
+        updated = await feeds.mark_all_read(db, user.id, mark.until, mark.cursor)
+    except InvalidCursorError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return schemas.UpdatedCount(updated=updated)
+
+
+@router.post("/feeds/{feed_id}/mark_read")
+async def mark_feed_read(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+    feed_id: int,
+    mark: schemas.MarkRead,
+) -> schemas.UpdatedCount:
+    """Mark items of the feed as read - `cursor` is one from GET /feeds/{id}."""
+    try:
+        updated = await feeds.mark_feed_read(
+            db, user.id, feed_id, mark.until, mark.cursor
+        )
+    except feeds.NotFoundError:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    except InvalidCursorError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return schemas.UpdatedCount(updated=updated)
 
 
 @router.delete("/feeds/{feed_id}")
-def delete_feed(
-    db: dependencies.DatabaseSession,
+async def delete_feed(
+    db: dependencies.AsyncDatabaseSession,
     user: authentication.RequireUser,
     feed_id: int,
 ):
     try:
-        feeds.delete_user_feed(db, user_id=user.id, feed_id=feed_id)
+        await feeds.delete_user_feed(db, user_id=user.id, feed_id=feed_id)
     except feeds.NotFoundError:
         raise HTTPException(status.HTTP_404_NOT_FOUND)
 
 
 @router.post("/feeds/{feed_id}/force_fetch")
-def force_fetch(
-    db: dependencies.DatabaseSession,
+async def force_fetch(
+    db: dependencies.AsyncDatabaseSession,
     user: authentication.RequireUser,
     feed_id: int,
 ):
     try:
-        feeds.force_fetch(db, user_id=user.id, feed_id=feed_id)
+        await feeds.force_fetch(db, user_id=user.id, feed_id=feed_id)
     except feeds.NotFoundError:
         raise HTTPException(status.HTTP_404_NOT_FOUND)
     except feeds.AlreadyFetchingError:
@@ -74,16 +206,29 @@ def force_fetch(
         )
 
 
+@router.get("/feeds/{feed_id}/{item_id}")
+async def show_item(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+    feed_id: int,
+    item_id: int,
+) -> schemas.ItemWithContent:
+    try:
+        return await feeds.get_item(db, user.id, feed_id, item_id)
+    except feeds.NotFoundError:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+
+
 @router.put("/feeds/{feed_id}/{item_id}")
-def update_item(
-    db: dependencies.DatabaseSession,
+async def update_item(
+    db: dependencies.AsyncDatabaseSession,
     user: authentication.RequireUser,
     feed_id: int,
     item_id: int,
     item: schemas.ItemForUpdate,
 ) -> schemas.Item:
     try:
-        updated_item = feeds.update_item(db, user.id, feed_id, item_id, item)
+        updated_item = await feeds.update_item(db, user.id, feed_id, item_id, item)
     except feeds.NotFoundError:
         raise HTTPException(status.HTTP_404_NOT_FOUND)
 
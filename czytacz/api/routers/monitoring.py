@@ -0,0 +1,46 @@
+import hmac
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+
+from czytacz import database, dependencies
+from czytacz.api.authentication import bearer_security
+from czytacz.settings import Settings
+
+router = APIRouter()
+
+
+def require_monitoring_token(
+    credentials: Annotated[
+        Optional[HTTPAuthorizationCredentials], Depends(bearer_security)
+    ],
+    settings: Annotated[Settings, Depends(dependencies.get_settings)],
+):
+    # Not for users - any of them could sign up. Without a token configured
+    # there's nothing to see here at all.
+    if settings.MONITORING_TOKEN is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    if credentials is None or not hmac.compare_digest(
+        credentials.credentials.encode(), settings.MONITORING_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing monitoring token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@router.get(
+    "/monitoring/pool",
+    dependencies=[Depends(require_monitoring_token)],
+    include_in_schema=False,
+)
+def pool_status():
+    """Show the connection pools of this API process, and only of this one.
+
+    With several API processes, each request may land on a different one -
+    the pid in the response tells which. Workers log theirs, see
+    czytacz.tasks.
+    """
+    return database.pool_status()
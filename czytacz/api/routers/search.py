@@ -0,0 +1,32 @@
+from typing import Annotated, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, status
+
+from czytacz import dependencies, schemas, search
+from czytacz.api import authentication, responses
+from czytacz.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError
+
+router = APIRouter()
+
+
+@router.get("/search", response_model=schemas.Page[schemas.SearchResult])
+async def search_items(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+    q: Annotated[str, Query(min_length=1, max_length=256)],
+    feed_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+):
+    try:
+        rows, next_cursor = await search.search_rows(
+            db, user.id, q, feed_id=feed_id, cursor=cursor, limit=limit
+        )
+    except InvalidCursorError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return responses.page_response(
+        {},
+        [row._asdict() for row in rows],
+        {"next_cursor": next_cursor},
+        accept_encoding=accept_encoding,
+    )
@@ -0,0 +1,30 @@
+from typing import Annotated, Optional
+from fastapi import APIRouter, Header, Query
+
+from czytacz import dependencies, schemas, sync
+from czytacz.api import authentication, responses
+from czytacz.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+
+router = APIRouter()
+
+
+@router.get("/sync", response_model=schemas.Changes)
+async def get_changes(
+    db: dependencies.AsyncDatabaseSession,
+    user: authentication.RequireUser,
+    since: Annotated[int, Query(ge=0)] = 0,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    accept_encoding: Annotated[Optional[str], Header()] = None,
+):
+    """Items whose content or read state changed after `since`, with content.
+
+    Start from 0 for everything. Removed feeds don't show up here, the feed
+    list tells which ones are left.
+    """
+    changes, next_since, more = await sync.get_changes(db, user.id, since, limit)
+    return responses.page_response(
+        {},
+        [change._asdict() for change in changes],
+        {"since": next_since, "more": more},
+        accept_encoding=accept_encoding,
+    )
@@ -0,0 +1,74 @@
+import asyncio
+import base64
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse
+
+from czytacz import dependencies, websub
+from czytacz.settings import settings
+
+router = APIRouter(prefix="/websub", include_in_schema=False)
+
+
+@router.get("/{source_id}", response_class=PlainTextResponse)
+async def verify_intent(
+    db: dependencies.AsyncDatabaseSession,
+    source_id: int,
+    mode: Annotated[str, Query(alias="hub.mode")],
+    topic: Annotated[str, Query(alias="hub.topic")],
+    challenge: Annotated[Optional[str], Query(alias="hub.challenge")] = None,
+    lease_seconds: Annotated[Optional[int], Query(alias="hub.lease_seconds")] = None,
+):
+    """Confirm that we asked the hub for what it's about to do."""
+    confirmed = await websub.verify(db, source_id, mode, topic, lease_seconds)
+    if mode == "denied":
+        # Nothing to confirm, just a heads-up.
+        return PlainTextResponse("")
+    if not confirmed or challenge is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND)
+    return PlainTextResponse(challenge)
+
+
+@router.post("/{source_id}", status_code=status.HTTP_202_ACCEPTED)
+async def receive_content(
+    db: dependencies.AsyncDatabaseSession,
+    request: Request,
+    source_id: int,
+    content_type: Annotated[str, Header()] = "application/octet-stream",
+    x_hub_signature: Annotated[Optional[str], Header()] = None,
+):
+    """Take in new content from the hub, or rather have a worker do it."""
+    from czytacz import tasks
+
+    # Read as it comes, so that nobody gets to make us hold more.
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > settings.PARSE_MAX_BYTES:
+            raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        chunks.append(chunk)
+    body = b"".join(chunks)
+    source = await websub.get_push_source(db, source_id)
+    if source is None:
+        # The spec's way of telling the hub to drop the subscription.
+        raise HTTPException(status.HTTP_410_GONE)
+    if source.websub_secret is None:
+        # The hub has no secret to sign with, so this may come from anyone -
+        # it only gets the source fetched early.
+        if source.active:
+            await websub.fetch_soon(db, source_id)
+        return Response(status_code=status.HTTP_202_ACCEPTED)
+    await db.close()
+    # Unsigned or badly signed content is dropped, but acknowledged all the
+    # same - as the spec says, so that forgers can't tell the difference.
+    if websub.signature_matches(source.websub_secret, body, x_hub_signature):
+        # Publishing to the broker blocks.
+        await asyncio.to_thread(
+            tasks.ingest_push.delay,
+            source_id,
+            base64.b64encode(body).decode(),
+            content_type,
+        )
+    return Response(status_code=status.HTTP_202_ACCEPTED)
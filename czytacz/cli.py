@@ -1,3 +1,5 @@
+from typing import Optional
+
 import typer
 
 from czytacz.fetcher import fetch_feed_by_id
@@ -12,6 +14,14 @@ def api(reload: bool = True, port: int = 8000):
     uvicorn.run("czytacz.api:app", reload=reload, port=port, host="0.0.0.0")
 
 
+@app.command()
+def websub_hub(port: int = 8001):
+    """Run a stand-in WebSub hub, see czytacz.hub."""
+    import uvicorn
+
+    uvicorn.run("czytacz.hub:app", port=port, host="0.0.0.0")
+
+
 @app.command()
 def fetch(feed_id: int, force_fetch: bool = False):
     from czytacz.dependencies import get_db_cli
@@ -20,5 +30,103 @@ def fetch(feed_id: int, force_fetch: bool = False):
         fetch_feed_by_id(db, feed_id, force_fetch=force_fetch)
 
 
+@app.command()
+def check_plans(
+    seed: bool = True,
+    users: int = 200,
+    sources: int = 1000,
+    items: int = 200,
+    missing_indexes: bool = False,
+):
+    """Fail if any checked query plans a sequential scan.
+
+    Seeded data is rolled back afterwards, so this is safe to point at any
+    database with an up-to-date schema. With --missing-indexes, only scans
+    that no index could replace count.
+    """
+    from czytacz import plans
+    from czytacz.dependencies import get_db_cli
+
+    with get_db_cli() as db:
+        try:
+            if seed:
+                plans.seed(db, users=users, sources=sources, items=items)
+            results = plans.check(db, missing_indexes=missing_indexes)
+        finally:
+            db.rollback()
+
+    failed = False
+    for name, scans in results.items():
+        if scans:
+            failed = True
+            typer.echo(f"FAIL {name}: sequential scan on {', '.join(scans)}")
+        else:
+            typer.echo(f"ok   {name}")
+    if failed:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def reindex_search(batch_size: int = 10_000):
+    """Rebuild the search vectors of all items, after changing SEARCH_CONFIG."""
+    from czytacz import search
+    from czytacz.dependencies import get_db_cli
+
+    with get_db_cli() as db:
+        for done in search.reindex(db, batch_size):
+            typer.echo(f"{done} items")
+
+
+@app.command()
+def check_counters(fix: bool = False):
+    """Report feeds whose stored item or unread counts are off.
+
+    With --fix, recount them too.
+    """
+    from czytacz import counters
+    from czytacz.dependencies import get_db_cli
+
+    with get_db_cli() as db:
+        wrong = counters.check(db)
+        for feed in wrong:
+            typer.echo(
+                f"feed {feed.id}: {feed.item_count} items, {feed.unread_count} unread"
+                f" - actually {feed.actual_items} and {feed.actual_unread}"
+            )
+        if fix:
+            typer.echo(f"Recounted {counters.rebuild(db)} feeds")
+        elif wrong:
+            raise typer.Exit(code=1)
+
+
+@app.command()
+def bench_urls(count: int = 100_000, hosts: int = 1_000):
+    """Measure PublicUrl validations per second.
+
+    Cold is one URL per host with an empty verdict cache, warm is `count`
+    URLs spread over the same hosts, trusted skips the check altogether.
+    """
+    import time
+
+    from pydantic import TypeAdapter
+
+    from czytacz import schemas
+
+    adapter = TypeAdapter(schemas.PublicUrl)
+    urls = [f"https://blog-{i % hosts}.example.com/feed/{i}.xml" for i in range(count)]
+
+    def run(label: str, urls: list[str], context: Optional[dict] = None):
+        start = time.perf_counter()
+        for url in urls:
+            adapter.validate_python(url, context=context)
+        elapsed = time.perf_counter() - start
+        typer.echo(f"{label:<8} {len(urls) / elapsed:>12,.0f} validations/s")
+
+    schemas._host_problem.cache_clear()
+    run("cold", urls[:hosts])
+    run("warm", urls)
+    run("trusted", urls, schemas.TRUSTED)
+
+
 if __name__ == "__main__":
     app()
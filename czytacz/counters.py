@@ -0,0 +1,71 @@
+"""Checks of the item and unread counts stored with every feed.
+
+The counts are kept up to date by statement-level triggers on entry (see
+the feed_counters and feed_versions migrations), so there's nothing to do
+about them in Python - as long as nothing changes entry with the triggers
+disabled. Should that ever happen, `check` finds the feeds that are off,
+and `rebuild` recounts them.
+"""
+
+from collections.abc import Sequence
+
+from sqlalchemy import Row, Select, func, select, text, update
+from sqlalchemy.orm import Session
+
+from czytacz import models
+
+
+def _actual_counts():
+    return (
+        select(
+            models.Entry.feed_id,
+            func.count().label("actual_items"),
+            func.count().filter(~models.Entry.read).label("actual_unread"),
+        )
+        .group_by(models.Entry.feed_id)
+        .subquery()
+    )
+
+
+def select_wrong_counts() -> Select:
+    """Select the feeds whose counts are off, with the stored and the actual ones."""
+    counts = _actual_counts()
+    items = func.coalesce(counts.c.actual_items, 0)
+    unread = func.coalesce(counts.c.actual_unread, 0)
+    return (
+        select(
+            models.Feed.id,
+            models.Feed.item_count,
+            models.Feed.unread_count,
+            items.label("actual_items"),
+            unread.label("actual_unread"),
+        )
+        .outerjoin(counts, counts.c.feed_id == models.Feed.id)
+        .where((models.Feed.item_count != items) | (models.Feed.unread_count != unread))
+        .order_by(models.Feed.id)
+    )
+
+
+def check(db: Session) -> Sequence[Row]:
+    """Find the feeds with wrong counts.
+
+    Writes in progress can make a feed look wrong for a moment, so it's best
+    to check twice before worrying.
+    """
+    return db.execute(select_wrong_counts()).all()
+
+
+def rebuild(db: Session) -> int:
+    """Recount the feeds that are off, returning how many there were."""
+    # Nothing may change entries while they're being counted. SHARE lets
+    # reads through, and waits for the writes in progress.
+    db.execute(text("LOCK TABLE entry IN SHARE MODE"))
+    wrong = select_wrong_counts().subquery()
+    fixed = db.execute(
+        update(models.Feed)
+        .where(models.Feed.id == wrong.c.id)
+        .values(item_count=wrong.c.actual_items, unread_count=wrong.c.actual_unread)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return fixed
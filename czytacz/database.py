@@ -1,19 +1,223 @@
-from collections.abc import Generator
+import os
+import threading
+import time
+from collections.abc import AsyncGenerator, Generator
+from typing import Any, Optional
 
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
 
 from czytacz.settings import settings
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+class InstrumentedPoolMixin:
+    """Keeps track of how long callers wait for a connection.
+
+    The pool itself knows how many connections are checked out and how far
+    into the overflow it is, but not how long checkouts had to wait - and
+    that's the number that tells us the pool is too small.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def recreate(self):
+        # Keep the statistics across engine.dispose(), they describe the
+        # process, not a particular set of connections.
+        pool = super().recreate()
+        pool.checkouts = self.checkouts
+        pool.wait_total = self.wait_total
+        pool.wait_max = self.wait_max
+        return pool
+
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+_lock = threading.Lock()
+_engine: Optional[Engine] = None
+_session_factory: Optional[sessionmaker] = None
+_pid: Optional[int] = None
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+_async_pid: Optional[int] = None
+
+
+def _pool_options() -> dict[str, Any]:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+
+
+def _create_engine() -> Engine:
+    return create_engine(
+        str(settings.SQLALCHEMY_DATABASE_URI),
+        poolclass=InstrumentedQueuePool,
+        **_pool_options(),
+    )
+
+
+def get_engine() -> Engine:
+    """Return the engine of this process, creating it on first use.
+
+    The engine is created lazily so that importing the models doesn't open
+    anything, and it's tied to the process that created it - a forked child
+    (Celery prefork, uvicorn workers) gets its own engine instead of sharing
+    sockets with its parent.
+    """
+    global _engine, _session_factory, _pid
+
+    pid = os.getpid()
+    if _engine is not None and _pid == pid:
+        return _engine
+
+    with _lock:
+        if _engine is None or _pid != pid:
+            if _engine is not None:
+                # Connections belong to the parent, don't close them from here.
+                _engine.dispose(close=False)
+            _engine = _create_engine()
+            _session_factory = sessionmaker(
+                autocommit=False, autoflush=False, bind=_engine
+            )
+            _pid = pid
+    return _engine
+
+
+def get_session_factory() -> sessionmaker:
+    get_engine()
+    assert _session_factory is not None
+    return _session_factory
+
+
+def get_async_engine() -> AsyncEngine:
+    """Return the async engine of this process, creating it on first use.
+
+    psycopg 3 does async natively, so this uses the same URL as the sync
+    engine. Only the API needs it - workers and the CLI stay synchronous.
+    """
+    global _async_engine, _async_session_factory, _async_pid
+
+    pid = os.getpid()
+    if _async_engine is not None and _async_pid == pid:
+        return _async_engine
+
+    with _lock:
+        if _async_engine is None or _async_pid != pid:
+            if _async_engine is not None:
+                _async_engine.sync_engine.dispose(close=False)
+            _async_engine = create_async_engine(
+                str(settings.SQLALCHEMY_DATABASE_URI),
+                poolclass=InstrumentedAsyncQueuePool,
+                **_pool_options(),
+            )
+            _async_session_factory = async_sessionmaker(
+                _async_engine, autoflush=False, expire_on_commit=False
+            )
+            _async_pid = pid
+    return _async_engine
+
+
+def get_async_session_factory() -> async_sessionmaker[AsyncSession]:
+    get_async_engine()
+    assert _async_session_factory is not None
+    return _async_session_factory
+
+
+def dispose_engine() -> None:
+    """Drop the connections inherited from a parent process.
+
+    Meant to be called right after a fork; the engine itself is reused, only
+    its pool is replaced.
+    """
+    global _pid, _async_pid
+
+    with _lock:
+        if _engine is not None:
+            _engine.dispose(close=False)
+            _pid = os.getpid()
+        if _async_engine is not None:
+            _async_engine.sync_engine.dispose(close=False)
+            _async_pid = os.getpid()
+
+
+def _describe_pool(pool: Pool) -> dict[str, Any]:
+    assert isinstance(pool, InstrumentedQueuePool | InstrumentedAsyncQueuePool)
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checkouts": pool.checkouts,
+        "wait_total": pool.wait_total,
+        "wait_max": pool.wait_max,
+        "wait_avg": pool.wait_total / pool.checkouts if pool.checkouts else 0.0,
+    }
+
+
+def pool_status() -> dict[str, Any]:
+    """Describe the state of the connection pools, for monitoring.
+
+    Only engines that were already created in this process are reported.
+    """
+    pid = os.getpid()
+    return {
+        "pid": pid,
+        "sync": (
+            _describe_pool(_engine.pool)
+            if _engine is not None and _pid == pid
+            else None
+        ),
+        "async": (
+            _describe_pool(_async_engine.pool)
+            if _async_engine is not None and _async_pid == pid
+            else None
+        ),
+    }
+
+
 def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
+    db = get_session_factory()()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with get_async_session_factory()() as db:
+        yield db
@@ -1,27 +1,27 @@
 from contextlib import contextmanager
 from functools import lru_cache
-from typing import Annotated, Callable, Generator
+from typing import AsyncGenerator, Annotated, Callable, Generator
 
 import argon2
 from fastapi import Depends
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.orm import Session, sessionmaker
 
+from czytacz import database
 from czytacz.settings import Settings
 
 
 @lru_cache
 def get_settings() -> Settings:
-    return Settings() # type: ignore
+    return Settings()  # type: ignore
 
 
-def get_session_factory(settings: Annotated[Settings, Depends(get_settings)]):
-    engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
-    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def get_session_factory() -> sessionmaker:
+    return database.get_session_factory()
 
 
 def get_db(
-    session_factory: Annotated[Callable, Depends(get_session_factory)]
+    session_factory: Annotated[Callable, Depends(get_session_factory)],
 ) -> Generator[Session, None, None]:
     db = session_factory()
     try:
@@ -33,6 +33,22 @@ def get_db(
 DatabaseSession = Annotated[Session, Depends(get_db)]
 
 
+def get_async_session_factory() -> async_sessionmaker[AsyncSession]:
+    return database.get_async_session_factory()
+
+
+async def get_async_db(
+    session_factory: Annotated[
+        async_sessionmaker[AsyncSession], Depends(get_async_session_factory)
+    ],
+) -> AsyncGenerator[AsyncSession, None]:
+    async with session_factory() as db:
+        yield db
+
+
+AsyncDatabaseSession = Annotated[AsyncSession, Depends(get_async_db)]
+
+
 @contextmanager
 def get_db_cli() -> Generator[Session, None, None]:
     """Acquire a session in a manner that's useful without FastAPI's DI.
@@ -44,7 +60,7 @@ def get_db_cli() -> Generator[Session, None, None]:
     It's a bit annoying, and I'm sure I can remove the duplication -
     but for now I'm focusing on other issues.
     """
-    session_factory = get_session_factory(get_settings())
+    session_factory = get_session_factory()
     db = session_factory()
     try:
         yield db
@@ -0,0 +1,38 @@
+"""Events for connected clients, sent with NOTIFY.
+
+Writers notify as part of their transactions, so that events go out when
+the changes are committed, and only if they are. Every API process listens,
+and passes events on to the clients connected to it - see
+czytacz.api.events. Events only say that something changed; clients catch up
+with /sync.
+"""
+
+from typing import Optional
+
+import orjson
+from sqlalchemy import Executable, func, select
+
+CHANNEL = "czytacz_events"
+
+
+def _notify(event: dict) -> Executable:
+    # Payloads are limited to 8000 bytes, these stay far below.
+    return select(func.pg_notify(CHANNEL, orjson.dumps(event).decode()))
+
+
+def items_changed(source_id: int, inserted: int, updated: int) -> Executable:
+    """For every subscriber of the source - the listeners look them up."""
+    return _notify(
+        {
+            "type": "items",
+            "source_id": source_id,
+            "inserted": inserted,
+            "updated": updated,
+        }
+    )
+
+
+def read_changed(user_id: int, feed_id: Optional[int], count: int) -> Executable:
+    return _notify(
+        {"type": "read", "user_id": user_id, "feed_id": feed_id, "count": count}
+    )
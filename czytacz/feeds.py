@@ -1,9 +1,26 @@
+import asyncio
+import datetime
+from collections.abc import Collection, Sequence
 from typing import Optional
 
-from sqlalchemy import delete, select
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    ColumnElement,
+    Row,
+    Select,
+    delete,
+    func,
+    insert,
+    literal,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from czytacz import FeedStatus, models, schemas
+from czytacz import FeedStatus, events, models, schemas, sync
+from czytacz.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from czytacz.settings import settings
 
 
 class NotFoundError(Exception):
@@ -14,116 +31,466 @@ class AlreadyFetchingError(Exception):
     pass
 
 
-def get_user_feeds(
-    db: Session, user_id: int, skip: int = 0, limit: int = 100
-) -> list[schemas.FeedForList]:
-    feeds = db.execute(
-        select(models.Feed)
+FEED_COLUMNS = (
+    models.Feed.id,
+    models.Feed.name,
+    func.coalesce(models.Source.actual_url, models.Source.url).label("source"),
+    models.Source.status,
+    models.Source.last_fetch,
+    models.Feed.item_count,
+    models.Feed.unread_count,
+)
+
+ITEM_COLUMNS = (
+    models.Item.id,
+    models.Item.item_id,
+    models.Item.title,
+    models.Item.link,
+    models.Item.author,
+    models.Item.summary,
+    models.Item.published,
+    # Same as the item's, but this one is what listings are sorted by.
+    models.Entry.updated,
+    models.Entry.read,
+)
+
+
+def select_user_feeds(user_id: int, after_id: Optional[int], limit: int) -> Select:
+    query = (
+        select(*FEED_COLUMNS)
+        .select_from(models.Feed)
+        .join(models.Feed.source)
         .where(models.Feed.user_id == user_id)
-        .offset(skip)
-        .limit(limit)
-    ).scalars()
-    return [schemas.FeedForList.from_orm(feed) for feed in feeds]
+    )
+    if after_id is not None:
+        query = query.where(models.Feed.id > after_id)
+    return query.order_by(models.Feed.id).limit(limit)
+
+
+def select_feed(user_id: int, feed_id: int) -> Select:
+    # A single feed shows its owner, listings don't.
+    return (
+        select(*FEED_COLUMNS, models.Feed.user_id)
+        .select_from(models.Feed)
+        .join(models.Feed.source)
+        .where(models.Feed.user_id == user_id, models.Feed.id == feed_id)
+    )
+
+
+def select_feed_version(user_id: int, feed_id: int) -> Select:
+    """Select what a feed's page depends on, besides the request."""
+    return (
+        select(
+            models.Feed.version,
+            models.Feed.changed_at,
+            models.Source.status,
+            models.Source.last_fetch,
+        )
+        .select_from(models.Feed)
+        .join(models.Feed.source)
+        .where(models.Feed.user_id == user_id, models.Feed.id == feed_id)
+    )
+
+
+def select_feed_items(
+    feed_id: int,
+    read: Optional[bool],
+    after: Optional[tuple[datetime.datetime, int]],
+    limit: int,
+) -> Select:
+    query = (
+        select(*ITEM_COLUMNS)
+        .select_from(models.Entry)
+        .join(models.Entry.item)
+        .where(models.Entry.feed_id == feed_id)
+    )
+    if read is not None:
+        query = query.where(models.Entry.read == read)
+    if after is not None:
+        query = query.where(tuple_(models.Entry.updated, models.Entry.item_id) < after)
+    return query.order_by(
+        models.Entry.updated.desc(), models.Entry.item_id.desc()
+    ).limit(limit)
+
+
+def select_user_items(
+    user_id: int,
+    read: Optional[bool],
+    feed_ids: Optional[Collection[int]],
+    after: Optional[tuple[datetime.datetime, int, int]],
+    limit: int,
+) -> Select:
+    query = (
+        select(*ITEM_COLUMNS, models.Entry.feed_id)
+        .select_from(models.Entry)
+        .join(models.Entry.item)
+        .where(models.Entry.user_id == user_id)
+    )
+    if read is not None:
+        query = query.where(models.Entry.read == read)
+    if feed_ids:
+        query = query.where(models.Entry.feed_id.in_(feed_ids))
+    if after is not None:
+        query = query.where(
+            tuple_(models.Entry.updated, models.Entry.item_id, models.Entry.feed_id)
+            < after
+        )
+    return query.order_by(
+        models.Entry.updated.desc(),
+        models.Entry.item_id.desc(),
+        models.Entry.feed_id.desc(),
+    ).limit(limit)
 
 
-def get_feed(
-    db: Session,
+async def get_user_feed_rows(
+    db: AsyncSession,
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> tuple[Sequence[Row], Optional[str]]:
+    """Get a page of the user's feeds as rows of FEED_COLUMNS, and the cursor."""
+    after_id = decode_cursor(cursor, (int,))[0] if cursor is not None else None
+
+    # One extra row tells us whether there's another page.
+    feeds = (await db.execute(select_user_feeds(user_id, after_id, limit + 1))).all()
+    return feeds[:limit], (
+        encode_cursor(feeds[limit - 1].id) if len(feeds) > limit else None
+    )
+
+
+async def get_user_feeds(
+    db: AsyncSession,
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> schemas.Page[schemas.FeedForList]:
+    feeds, next_cursor = await get_user_feed_rows(db, user_id, cursor, limit)
+    return schemas.Page(
+        items=[
+            schemas.FeedForList.model_validate(
+                feed, from_attributes=True, context=schemas.TRUSTED
+            )
+            for feed in feeds
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+async def get_feed_version(db: AsyncSession, user_id: int, feed_id: int) -> Row:
+    version = (await db.execute(select_feed_version(user_id, feed_id))).one_or_none()
+    if version is None:
+        raise NotFoundError()
+    return version
+
+
+async def get_feed_rows(
+    db: AsyncSession,
     user_id: int,
     feed_id: int,
     read: Optional[bool] = None,
-    skip: int = 0,
-    limit: int = 100,
-) -> schemas.Feed:
-    feed = db.execute(
-        select(models.Feed).where(
-            models.Feed.user_id == user_id, models.Feed.id == feed_id
-        )
-    ).scalar_one_or_none()
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> tuple[Row, Sequence[Row], Optional[str]]:
+    """Get the feed, a page of its items as rows of ITEM_COLUMNS, and the cursor."""
+    feed = (await db.execute(select_feed(user_id, feed_id))).one_or_none()
     if feed is None:
         raise NotFoundError()
 
-    items_query = select(models.Item).where(models.Item.feed_id == feed.id)
-
-    if read is not None:
-        items_query = items_query.where(models.Item.read == read)
-    items = db.execute(items_query.order_by(models.Item.updated.desc())).scalars()
-
-    return schemas.Feed(
-        id=feed.id,
-        user_id=feed.user_id,
-        name=feed.name,
-        source=schemas.PublicUrl(
-            feed.actual_source if feed.actual_source is not None else feed.source
+    after = (
+        decode_cursor(cursor, (datetime.datetime, int)) if cursor is not None else None
+    )
+    items = (await db.execute(select_feed_items(feed.id, read, after, limit + 1))).all()
+    return (
+        feed,
+        items[:limit],
+        (
+            encode_cursor(items[limit - 1].updated, items[limit - 1].id)
+            if len(items) > limit
+            else None
         ),
-        status=feed.status,
-        last_fetch=feed.last_fetch,
-        items=[schemas.Item.from_orm(item) for item in items],
     )
 
 
-def update_item(
-    db: Session,
+async def get_feed(
+    db: AsyncSession,
+    user_id: int,
+    feed_id: int,
+    read: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> schemas.Feed:
+    feed, items, next_cursor = await get_feed_rows(
+        db, user_id, feed_id, read, cursor, limit
+    )
+    return schemas.Feed.model_validate(
+        {
+            **feed._asdict(),
+            "items": [schemas.Item.from_orm(item) for item in items],
+            "next_cursor": next_cursor,
+        },
+        context=schemas.TRUSTED,
+    )
+
+
+async def get_user_item_rows(
+    db: AsyncSession,
+    user_id: int,
+    read: Optional[bool] = None,
+    feed_ids: Optional[Collection[int]] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> tuple[Sequence[Row], Optional[str]]:
+    """Get a page of the user's items from all their feeds, or from `feed_ids`.
+
+    Rows are of ITEM_COLUMNS and feed_id, newest first.
+    """
+    after = (
+        decode_cursor(cursor, (datetime.datetime, int, int))
+        if cursor is not None
+        else None
+    )
+    items = (
+        await db.execute(select_user_items(user_id, read, feed_ids, after, limit + 1))
+    ).all()
+    last = items[limit - 1] if len(items) > limit else None
+    return items[:limit], (
+        encode_cursor(last.updated, last.id, last.feed_id) if last is not None else None
+    )
+
+
+async def get_item(
+    db: AsyncSession, user_id: int, feed_id: int, item_id: int
+) -> schemas.ItemWithContent:
+    item = (
+        await db.execute(
+            select(*ITEM_COLUMNS, models.ItemContent.content)
+            .select_from(models.Entry)
+            .join(models.Entry.item)
+            .outerjoin(models.Item.content)
+            .where(
+                models.Entry.user_id == user_id,
+                models.Entry.feed_id == feed_id,
+                models.Entry.item_id == item_id,
+            )
+        )
+    ).one_or_none()
+    if item is None:
+        raise NotFoundError()
+    return schemas.ItemWithContent.model_validate(
+        {**item._asdict(), "content": item.content or []}
+    )
+
+
+async def update_item(
+    db: AsyncSession,
     user_id: int,
     feed_id: int,
     item_id: int,
     details: schemas.ItemForUpdate,
 ) -> schemas.Item:
-    item = db.execute(
-        select(models.Item)
-        .join(models.Feed)
-        .join(models.User)
-        .where(
-            models.User.id == user_id,
-            models.Feed.id == feed_id,
-            models.Item.id == item_id,
+    entry_filter = (
+        models.Entry.user_id == user_id,
+        models.Entry.feed_id == feed_id,
+        models.Entry.item_id == item_id,
+    )
+    item = (
+        await db.execute(
+            select(*ITEM_COLUMNS)
+            .select_from(models.Entry)
+            .join(models.Entry.item)
+            .where(*entry_filter)
         )
-    ).scalar_one_or_none()
+    ).one_or_none()
     if item is None:
         raise NotFoundError()
 
+    result = schemas.Item.from_orm(item)
     if details.read is not None:
-        item.read = details.read
+        await _mark(db, user_id, feed_id, details.read, models.Entry.item_id == item_id)
+        result.read = details.read
+    return result
+
+
+async def _mark(
+    db: AsyncSession,
+    user_id: int,
+    feed_id: Optional[int],
+    read: bool,
+    *conditions: ColumnElement,
+) -> int:
+    conditions += (models.Entry.user_id == user_id,)
+    if feed_id is not None:
+        conditions += (models.Entry.feed_id == feed_id,)
+    # Rows that are already right are left alone, that's less to write - and
+    # when marking as read, the unread index finds the rest.
+    await db.execute(sync.register_writer())
+    count = (
+        await db.execute(
+            update(models.Entry)
+            .where(*conditions, models.Entry.read != read)
+            .values(read=read, change_seq=models.change_sequence.next_value())
+            .execution_options(synchronize_session=False)
+        )
+    ).rowcount
+    if count:
+        await db.execute(events.read_changed(user_id, feed_id, count))
+    await db.commit()
+    return count
+
+
+async def mark_items(
+    db: AsyncSession, user_id: int, item_ids: Collection[int], read: bool = True
+) -> int:
+    """Mark the items in whichever of the user's feeds they're in."""
+    return await _mark(db, user_id, None, read, models.Entry.item_id.in_(item_ids))
 
-    db.add(item)
-    db.commit()
-    db.refresh(item)
-    return schemas.Item.from_orm(item)
 
+def _until(
+    until: Optional[datetime.datetime], seen: Optional[tuple]
+) -> list[ColumnElement]:
+    conditions = []
+    if until is not None:
+        conditions.append(models.Entry.updated <= until)
+    if seen is not None:
+        # Newest first, so what the client has seen sorts at or above the
+        # last item of the previous page.
+        key = (models.Entry.updated, models.Entry.item_id, models.Entry.feed_id)
+        conditions.append(tuple_(*key[: len(seen)]) >= seen)
+    return conditions
 
-def create_user_feed(
-    db: Session, feed: schemas.FeedCreate, user_id: int
+
+async def mark_feed_read(
+    db: AsyncSession,
+    user_id: int,
+    feed_id: int,
+    until: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+) -> int:
+    """Mark a feed's items read - all, or up to a feed listing's cursor."""
+    seen = (
+        decode_cursor(cursor, (datetime.datetime, int)) if cursor is not None else None
+    )
+    # Nothing to update would look just like a feed that's all read already.
+    owned = (
+        await db.execute(
+            select(models.Feed.id).where(
+                models.Feed.user_id == user_id, models.Feed.id == feed_id
+            )
+        )
+    ).scalar_one_or_none()
+    if owned is None:
+        raise NotFoundError()
+    return await _mark(db, user_id, feed_id, True, *_until(until, seen))
+
+
+async def mark_all_read(
+    db: AsyncSession,
+    user_id: int,
+    until: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+) -> int:
+    """Mark all the user's items read - all, or up to a timeline cursor."""
+    seen = (
+        decode_cursor(cursor, (datetime.datetime, int, int))
+        if cursor is not None
+        else None
+    )
+    return await _mark(db, user_id, None, True, *_until(until, seen))
+
+
+async def create_user_feed(
+    db: AsyncSession, feed: schemas.FeedCreate, user_id: int
 ) -> schemas.Feed:
-    db_feed = models.Feed(name=feed.name, source=str(feed.source), user_id=user_id)
+    # The no-op update makes RETURNING work for sources that already exist.
+    source = (
+        await db.execute(
+            pg_insert(models.Source)
+            .values(url=str(feed.source))
+            .on_conflict_do_update(
+                index_elements=[models.Source.url],
+                set_={"url": str(feed.source)},
+            )
+            .returning(models.Source)
+        )
+    ).scalar_one()
+    db_feed = models.Feed(name=feed.name, source_id=source.id, user_id=user_id)
     db.add(db_feed)
-    db.commit()
-    db.refresh(db_feed)
-    return schemas.Feed.from_orm(db_feed)
+    await db.flush()
+
+    # Someone may have subscribed to the same source before - their items
+    # are ours too.
+    await db.execute(sync.register_writer())
+    await db.execute(
+        insert(models.Entry).from_select(
+            ["feed_id", "user_id", "item_id", "updated"],
+            select(
+                literal(db_feed.id),
+                literal(user_id),
+                models.Item.id,
+                models.Item.updated,
+            ).where(models.Item.source_id == source.id),
+        )
+    )
+    # rowcount isn't reliable for INSERT ... SELECT, and the triggers have
+    # counted the new entries already.
+    await db.refresh(db_feed, ["item_count", "unread_count"])
+    await db.commit()
 
+    # Items aren't returned here, there may be plenty of them.
+    return schemas.Feed.model_validate(
+        {
+            "id": db_feed.id,
+            "user_id": db_feed.user_id,
+            "name": db_feed.name,
+            "source": (
+                source.actual_url if source.actual_url is not None else feed.source
+            ),
+            "status": source.status,
+            "last_fetch": source.last_fetch,
+            "item_count": db_feed.item_count,
+            "unread_count": db_feed.unread_count,
+        },
+        context=schemas.TRUSTED,
+    )
 
-def delete_user_feed(db: Session, user_id: int, feed_id: int):
-    rows = db.execute(
-        delete(models.Feed).where(
-            models.Feed.user_id == user_id, models.Feed.id == feed_id
+
+async def delete_user_feed(db: AsyncSession, user_id: int, feed_id: int):
+    rows = (
+        await db.execute(
+            delete(models.Feed).where(
+                models.Feed.user_id == user_id, models.Feed.id == feed_id
+            )
         )
     ).rowcount
 
     if rows == 0:
         raise NotFoundError()
-    db.commit()
+    await db.commit()
 
 
-def force_fetch(db: Session, user_id: int, feed_id: int):
+async def force_fetch(db: AsyncSession, user_id: int, feed_id: int):
     from czytacz import tasks
 
-    feed = db.execute(
-        select(models.Feed)
-        .where(models.Feed.user_id == user_id, models.Feed.id == feed_id)
-        .with_for_update()
+    source = (
+        await db.execute(
+            select(models.Source)
+            .join(models.Feed)
+            .where(models.Feed.user_id == user_id, models.Feed.id == feed_id)
+            .with_for_update(of=models.Source)
+        )
     ).scalar_one_or_none()
-    if feed is None:
+    if source is None:
         raise NotFoundError()
-    if feed.status == FeedStatus.FETCHING:
+    now = datetime.datetime.now()
+    if source.status == FeedStatus.FETCHING and (
+        source.lease_expires_at is None or source.lease_expires_at > now
+    ):
         raise AlreadyFetchingError()
 
-    tasks.fetch_feed.delay(feed.id, True)
-    tasks.fetch_feed.delay(feed.id, True)
+    # Claimed like the scheduler does, so that it leaves the source alone.
+    source.status = FeedStatus.FETCHING
+    source.lease_expires_at = now + datetime.timedelta(seconds=settings.FETCH_LEASE)
+    await db.commit()
+
+    # Publishing to the broker is blocking I/O.
+    await asyncio.to_thread(tasks.fetch_source.delay, source.id, True)
@@ -1,155 +1,492 @@
 import datetime
+import hashlib
+import logging
+import time
+from collections import Counter
 from typing import Any, Optional
 
-import feedparser
-from sqlalchemy import select
+import urllib3
+from sqlalchemy import and_, insert, literal_column, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
-from czytacz import models, schemas, FeedStatus
+from czytacz import (
+    events,
+    hosts,
+    http_client,
+    models,
+    parsing,
+    scheduling,
+    schemas,
+    search,
+    sync,
+    websub,
+    FeedStatus,
+)
+from czytacz.settings import settings
+
+logger = logging.getLogger(__name__)
+
+stats: Counter[str] = Counter()
+"""How often fetches short-circuit, and how many items they write."""
 
 
 class FeedNotFoundError(Exception):
     pass
 
 
-def process_item(feed_item: Any) -> schemas.ItemFetched:
-    published_parsed = feed_item.get("published_parsed")
-    updated_parsed = feed_item.get("updated_parsed")
-    return schemas.ItemFetched(
-        item_id=feed_item.id,
-        title=feed_item.get("title"),
-        link=feed_item.get("link"),
-        author=feed_item.get("author"),
-        summary=feed_item.get("summary"),
-        published=(
-            datetime.datetime(*published_parsed[:6])
-            if published_parsed is not None
-            else None
-        ),
-        updated=(
-            datetime.datetime(*updated_parsed[:6])
-            if updated_parsed is not None
-            else None
-        ),
-        content=[
-            schemas.ItemContent(
-                content_type=feed_content.type,
-                value=feed_content.value,
-            )
-            for feed_content in feed_item.get("content", [])
-        ],
+def _fetch_status(response: http_client.Response) -> schemas.FeedFetchStatus:
+    if response.status == 304:
+        return schemas.FeedFetchStatus.NO_CHANGE
+    if response.status == 410:
+        return schemas.FeedFetchStatus.GONE
+    if response.status >= 500 or response.status == 429:
+        return schemas.FeedFetchStatus.TRY_LATER
+    if response.status != 200:
+        return schemas.FeedFetchStatus.GENERIC_ERROR
+    if response.permanent_redirect:
+        return schemas.FeedFetchStatus.PERMANENT_REDIRECT
+    return schemas.FeedFetchStatus.FETCHED
+
+
+def download_feed(
+    source: schemas.SourceForFetch, force_fetch: bool = False
+) -> http_client.Response:
+    if force_fetch:
+        return http_client.get(str(source.source))
+    return http_client.get(
+        str(source.source), etag=source.etag, last_modified=source.last_modified
+    )
+
+
+def parse_feed(
+    source: schemas.SourceForFetch, response: http_client.Response
+) -> schemas.FeedFetchResult:
+    status = _fetch_status(response)
+    redirected = status == schemas.FeedFetchStatus.PERMANENT_REDIRECT
+    result = schemas.FeedFetchResult.model_validate(
+        {
+            "source": response.url if redirected else source.source,
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "status": status,
+            "cache_lifetime": scheduling.cache_lifetime(response.headers),
+            "retry_after": scheduling.retry_after(response.headers),
+        },
+        # Only where the server sent us is news.
+        context=None if redirected else schemas.TRUSTED,
     )
+    if not status.update:
+        if status == schemas.FeedFetchStatus.NO_CHANGE:
+            stats["not_modified"] += 1
+        return result
+
+    # Plenty of servers ignore conditional requests, or hand out a new ETag
+    # every time - comparing the bodies catches those.
+    result.content_digest = hashlib.sha256(response.body).hexdigest()
+    if result.content_digest == source.content_digest:
+        stats["body_unchanged"] += 1
+        if status == schemas.FeedFetchStatus.FETCHED:
+            result.status = schemas.FeedFetchStatus.NO_CHANGE
+        return result
+
+    stats["parsed"] += 1
+    parsed = parsing.run(response.body, response.headers, source.known_items)
+    if parsed.truncated:
+        stats["parse_stopped_early"] += 1
+    result.items = parsed.items
+    result.ttl = parsed.ttl
+    result.skip_hours = parsed.skip_hours
+    result.hub = parsed.hub
+    result.self_url = parsed.self_url
+    return result
 
 
 def fetch_feed(
-    feed: schemas.FeedForFetch, force_fetch: bool = False
+    source: schemas.SourceForFetch, force_fetch: bool = False
 ) -> schemas.FeedFetchResult:
-    if force_fetch:
-        parsed = feedparser.parse(str(feed.source))
-    else:
-        parsed = feedparser.parse(
-            str(feed.source), etag=feed.etag, modified=feed.last_modified
+    try:
+        response = download_feed(source, force_fetch=force_fetch)
+    except urllib3.exceptions.HTTPError as e:
+        logger.info("Fetching source %s failed: %s", source.id, e)
+        return schemas.FeedFetchResult.model_validate(
+            {
+                "source": source.source,
+                "etag": None,
+                "last_modified": None,
+                "status": schemas.FeedFetchStatus.TRY_LATER,
+            },
+            context=schemas.TRUSTED,
+        )
+    except (
+        http_client.ResponseTooLargeError,
+        http_client.TooManyRedirectsError,
+        http_client.RedirectNotAllowedError,
+    ) as e:
+        # Too large, too many redirects, or one to where we don't go.
+        logger.info("Source %s is not servable: %r", source.id, e)
+        return schemas.FeedFetchResult.model_validate(
+            {
+                "source": source.source,
+                "etag": None,
+                "last_modified": None,
+                "status": schemas.FeedFetchStatus.GENERIC_ERROR,
+            },
+            context=schemas.TRUSTED,
         )
 
-    return schemas.FeedFetchResult(
-        source=parsed.href,
-        etag=parsed.get("etag"),
-        last_modified=parsed.get("modified"),
-        status=(
-            schemas.FeedFetchStatus.NO_CHANGE
-            if parsed.status == 304
-            else schemas.FeedFetchStatus.GONE
-            if parsed.status == 410
-            else schemas.FeedFetchStatus.PERMANENT_REDIRECT
-            if parsed.status == 301
-            else schemas.FeedFetchStatus.TRY_LATER
-            if parsed.status >= 500
-            else schemas.FeedFetchStatus.GENERIC_ERROR
-            if parsed.status >= 400
-            else schemas.FeedFetchStatus.FETCHED
-        ),
-        items=[process_item(entry) for entry in parsed.get("entries", [])],
+    if force_fetch:
+        source = source.model_copy(update={"content_digest": None, "known_items": {}})
+
+    start = time.perf_counter()
+    try:
+        result = parse_feed(source, response)
+    except parsing.ParseTimeoutError:
+        logger.info("Parsing source %s timed out", source.id)
+        return schemas.FeedFetchResult.model_validate(
+            {
+                "source": source.source,
+                "etag": None,
+                "last_modified": None,
+                "status": schemas.FeedFetchStatus.TRY_LATER,
+            },
+            context=schemas.TRUSTED,
+        )
+    logger.info(
+        "Source %s: HTTP %s, %d bytes, fetched in %.3fs, parsed in %.3fs",
+        source.id,
+        response.status,
+        len(response.body),
+        response.elapsed,
+        time.perf_counter() - start,
     )
+    return result
+
+
+UPSERT_BATCH_SIZE = 500
+
+UPSERTED_COLUMNS = [
+    "title",
+    "link",
+    "author",
+    "summary",
+    "updated",
+    "digest",
+]
+
 
+def _upsert_items(
+    db: Session, rows: list[dict[str, Any]], update_existing: bool
+) -> tuple[dict[str, int], dict[str, int]]:
+    """Insert the rows, or update items that are older than them.
 
-def update_items(db: Session, feed: schemas.Feed, items: list[schemas.ItemFetched], now: datetime.datetime):
-    existing_items = {
-        item.item_id: item
-        for item in db.execute(
-            select(models.Item).where(
-                models.Item.feed_id == feed.id,
-                models.Item.item_id.in_(item.item_id for item in items),
+    Returns the ids of the inserted and of the updated items, by their IDs
+    in the feed.
+    """
+    table = models.Item.__table__
+    inserted: dict[str, int] = {}
+    updated: dict[str, int] = {}
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        statement = pg_insert(table).values(rows[start : start + UPSERT_BATCH_SIZE])
+        if update_existing:
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.source_id, table.c.item_id],
+                set_={
+                    column: statement.excluded[column] for column in UPSERTED_COLUMNS
+                },
+                where=and_(
+                    statement.excluded.updated > table.c.updated,
+                    statement.excluded.digest.is_distinct_from(table.c.digest),
+                ),
             )
-        ).scalars()
-    }
+        else:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=[table.c.source_id, table.c.item_id]
+            )
+        # xmax is only set on rows that already existed and got updated.
+        for row_id, item_id, was_inserted in db.execute(
+            statement.returning(table.c.id, table.c.item_id, literal_column("xmax = 0"))
+        ):
+            (inserted if was_inserted else updated)[item_id] = row_id
+    return inserted, updated
+
 
+def _upsert_contents(db: Session, rows: list[dict[str, Any]]):
+    table = models.ItemContent.__table__
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        statement = pg_insert(table).values(rows[start : start + UPSERT_BATCH_SIZE])
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.item_id],
+                set_={"content": statement.excluded.content},
+            )
+        )
+
+
+def update_items(
+    db: Session,
+    source_id: int,
+    items: list[schemas.ItemFetched],
+    now: datetime.datetime,
+) -> schemas.ItemUpsertResult:
+    """Store the fetched items of a source, and fan them out to its feeds.
+
+    Items are written with INSERT ... ON CONFLICT, so nothing is loaded into
+    the session - the cost depends on the size of the fetched document, not
+    on how many items the source has accumulated.
+    """
+    # The last copy wins if a document repeats an ID.
     items_dict = {item.item_id: item for item in items}
 
-    for item_id, item in items_dict.items():
-        if item_id in existing_items:
-            existing = existing_items[item_id]
-            if item.updated is None or item.updated <= existing.updated:
-                continue
-            existing.title = item.title
-            existing.link = item.link
-            existing.author = item.author
-            existing.summary = item.summary
-            existing.content = item.content
-            existing.updated = item.updated if item.updated is not None else now
-            db.add(existing)
+    # Items without an "updated" date are stored, but never updated - we have
+    # no way of telling whether what we've got is newer.
+    dated = []
+    undated = []
+    for item in items_dict.values():
+        row = item.model_dump(exclude={"content"})
+        row["source_id"] = source_id
+        row["first_seen"] = now
+        row["digest"] = parsing.item_digest(item)
+        if item.updated is None:
+            row["updated"] = now
+            undated.append(row)
         else:
-            item.updated = item.updated if item.updated is not None else now
-            feed.items.append(
-                models.Item(
-                    **item.model_dump(),
-                    first_seen=now,
+            dated.append(row)
+
+    inserted_ids, updated_ids = _upsert_items(db, dated, update_existing=True)
+    inserted_ids.update(_upsert_items(db, undated, update_existing=False)[0])
+    inserted = list(inserted_ids.values())
+    updated = list(updated_ids.values())
+
+    # Content lives apart, only the single item endpoint needs it.
+    _upsert_contents(
+        db,
+        [
+            {
+                "item_id": row_id,
+                "content": [
+                    content.model_dump() for content in items_dict[item_id].content
+                ],
+            }
+            for item_id, row_id in (inserted_ids | updated_ids).items()
+        ],
+    )
+    search.update_documents(db, inserted + updated)
+
+    # Fan the items out to everyone subscribed to the source.
+    if inserted or updated:
+        db.execute(sync.register_writer())
+    if inserted:
+        db.execute(
+            insert(models.Entry).from_select(
+                ["feed_id", "user_id", "item_id", "updated"],
+                select(
+                    models.Feed.id,
+                    models.Feed.user_id,
+                    models.Item.id,
+                    models.Item.updated,
                 )
+                .join(models.Item, models.Item.source_id == models.Feed.source_id)
+                .where(models.Item.id.in_(inserted)),
+            )
+        )
+    if updated:
+        db.execute(
+            update(models.Entry)
+            .where(
+                models.Entry.item_id == models.Item.id,
+                models.Item.id.in_(updated),
+            )
+            .values(
+                updated=models.Item.updated,
+                change_seq=models.change_sequence.next_value(),
             )
+        )
 
+    if inserted or updated:
+        db.execute(events.items_changed(source_id, len(inserted), len(updated)))
 
-def fetch_feed_by_id(
-    db: Session, feed_id: int, force_fetch: bool = False
-) -> schemas.Feed:
-    feed: Optional[models.Feed] = db.query(models.Feed).get(feed_id)
-    if feed is None:
+    stats["items_inserted"] += len(inserted)
+    stats["items_updated"] += len(updated)
+    stats["items_unchanged"] += len(items_dict) - len(inserted) - len(updated)
+    return schemas.ItemUpsertResult(inserted=len(inserted), updated=len(updated))
+
+
+def _known_items(db: Session, source_id: int) -> dict[str, str]:
+    rows = db.execute(
+        select(models.Item.item_id, models.Item.digest)
+        .where(
+            models.Item.source_id == source_id,
+            models.Item.digest.is_not(None),
+        )
+        .order_by(models.Item.updated.desc())
+        .limit(settings.PARSE_MAX_ENTRIES)
+    ).all()
+    return {
+        item_id: digest
+        for item_id, digest in rows
+        if item_id is not None and digest is not None
+    }
+
+
+def fetch_source_by_id(
+    db: Session, source_id: int, force_fetch: bool = False
+) -> schemas.Source:
+    source: Optional[models.Source] = db.get(models.Source, source_id)
+    if source is None:
         raise FeedNotFoundError()
-    feed_for_fetch = schemas.FeedForFetch.from_orm(feed)
-    feed_for_fetch.source = schemas.PublicUrl(
-        feed.actual_source if feed.actual_source is not None else feed.source
+    source_for_fetch = schemas.SourceForFetch.model_validate(
+        {
+            "id": source.id,
+            "source": (
+                source.actual_url if source.actual_url is not None else source.url
+            ),
+            "etag": source.etag,
+            "last_modified": source.last_modified,
+            "content_digest": source.content_digest,
+            "known_items": _known_items(db, source.id),
+        },
+        context=schemas.TRUSTED,
     )
-    fetched = fetch_feed(feed_for_fetch, force_fetch=force_fetch)
+    # Hand the connection back while we wait for the network and the parser.
+    db.rollback()
+    fetched = fetch_feed(source_for_fetch, force_fetch=force_fetch)
 
     now = datetime.datetime.now()
-    feed.last_fetch = now
-    
+    source.last_fetch = now
+    source.lease_expires_at = None
+
     if fetched.status == schemas.FeedFetchStatus.GONE:
-        print("Gone!")
-        feed.status = FeedStatus.GONE
+        logger.info("Source %s is gone", source.id)
+        source.status = FeedStatus.GONE
     elif fetched.status == schemas.FeedFetchStatus.TRY_LATER:
-        print("Later!")
-        feed.status = FeedStatus.TRY_LATER
+        source.failure_count += 1
+        retry_at = scheduling.retry_at(now, source.failure_count, fetched.retry_after)
+        if retry_at is None:
+            logger.info("Source %s keeps failing, giving up", source.id)
+            source.status = FeedStatus.FAILED
+        else:
+            source.status = FeedStatus.TRY_LATER
+            source.next_fetch_at = retry_at
+        if fetched.retry_after is not None:
+            # A 429 or a 503 - the whole host wants a break, not just us.
+            hosts.pause(
+                db,
+                hosts.host_of(str(source_for_fetch.source)),
+                now + datetime.timedelta(seconds=fetched.retry_after),
+            )
     elif fetched.status == schemas.FeedFetchStatus.GENERIC_ERROR:
-        print("something odd?")
-        feed.status = FeedStatus.FAILED
+        source.failure_count += 1
+        source.status = FeedStatus.FAILED
     elif not fetched.status.ok:
         raise NotImplementedError("Missing error handling")
     else:
-        feed.status = FeedStatus.OK
+        source.status = FeedStatus.OK
+        source.failure_count = 0
 
+    if fetched.content_digest is not None:
+        # Set whenever a body came back, even one we already had - the
+        # server may have sent new validators with it.
+        source.etag = fetched.etag
+        source.last_modified = fetched.last_modified
+        source.content_digest = fetched.content_digest
+    if fetched.skip_hours is not None:
+        # Only known when the body was parsed.
+        source.ttl = fetched.ttl
+        source.skip_hours = fetched.skip_hours
+        if websub.enabled():
+            websub.update_hub(source, fetched.hub, fetched.self_url)
 
-    if not fetched.status.update:
-        return schemas.Feed.from_orm(feed)
-
+    inserted = 0
     if fetched.status.update:
-        feed.etag = fetched.etag
-        feed.last_modified = fetched.last_modified
         if fetched.status == schemas.FeedFetchStatus.PERMANENT_REDIRECT:
-            feed.actual_source = str(fetched.source)
+            source.actual_url = str(fetched.source)
 
-        update_items(db, feed, fetched.items, now)
-    feed.status = FeedStatus.OK
+        start = time.perf_counter()
+        upserted = update_items(db, source.id, fetched.items, now)
+        inserted = upserted.inserted
+        logger.info(
+            "Source %s: %d items fetched, %d inserted, %d updated in %.3fs",
+            source.id,
+            len(fetched.items),
+            upserted.inserted,
+            upserted.updated,
+            time.perf_counter() - start,
+        )
 
-    db.add(feed)
+    if fetched.status.ok:
+        dates = [item.published or item.updated for item in fetched.items]
+        interval = scheduling.fetch_interval(
+            source.fetch_interval,
+            changed=inserted > 0,
+            dates=[date for date in dates if date is not None],
+        )
+        source.fetch_interval = round(interval)
+        source.next_fetch_at = scheduling.next_fetch_at(
+            now,
+            interval,
+            lifetime=fetched.cache_lifetime,
+            ttl=source.ttl,
+            skip_hours=source.skip_hours or (),
+        )
+        if websub.is_active(source, now):
+            # The hub tells us about new items, polling is only a safety net.
+            source.next_fetch_at = max(
+                source.next_fetch_at,
+                now + datetime.timedelta(seconds=settings.WEBSUB_POLL_INTERVAL),
+            )
+
+    db.add(source)
     db.commit()
-    db.refresh(feed)
-    return schemas.Feed.from_orm(feed)
+    db.refresh(source)
+    logger.debug("Fetch stats: %s", dict(stats))
+    return schemas.Source.from_orm(source)
+
+
+def fetch_feed_by_id(
+    db: Session, feed_id: int, force_fetch: bool = False
+) -> schemas.Source:
+    """Fetch the source of a feed - and so, of every feed sharing it."""
+    feed: Optional[models.Feed] = db.get(models.Feed, feed_id)
+    if feed is None:
+        raise FeedNotFoundError()
+    return fetch_source_by_id(db, feed.source_id, force_fetch=force_fetch)
+
+
+def ingest_pushed(
+    db: Session, source_id: int, body: bytes, headers: dict[str, str]
+) -> schemas.ItemUpsertResult:
+    """Store the items a WebSub hub pushed, like a fetch of the source would.
+
+    Pushed bodies are a feed document with just the new or changed entries,
+    and leave the source's fetch state alone.
+    """
+    known = _known_items(db, source_id)
+    db.rollback()
+    try:
+        parsed = parsing.run(body, headers, known)
+    except parsing.ParseTimeoutError:
+        # The next fetch will bring the items anyway.
+        logger.info("Parsing what was pushed to source %s timed out", source_id)
+        return schemas.ItemUpsertResult()
+    # The source may have gone while the push was queued. The lock keeps it
+    # around until the items are in.
+    source = db.execute(
+        select(models.Source.id)
+        .where(models.Source.id == source_id)
+        .with_for_update(key_share=True)
+    ).scalar_one_or_none()
+    if source is None:
+        logger.info("Source %s is gone, dropping what was pushed", source_id)
+        db.rollback()
+        return schemas.ItemUpsertResult()
+    upserted = update_items(db, source_id, parsed.items, datetime.datetime.now())
+    db.commit()
+    logger.info(
+        "Source %s: %d items pushed, %d inserted, %d updated",
+        source_id,
+        len(parsed.items),
+        upserted.inserted,
+        upserted.updated,
+    )
+    return upserted
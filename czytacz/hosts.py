@@ -0,0 +1,108 @@
+"""Per-host politeness, shared by every worker through the database.
+
+Each host has a token bucket, refilled at FETCH_HOST_RATE tokens a second up
+to FETCH_HOST_BURST, and every fetch takes a token. On top of that, no more
+than FETCH_HOST_CONCURRENCY fetches run against a host at once. The host row
+is locked while a fetch is let through, so workers can't both take the last
+token.
+"""
+
+import datetime
+from typing import Optional
+from urllib.parse import urlsplit
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from czytacz import models
+from czytacz.settings import settings
+
+# How long to wait for a slot to free up, there's no telling really.
+SLOT_WAIT = 5.0
+
+
+def host_of(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+def acquire(
+    db: Session, host: str, source_id: int, now: datetime.datetime
+) -> Optional[float]:
+    """Try to let a fetch of the source through to the host.
+
+    Returns None if it may go ahead, and how many seconds to wait otherwise.
+    Commits either way, so that the host row isn't locked for long.
+    """
+    db.execute(
+        pg_insert(models.Host)
+        .values(name=host, tokens=settings.FETCH_HOST_BURST, tokens_updated=now)
+        .on_conflict_do_nothing()
+    )
+    row = db.execute(
+        select(models.Host).where(models.Host.name == host).with_for_update()
+    ).scalar_one()
+
+    rate = row.rate if row.rate is not None else settings.FETCH_HOST_RATE
+    burst = row.burst if row.burst is not None else settings.FETCH_HOST_BURST
+    max_concurrency = (
+        row.max_concurrency
+        if row.max_concurrency is not None
+        else settings.FETCH_HOST_CONCURRENCY
+    )
+
+    elapsed = max((now - row.tokens_updated).total_seconds(), 0)
+    row.tokens = min(burst, row.tokens + elapsed * rate)
+    row.tokens_updated = now
+
+    db.execute(
+        delete(models.HostSlot).where(
+            models.HostSlot.host == host, models.HostSlot.expires_at <= now
+        )
+    )
+    active = db.execute(
+        select(func.count())
+        .select_from(models.HostSlot)
+        .where(models.HostSlot.host == host)
+    ).scalar_one()
+
+    wait: Optional[float] = None
+    if row.paused_until is not None and row.paused_until > now:
+        wait = (row.paused_until - now).total_seconds()
+    elif active >= max_concurrency:
+        wait = SLOT_WAIT
+    elif row.tokens < 1:
+        wait = (1 - row.tokens) / rate
+    else:
+        row.tokens -= 1
+        expires_at = now + datetime.timedelta(seconds=settings.FETCH_LEASE)
+        db.execute(
+            pg_insert(models.HostSlot)
+            .values(source_id=source_id, host=host, expires_at=expires_at)
+            .on_conflict_do_update(
+                index_elements=[models.HostSlot.source_id],
+                set_={"host": host, "expires_at": expires_at},
+            )
+        )
+    db.commit()
+    return wait
+
+
+def release(db: Session, source_id: int):
+    db.execute(delete(models.HostSlot).where(models.HostSlot.source_id == source_id))
+    db.commit()
+
+
+def pause(db: Session, host: str, until: datetime.datetime):
+    """Keep everyone away from the host until the given time.
+
+    Part of the caller's transaction, unlike the above.
+    """
+    db.execute(
+        update(models.Host)
+        .where(
+            models.Host.name == host,
+            func.coalesce(models.Host.paused_until, until) <= until,
+        )
+        .values(paused_until=until)
+    )
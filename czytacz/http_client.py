@@ -0,0 +1,219 @@
+"""HTTP layer used to download feeds.
+
+Feedparser can fetch URLs by itself, but it opens a fresh urllib connection
+every time and gives us no control over timeouts or response sizes. This
+module keeps a per-process urllib3 PoolManager - one connection pool per
+host - and returns raw bodies, leaving parsing to the caller.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import urljoin
+
+import pydantic
+import urllib3
+
+from czytacz import schemas
+from czytacz.settings import settings
+
+PERMANENT_REDIRECTS = (301, 308)
+TEMPORARY_REDIRECTS = (302, 303, 307)
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+
+_public_url = pydantic.TypeAdapter(schemas.PublicUrl)
+
+
+class ResponseTooLargeError(Exception):
+    pass
+
+
+class TooManyRedirectsError(Exception):
+    pass
+
+
+class RedirectNotAllowedError(Exception):
+    pass
+
+
+@dataclass
+class Response:
+    url: str
+    """The URL the body was eventually served from."""
+    status: int
+    headers: dict[str, str]
+    """Response headers, with lowercase names."""
+    body: bytes = b""
+    permanent_redirect: bool = False
+    """Whether every redirect on the way to `url` was a permanent one."""
+    elapsed: float = 0.0
+    redirects: list[str] = field(default_factory=list)
+
+
+_lock = threading.Lock()
+_pool_manager: Optional[urllib3.PoolManager] = None
+_pid: Optional[int] = None
+
+
+def get_pool_manager() -> urllib3.PoolManager:
+    """Return the pool manager of this process, creating it on first use."""
+    global _pool_manager, _pid
+
+    pid = os.getpid()
+    if _pool_manager is not None and _pid == pid:
+        return _pool_manager
+
+    with _lock:
+        if _pool_manager is None or _pid != pid:
+            _pool_manager = urllib3.PoolManager(
+                num_pools=settings.FETCH_NUM_POOLS,
+                maxsize=settings.FETCH_POOL_MAXSIZE,
+                timeout=urllib3.Timeout(
+                    connect=settings.FETCH_CONNECT_TIMEOUT,
+                    read=settings.FETCH_READ_TIMEOUT,
+                ),
+                retries=False,
+            )
+            _pid = pid
+    return _pool_manager
+
+
+def _read_body(response: urllib3.BaseHTTPResponse, max_bytes: int) -> bytes:
+    content_length = response.headers.get("Content-Length")
+    if (
+        content_length is not None
+        and content_length.isdigit()
+        and int(content_length) > max_bytes
+    ):
+        raise ResponseTooLargeError()
+
+    chunks = []
+    size = 0
+    for chunk in response.stream(CHUNK_SIZE, decode_content=True):
+        size += len(chunk)
+        # Checked after decompression too, to keep gzip bombs out.
+        if size > max_bytes:
+            raise ResponseTooLargeError()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def get(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+) -> Response:
+    """Download the URL, following redirects.
+
+    Sends a conditional request if `etag` or `last_modified` are given - a
+    304 comes back as a response with an empty body. Network problems are
+    raised as urllib3 exceptions. `url` itself is the caller's to check, the
+    redirects are checked here.
+    """
+    if max_bytes is None:
+        max_bytes = settings.FETCH_MAX_BYTES
+
+    pool_manager = get_pool_manager()
+    headers = urllib3.make_headers(
+        accept_encoding=True, user_agent=settings.FETCH_USER_AGENT
+    )
+    headers["Accept"] = (
+        "application/rss+xml, application/atom+xml, application/xml;q=0.9, "
+        "text/xml;q=0.9, */*;q=0.1"
+    )
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    if last_modified is not None:
+        headers["If-Modified-Since"] = last_modified
+
+    start = time.perf_counter()
+    permanent = True
+    redirects: list[str] = []
+    while True:
+        response = pool_manager.request(
+            "GET",
+            url,
+            headers=headers,
+            redirect=False,
+            preload_content=False,
+        )
+        try:
+            location = response.headers.get("Location")
+            if response.status in PERMANENT_REDIRECTS + TEMPORARY_REDIRECTS:
+                if location is None:
+                    # Nowhere to go - let the caller treat it as an error.
+                    body = b""
+                else:
+                    if len(redirects) >= MAX_REDIRECTS:
+                        raise TooManyRedirectsError()
+                    permanent = permanent and response.status in PERMANENT_REDIRECTS
+                    url = urljoin(url, location)
+                    # Same checks as for the URLs users give us, or a public
+                    # feed could send us anywhere inside the network.
+                    try:
+                        _public_url.validate_python(url)
+                    except pydantic.ValidationError:
+                        raise RedirectNotAllowedError(url)
+                    redirects.append(url)
+                    response.drain_conn()
+                    continue
+            elif response.status == 200:
+                body = _read_body(response, max_bytes)
+            else:
+                body = b""
+                response.drain_conn()
+        except BaseException:
+            # Whatever is left of the body is garbage for the next request.
+            response.close()
+            raise
+        finally:
+            response.release_conn()
+
+        return Response(
+            url=url,
+            status=response.status,
+            headers={k.lower(): v for k, v in response.headers.items()},
+            body=body,
+            permanent_redirect=bool(redirects) and permanent,
+            elapsed=time.perf_counter() - start,
+            redirects=redirects,
+        )
+
+
+def post_form(
+    url: str, fields: dict[str, str], max_bytes: int = CHUNK_SIZE
+) -> Response:
+    """POST a form and return the response, without following redirects.
+
+    For talking to WebSub hubs, which only answer with a status, and maybe a
+    line of explanation.
+    """
+    headers = urllib3.make_headers(user_agent=settings.FETCH_USER_AGENT)
+    start = time.perf_counter()
+    response = get_pool_manager().request(
+        "POST",
+        url,
+        fields=fields,
+        encode_multipart=False,
+        headers=headers,
+        redirect=False,
+        preload_content=False,
+    )
+    try:
+        body = _read_body(response, max_bytes)
+    except BaseException:
+        response.close()
+        raise
+    finally:
+        response.release_conn()
+    return Response(
+        url=url,
+        status=response.status,
+        headers={k.lower(): v for k, v in response.headers.items()},
+        body=body,
+        elapsed=time.perf_counter() - start,
+    )
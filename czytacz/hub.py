@@ -0,0 +1,140 @@
+"""A stand-in WebSub hub, for trying out subscriptions without a real one.
+
+Keeps subscriptions in memory, verifies them with the subscriber, and on a
+publish request - hub.mode=publish and hub.url=<topic>, as most hubs take
+them - fetches the topic and pushes it to every subscriber, signed with
+sha256. Run it with `czytacz websub-hub`, and point a feed's
+<link rel="hub"> at it.
+"""
+
+import dataclasses
+import datetime
+import hashlib
+import hmac
+import logging
+import secrets
+import urllib.parse
+from typing import Optional
+
+import urllib3
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response, status
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE = 24 * 60 * 60
+MAX_LEASE = 30 * 24 * 60 * 60
+
+
+@dataclasses.dataclass
+class Subscription:
+    secret: Optional[str]
+    expires_at: datetime.datetime
+
+
+app = FastAPI()
+http = urllib3.PoolManager(timeout=10.0, retries=False)
+# By (topic, callback).
+subscriptions: dict[tuple[str, str], Subscription] = {}
+
+
+async def _form(request: Request) -> dict[str, str]:
+    # Not worth python-multipart just for this.
+    fields = urllib.parse.parse_qs((await request.body()).decode())
+    return {name: values[-1] for name, values in fields.items()}
+
+
+def _verify(mode: str, topic: str, callback: str, lease: int, secret: Optional[str]):
+    challenge = secrets.token_urlsafe(16)
+    query = urllib.parse.urlencode(
+        {
+            "hub.mode": mode,
+            "hub.topic": topic,
+            "hub.challenge": challenge,
+            "hub.lease_seconds": lease,
+        }
+    )
+    separator = "&" if "?" in callback else "?"
+    try:
+        response = http.request("GET", f"{callback}{separator}{query}")
+    except urllib3.exceptions.HTTPError as e:
+        logger.info("Verifying %s of %s failed: %s", mode, callback, e)
+        return
+    if response.status // 100 != 2 or response.data.decode() != challenge:
+        logger.info("%s refused to %s to %s", callback, mode, topic)
+        return
+
+    if mode == "subscribe":
+        subscriptions[topic, callback] = Subscription(
+            secret=secret,
+            expires_at=datetime.datetime.now() + datetime.timedelta(seconds=lease),
+        )
+    else:
+        subscriptions.pop((topic, callback), None)
+    logger.info("%s: %s to %s", callback, mode, topic)
+
+
+def _publish(topic: str):
+    try:
+        content = http.request("GET", topic)
+    except urllib3.exceptions.HTTPError as e:
+        logger.info("Fetching %s failed: %s", topic, e)
+        return
+    content_type = content.headers.get("content-type", "application/octet-stream")
+
+    now = datetime.datetime.now()
+    for (subscribed, callback), subscription in list(subscriptions.items()):
+        if subscribed != topic:
+            continue
+        if subscription.expires_at <= now:
+            del subscriptions[subscribed, callback]
+            continue
+        headers = {
+            "Content-Type": content_type,
+            "Link": f'<{topic}>; rel="self"',
+        }
+        if subscription.secret is not None:
+            digest = hmac.new(
+                subscription.secret.encode(), content.data, hashlib.sha256
+            ).hexdigest()
+            headers["X-Hub-Signature"] = f"sha256={digest}"
+        try:
+            response = http.request(
+                "POST", callback, body=content.data, headers=headers
+            )
+        except urllib3.exceptions.HTTPError as e:
+            logger.info("Pushing %s to %s failed: %s", topic, callback, e)
+            continue
+        logger.info("Pushed %s to %s: HTTP %s", topic, callback, response.status)
+
+
+@app.post("/")
+async def hub(request: Request, background_tasks: BackgroundTasks):
+    form = await _form(request)
+    mode = form.get("hub.mode")
+
+    if mode == "publish":
+        topic = form.get("hub.url") or form.get("hub.topic")
+        if topic is None:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "hub.url is missing")
+        background_tasks.add_task(_publish, topic)
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    if mode not in ("subscribe", "unsubscribe"):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Unsupported hub.mode")
+    topic = form.get("hub.topic")
+    callback = form.get("hub.callback")
+    if topic is None or callback is None:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST, "hub.topic and hub.callback are required"
+        )
+    try:
+        lease = int(form.get("hub.lease_seconds", DEFAULT_LEASE))
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Bad hub.lease_seconds")
+    lease = max(1, min(lease, MAX_LEASE))
+
+    # Verified after answering, like the spec has it.
+    background_tasks.add_task(
+        _verify, mode, topic, callback, lease, form.get("hub.secret")
+    )
+    return Response(status_code=status.HTTP_202_ACCEPTED)
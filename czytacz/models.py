@@ -3,18 +3,32 @@ from __future__ import annotations
 import datetime
 from typing import Any, Optional
 
-from sqlalchemy import ForeignKey, Integer, String, UniqueConstraint
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import (
+    BigInteger,
+    ForeignKey,
+    Index,
+    Integer,
+    Sequence,
+    String,
+    UniqueConstraint,
+    func,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from czytacz import FeedStatus
 from czytacz.database import Base
 
+change_sequence = Sequence("change_seq", metadata=Base.metadata)
+"""Numbers every change to entries, for clients syncing - see czytacz.sync"""
+
 
 class User(Base):
     """User represents agents interacting with the reader."""
 
     __tablename__ = "user"
+    __table_args__ = (Index("ix_user_email", "email"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
 
@@ -25,50 +39,124 @@ class User(Base):
     feeds: Mapped[list[Feed]] = relationship(back_populates="user")
 
 
-class Feed(Base):
-    """A feed that the user wants to subscribe to."""
+class Source(Base):
+    """A feed document on the web, fetched once for all of its subscribers."""
 
-    __tablename__ = "feed"
+    __tablename__ = "source"
+    __table_args__ = (
+        # Sources the scheduler may pick up, by when they're due.
+        Index(
+            "ix_source_next_fetch_at",
+            "next_fetch_at",
+            postgresql_where=text("status IS NULL OR status IN ('OK', 'TRY_LATER')"),
+        ),
+        # Claims that were never released.
+        Index(
+            "ix_source_lease_expires_at",
+            "lease_expires_at",
+            postgresql_where=text("status = 'FETCHING'"),
+        ),
+        # WebSub subscriptions to renew - few sources have a hub. Never
+        # subscribed ones go first.
+        Index(
+            "ix_source_websub_expires_at",
+            text("websub_expires_at NULLS FIRST"),
+            postgresql_where=text("websub_hub IS NOT NULL"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
-    name: Mapped[str]
 
-    source: Mapped[str]
+    url: Mapped[str] = mapped_column(String, unique=True)
     # I want to maintain what user gave us initially, but hitting the URL in
     # case of a 301 is a bad idea.
-    actual_source: Mapped[Optional[str]]
+    actual_url: Mapped[Optional[str]]
 
-    user: Mapped[User] = relationship(back_populates="feeds")
+    feeds: Mapped[list[Feed]] = relationship(back_populates="source")
     items: Mapped[list[Item]] = relationship(
-        back_populates="feed", cascade="all, delete", passive_deletes=True
+        back_populates="source", cascade="all, delete", passive_deletes=True
     )
 
     # Used for interaction with the server, and returned as-is to it
     etag: Mapped[Optional[str]]
     last_modified: Mapped[Optional[str]]
+    # sha256 of the last body we parsed, for servers that ignore the above.
+    content_digest: Mapped[Optional[str]]
 
     status: Mapped[Optional[FeedStatus]]
     last_fetch: Mapped[Optional[datetime.datetime]]
 
+    # Scheduling, see czytacz.scheduling. New sources are due right away.
+    next_fetch_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now())
+    fetch_interval: Mapped[Optional[int]]
+    """Seconds between fetches, following how often the source posts"""
+    failure_count: Mapped[int] = mapped_column(server_default="0")
+    # Set while the source is claimed for fetching.
+    lease_expires_at: Mapped[Optional[datetime.datetime]]
+    # What the feed itself says about being polled.
+    ttl: Mapped[Optional[int]]
+    skip_hours: Mapped[Optional[list[int]]] = mapped_column(ARRAY(Integer))
+
+    # WebSub, see czytacz.websub. The topic is the feed's own idea of its URL.
+    websub_hub: Mapped[Optional[str]]
+    websub_topic: Mapped[Optional[str]]
+    websub_secret: Mapped[Optional[str]]
+    websub_requested_at: Mapped[Optional[datetime.datetime]]
+    websub_expires_at: Mapped[Optional[datetime.datetime]]
+    """When the hub's confirmed subscription runs out"""
+
+
+class Feed(Base):
+    """A user's subscription to a source."""
+
+    __tablename__ = "feed"
+    __table_args__ = (
+        Index("ix_feed_user_id", "user_id", "id"),
+        Index("ix_feed_source_id", "source_id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    name: Mapped[str]
+    source_id: Mapped[int] = mapped_column(ForeignKey("source.id"))
+
+    # Of the feed's entries. Kept up to date by triggers on entry, see
+    # czytacz.counters.
+    item_count: Mapped[int] = mapped_column(server_default="0")
+    unread_count: Mapped[int] = mapped_column(server_default="0")
+    # Bumped by the same triggers on any change to the feed's entries, for
+    # conditional requests.
+    version: Mapped[int] = mapped_column(server_default="0")
+    changed_at: Mapped[Optional[datetime.datetime]]
+
+    user: Mapped[User] = relationship(back_populates="feeds")
+    source: Mapped[Source] = relationship(back_populates="feeds")
+    entries: Mapped[list[Entry]] = relationship(
+        back_populates="feed", cascade="all, delete", passive_deletes=True
+    )
+
+
 class Item(Base):
-    """An item from a feed.
+    """An item from a source.
 
     The contents of the post are extracted using feedparser,
     """
 
     __tablename__ = "item"
-    __table_args__ = (UniqueConstraint("feed_id", "item_id"),)
+    __table_args__ = (
+        UniqueConstraint("source_id", "item_id"),
+        Index("ix_item_search", "search", postgresql_using="gin"),
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    feed_id: Mapped[int] = mapped_column(ForeignKey("feed.id", ondelete="CASCADE"))
-    feed: Mapped[Feed] = relationship(back_populates="items")
+    source_id: Mapped[int] = mapped_column(ForeignKey("source.id", ondelete="CASCADE"))
+    source: Mapped[Source] = relationship(back_populates="items")
 
     # This is separate from the primary key for the following reasons:
     # - it's assigned by the feed processor, and could conceivably change.
     # - I'm always hesitant about "natural" primary keys
     # - while writing this part I am still considering that this field might
     #   end up optional, and replaced by something entirely different.
-    item_id: Mapped[Optional[str]] = mapped_column(String, unique=True)
+    item_id: Mapped[Optional[str]] = mapped_column(String)
 
     first_seen: Mapped[datetime.datetime]
     """
@@ -80,6 +168,120 @@ class Item(Base):
     author: Mapped[Optional[str]]
     summary: Mapped[Optional[str]]
     published: Mapped[Optional[datetime.datetime]]
+    updated: Mapped[datetime.datetime]
+    digest: Mapped[Optional[str]]
+    """sha256 of the fields above and the content, bar updated - see
+    parsing.item_digest"""
+
+    search: Mapped[Optional[Any]] = mapped_column(TSVECTOR, deferred=True)
+    """Title, summary and content, for full-text search - see czytacz.search"""
+
+    content: Mapped[Optional[ItemContent]] = relationship(
+        cascade="all, delete", passive_deletes=True
+    )
+
+
+class ItemContent(Base):
+    """The content of an item, which is most of its size.
+
+    Kept apart so that listings, which don't show it, only go through the
+    small rows of the item table. Large values get compressed with lz4, if
+    the server has it, as Postgres moves them out of line - see the migration.
+    """
+
+    __tablename__ = "item_content"
+
+    item_id: Mapped[int] = mapped_column(
+        ForeignKey("item.id", ondelete="CASCADE"), primary_key=True
+    )
     content: Mapped[list[Any]] = mapped_column(JSONB)
+
+
+class Entry(Base):
+    """An item as it appears in one feed, along with the user's read state.
+
+    Items are stored once per source, entries once per subscriber - they're
+    small, and having them lets us query a user's items without going
+    through every source they're subscribed to.
+    """
+
+    __tablename__ = "entry"
+    __table_args__ = (
+        # Feed listings, newest first - and the same for unread entries only.
+        Index("ix_entry_feed_updated", "feed_id", "updated", "item_id"),
+        Index(
+            "ix_entry_feed_unread",
+            "feed_id",
+            "updated",
+            "item_id",
+            postgresql_where=text("NOT read"),
+        ),
+        # The timeline, all of a user's feeds at once - feed_id is there for
+        # items that are in more than one of them.
+        Index("ix_entry_user_updated", "user_id", "updated", "item_id", "feed_id"),
+        Index(
+            "ix_entry_user_unread",
+            "user_id",
+            "updated",
+            "item_id",
+            "feed_id",
+            postgresql_where=text("NOT read"),
+        ),
+        # Fan-out of item updates, and cascading deletes of items.
+        Index("ix_entry_item_id", "item_id"),
+        Index("ix_entry_user_change_seq", "user_id", "change_seq"),
+    )
+
+    feed_id: Mapped[int] = mapped_column(
+        ForeignKey("feed.id", ondelete="CASCADE"), primary_key=True
+    )
+    item_id: Mapped[int] = mapped_column(
+        ForeignKey("item.id", ondelete="CASCADE"), primary_key=True
+    )
+    # Copied from the feed and the item, so that per-user listings can be
+    # served from this table alone.
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"))
     updated: Mapped[datetime.datetime]
+
     read: Mapped[bool] = mapped_column(default=False)
+    # Taken anew whenever the entry or its item changes.
+    change_seq: Mapped[int] = mapped_column(
+        BigInteger, server_default=change_sequence.next_value()
+    )
+
+    feed: Mapped[Feed] = relationship(back_populates="entries")
+    item: Mapped[Item] = relationship()
+
+
+class Host(Base):
+    """A web server we fetch sources from, and how hard we may hit it.
+
+    Shared by every worker: fetches take a token from the host's bucket, and
+    a slot, of which there's a limited number per host. See czytacz.hosts.
+    """
+
+    __tablename__ = "host"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    tokens: Mapped[float]
+    tokens_updated: Mapped[datetime.datetime]
+    # Set when the host asked us to back off, with a 429 or a 503.
+    paused_until: Mapped[Optional[datetime.datetime]]
+
+    # Overrides of the FETCH_HOST_* settings, for the hosts that need them.
+    rate: Mapped[Optional[float]]
+    burst: Mapped[Optional[int]]
+    max_concurrency: Mapped[Optional[int]]
+
+
+class HostSlot(Base):
+    """A fetch in progress. Expires, in case its worker never finishes it."""
+
+    __tablename__ = "host_slot"
+    __table_args__ = (Index("ix_host_slot_host", "host", "expires_at"),)
+
+    source_id: Mapped[int] = mapped_column(
+        ForeignKey("source.id", ondelete="CASCADE"), primary_key=True
+    )
+    host: Mapped[str] = mapped_column(ForeignKey("host.name", ondelete="CASCADE"))
+    expires_at: Mapped[datetime.datetime]
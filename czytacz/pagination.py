@@ -0,0 +1,48 @@
+"""Keyset pagination helpers.
+
+Pages are addressed by the sort key of the last row of the previous page,
+wrapped in an opaque cursor. Unlike OFFSET, this costs the same no matter
+how deep into the results the client is.
+"""
+
+import base64
+import datetime
+import json
+from typing import Any, Sequence
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(*values: Any) -> str:
+    payload = json.dumps([_encode_value(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, types: Sequence[type]) -> tuple[Any, ...]:
+    """Decode a cursor made by `encode_cursor`, checking its values' types."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(payload)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise InvalidCursorError()
+        return tuple(
+            (
+                datetime.datetime.fromisoformat(value)
+                if kind is datetime.datetime
+                else kind(value)
+            )
+            for value, kind in zip(values, types)
+        )
+    except (ValueError, TypeError):
+        raise InvalidCursorError()
@@ -0,0 +1,493 @@
+"""Turning feed documents into items.
+
+There are two parsers. The streaming one handles well-formed RSS and Atom,
+which is nearly everything: it goes through the document in chunks, keeps
+only the entry at hand in memory, and stops at PARSE_MAX_ENTRIES entries,
+at PARSE_MAX_BYTES, or once PARSE_STOP_AFTER_KNOWN entries in a row turned
+out to be stored and unchanged already - feeds are newest first, so what
+follows is older still. Anything it can't handle goes to feedparser, which
+copes with all kinds of broken feeds, but builds the whole document in
+memory to do so.
+
+Both sanitize HTML the same way, with nh3, so items come out the same either
+way. Dates the streaming parser can't read with the standard library send
+the document to feedparser, which knows many more formats.
+"""
+
+import datetime
+import email.utils
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+from collections.abc import Iterator, Mapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Optional, cast
+from xml.etree import ElementTree
+
+import feedparser
+import nh3
+
+from czytacz import schemas
+from czytacz.settings import settings
+
+CHUNK_SIZE = 64 * 1024
+
+ATOM = "http://www.w3.org/2005/Atom"
+CONTENT = "http://purl.org/rss/1.0/modules/content/"
+DC = "http://purl.org/dc/elements/1.1/"
+DCTERMS = "http://purl.org/dc/terms/"
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+
+ROOTS = {
+    ("", "rss"),
+    (RDF, "RDF"),
+    (ATOM, "feed"),
+}
+
+# feedparser's content types, by Atom's type attribute.
+ATOM_CONTENT_TYPES = {
+    "text": "text/plain",
+    "html": "text/html",
+    "xhtml": "application/xhtml+xml",
+}
+HTML_TYPES = {"text/html", "application/xhtml+xml"}
+
+
+class UnsupportedFeedError(Exception):
+    """The document isn't something the streaming parser can deal with."""
+
+
+class ParseTimeoutError(Exception):
+    """The parse pool didn't come back with the document in time."""
+
+
+def item_digest(item: schemas.ItemFetched) -> str:
+    """Digest of what we show of an item, to tell whether it changed.
+
+    The "updated" date is left out on purpose - some feeds bump it on every
+    request.
+    """
+    fields = item.model_dump(mode="json", exclude={"item_id", "updated"})
+    normalised = json.dumps(fields, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalised.encode()).hexdigest()
+
+
+def _date(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Parse an RFC 822 (RSS) or ISO 8601 (Atom, Dublin Core) date, as UTC."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            raise UnsupportedFeedError(f"Unrecognised date: {value}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    # feedparser's dates stop at seconds.
+    return parsed.replace(microsecond=0)
+
+
+def sanitize(html: str) -> str:
+    """Strip anything that could run or restyle the page from HTML."""
+    return nh3.clean(html, link_rel=None).strip()
+
+
+def _sanitized(value: Optional[str], content_type: str) -> Optional[str]:
+    if value is None or content_type not in HTML_TYPES:
+        return value
+    return sanitize(value)
+
+
+def _split(tag: str) -> tuple[str, str]:
+    """Namespace and local name of an ElementTree tag."""
+    if tag.startswith("{"):
+        namespace, _, local = tag[1:].partition("}")
+        return namespace, local
+    return "", tag
+
+
+def _text(element: Optional[ElementTree.Element]) -> Optional[str]:
+    if element is None:
+        return None
+    text = "".join(element.itertext()).strip()
+    return text or None
+
+
+def _html(value: Optional[str]) -> Optional[str]:
+    return _sanitized(value, "text/html")
+
+
+def _xhtml(element: ElementTree.Element) -> str:
+    # The content is wrapped in a div that isn't part of it.
+    wrapper = next(iter(element), None)
+    if wrapper is None:
+        return element.text or ""
+    for node in wrapper.iter():
+        node.tag = _split(node.tag)[1]
+    return (wrapper.text or "") + "".join(
+        ElementTree.tostring(child, encoding="unicode") for child in wrapper
+    )
+
+
+def _atom_text(element: ElementTree.Element) -> tuple[str, str]:
+    """Content type and value of an Atom text construct, sanitized."""
+    declared = element.get("type", "text")
+    content_type = ATOM_CONTENT_TYPES.get(declared, declared)
+    if content_type == "application/xhtml+xml":
+        value = _xhtml(element)
+    else:
+        value = "".join(element.itertext())
+    if content_type in HTML_TYPES:
+        value = sanitize(value)
+    return content_type, value.strip()
+
+
+def _children(element: ElementTree.Element) -> dict[tuple[str, str], Any]:
+    """First child of each name - all of them for links and contents."""
+    children: dict[tuple[str, str], Any] = {}
+    for child in element:
+        name = _split(child.tag)
+        if name[1] in ("link", "content"):
+            children.setdefault(name, []).append(child)
+        else:
+            children.setdefault(name, child)
+    return children
+
+
+def _rss_item(element: ElementTree.Element) -> Optional[schemas.ItemFetched]:
+    children = _children(element)
+    namespace = _split(element.tag)[0]
+    links = children.get((namespace, "link"), []) + children.get((ATOM, "link"), [])
+    link = next(
+        (
+            _text(candidate) or candidate.get("href")
+            for candidate in links
+            if candidate.get("rel", "alternate") == "alternate"
+        ),
+        None,
+    )
+    item_id = (
+        _text(children.get((namespace, "guid")))
+        or element.get(f"{{{RDF}}}about")
+        or link
+    )
+    if item_id is None:
+        return None
+
+    description = _text(children.get((namespace, "description")))
+    encoded = _text(children.get((CONTENT, "encoded")))
+    published = _date(_text(children.get((namespace, "pubDate")))) or _date(
+        _text(children.get((DCTERMS, "issued")))
+    )
+    return schemas.ItemFetched(
+        item_id=item_id,
+        title=_text(children.get((namespace, "title"))),
+        link=link,
+        author=_text(children.get((namespace, "author")))
+        or _text(children.get((DC, "creator"))),
+        summary=_html(description),
+        published=published,
+        # Most RSS only has pubDate, which is as good as it gets - feedparser
+        # does the same.
+        updated=_date(_text(children.get((DC, "date"))))
+        or _date(_text(children.get((DCTERMS, "modified"))))
+        or published,
+        content=(
+            [schemas.ItemContent(content_type="text/html", value=_html(encoded))]
+            if encoded is not None
+            else []
+        ),
+    )
+
+
+def _atom_entry(element: ElementTree.Element) -> Optional[schemas.ItemFetched]:
+    children = _children(element)
+    link = next(
+        (
+            candidate.get("href")
+            for candidate in children.get((ATOM, "link"), [])
+            if candidate.get("rel", "alternate") == "alternate"
+        ),
+        None,
+    )
+    item_id = _text(children.get((ATOM, "id"))) or link
+    if item_id is None:
+        return None
+
+    title = children.get((ATOM, "title"))
+    summary = children.get((ATOM, "summary"))
+    author = children.get((ATOM, "author"))
+    published = _date(_text(children.get((ATOM, "published"))))
+    contents = []
+    for content in children.get((ATOM, "content"), []):
+        if content.get("src") is not None:
+            continue
+        content_type, value = _atom_text(content)
+        contents.append(schemas.ItemContent(content_type=content_type, value=value))
+    return schemas.ItemFetched(
+        item_id=item_id,
+        title=_atom_text(title)[1] if title is not None else None,
+        link=link,
+        author=(_text(author.find(f"{{{ATOM}}}name")) if author is not None else None),
+        summary=_atom_text(summary)[1] if summary is not None else None,
+        published=published,
+        updated=_date(_text(children.get((ATOM, "updated")))) or published,
+        content=contents,
+    )
+
+
+def _chunks(body: bytes, max_bytes: int) -> Iterator[memoryview]:
+    view = memoryview(body)[:max_bytes]
+    for start in range(0, len(view), CHUNK_SIZE):
+        yield view[start : start + CHUNK_SIZE]
+
+
+def parse_stream(
+    body: bytes,
+    known: Mapping[str, str] = {},
+    max_bytes: Optional[int] = None,
+    max_entries: Optional[int] = None,
+    stop_after_known: Optional[int] = None,
+) -> schemas.ParsedFeed:
+    """Parse an RSS or Atom document incrementally.
+
+    `known` maps the IDs of stored items to their digests. Raises
+    UnsupportedFeedError for anything that isn't well-formed RSS or Atom.
+    """
+    if max_bytes is None:
+        max_bytes = settings.PARSE_MAX_BYTES
+    if max_entries is None:
+        max_entries = settings.PARSE_MAX_ENTRIES
+    if stop_after_known is None:
+        stop_after_known = settings.PARSE_STOP_AFTER_KNOWN
+
+    result = schemas.ParsedFeed()
+    parser: ElementTree.XMLPullParser[ElementTree.Element] = ElementTree.XMLPullParser(
+        events=("start", "end")
+    )
+    stack: list[ElementTree.Element] = []
+    known_in_a_row = 0
+
+    try:
+        for chunk in _chunks(body, max_bytes):
+            parser.feed(chunk)
+            # Start and end events always come with an element, the rest are
+            # for namespace events we don't ask for.
+            events = cast(
+                Iterator[tuple[str, ElementTree.Element]], parser.read_events()
+            )
+            for event, element in events:
+                namespace, name = _split(element.tag)
+                if event == "start":
+                    if not stack and (namespace, name) not in ROOTS:
+                        raise UnsupportedFeedError(element.tag)
+                    stack.append(element)
+                    continue
+
+                stack.pop()
+                if name in ("item", "entry"):
+                    item = (
+                        _atom_entry(element)
+                        if namespace == ATOM
+                        else _rss_item(element)
+                    )
+                    # Done with it - this is what keeps the memory flat.
+                    element.clear()
+                    if stack:
+                        stack[-1].remove(element)
+                    if item is None:
+                        continue
+
+                    result.items.append(item)
+                    if known.get(item.item_id) == item_digest(item):
+                        known_in_a_row += 1
+                    else:
+                        known_in_a_row = 0
+                    if len(result.items) >= max_entries or (
+                        stop_after_known and known_in_a_row >= stop_after_known
+                    ):
+                        result.truncated = True
+                        return result
+                elif len(stack) <= 2 and not any(
+                    _split(parent.tag)[1] in ("item", "entry") for parent in stack
+                ):
+                    _feed_element(result, namespace, name, element)
+        if len(body) > max_bytes:
+            # Whatever we've got until the cap will do.
+            result.truncated = True
+            return result
+        parser.close()
+    except ElementTree.ParseError as e:
+        raise UnsupportedFeedError(str(e)) from e
+    return result
+
+
+def _feed_element(
+    result: schemas.ParsedFeed,
+    namespace: str,
+    name: str,
+    element: ElementTree.Element,
+):
+    """Pick up what we care about of the feed itself."""
+    if name == "ttl":
+        ttl = _text(element) or ""
+        result.ttl = int(ttl) if ttl.isdigit() else None
+    elif name == "skipHours":
+        result.skip_hours = sorted(
+            {
+                int(hour) % 24
+                for hour in (_text(child) for child in element)
+                if hour is not None and hour.isdigit()
+            }
+        )
+    elif namespace == ATOM and name == "link":
+        rel = element.get("rel")
+        if rel == "hub":
+            result.hub = element.get("href")
+        elif rel == "self":
+            result.self_url = element.get("href")
+
+
+def _detail(feed_item: Any, key: str) -> Optional[str]:
+    # feedparser's own sanitizing is off, see parse_feedparser.
+    detail = feed_item.get(f"{key}_detail") or {}
+    return _sanitized(feed_item.get(key), detail.get("type", "text/plain"))
+
+
+def process_item(feed_item: Any) -> schemas.ItemFetched:
+    published_parsed = feed_item.get("published_parsed")
+    updated_parsed = feed_item.get("updated_parsed")
+    return schemas.ItemFetched(
+        item_id=feed_item.id,
+        title=_detail(feed_item, "title"),
+        link=feed_item.get("link"),
+        author=feed_item.get("author"),
+        summary=_detail(feed_item, "summary"),
+        published=(
+            datetime.datetime(*published_parsed[:6])
+            if published_parsed is not None
+            else None
+        ),
+        updated=(
+            datetime.datetime(*updated_parsed[:6])
+            if updated_parsed is not None
+            else None
+        ),
+        content=[
+            schemas.ItemContent(
+                content_type=feed_content.type,
+                value=_sanitized(feed_content.value, feed_content.type),
+            )
+            for feed_content in feed_item.get("content", [])
+        ],
+    )
+
+
+_SKIP_HOURS = re.compile(rb"<skipHours>(.*?)</skipHours>", re.DOTALL)
+_HOUR = re.compile(rb"<hour>\s*(\d+)\s*</hour>")
+
+
+def _skip_hours(body: bytes) -> list[int]:
+    # feedparser keeps only the last <hour> of these, so we look ourselves.
+    match = _SKIP_HOURS.search(body)
+    if match is None:
+        return []
+    return sorted({int(hour) % 24 for hour in _HOUR.findall(match.group(1))})
+
+
+def parse_feedparser(body: bytes, headers: Mapping[str, str]) -> schemas.ParsedFeed:
+    """Parse anything, whole, with feedparser."""
+    # Sanitized by us, like the streaming parser does.
+    parsed = feedparser.parse(body, response_headers=dict(headers), sanitize_html=False)
+    feed = parsed.get("feed", {})
+    ttl = feed.get("ttl", "")
+    links = feed.get("links", [])
+    return schemas.ParsedFeed(
+        items=[
+            process_item(entry)
+            for entry in parsed.get("entries", [])
+            if entry.get("id") is not None
+        ],
+        ttl=int(ttl) if ttl.strip().isdigit() else None,
+        skip_hours=_skip_hours(body),
+        hub=next((link.href for link in links if link.get("rel") == "hub"), None),
+        self_url=next((link.href for link in links if link.get("rel") == "self"), None),
+    )
+
+
+def parse(
+    body: bytes, headers: Mapping[str, str], known: Mapping[str, str] = {}
+) -> schemas.ParsedFeed:
+    """Parse a feed document, streaming it if possible."""
+    try:
+        return parse_stream(body, known)
+    except UnsupportedFeedError:
+        return parse_feedparser(body, headers)
+
+
+_lock = threading.Lock()
+_pool: Optional[ProcessPoolExecutor] = None
+_pid: Optional[int] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """Return the parse pool of this process, starting it on first use."""
+    global _pool, _pid
+
+    pid = os.getpid()
+    if _pool is not None and _pid == pid:
+        return _pool
+
+    with _lock:
+        if _pool is None or _pid != pid:
+            # Not forked - the fetching side is likely to be running threads.
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pid = pid
+    return _pool
+
+
+def _reset_pool(broken: ProcessPoolExecutor):
+    global _pool
+    with _lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def run(
+    body: bytes, headers: Mapping[str, str], known: Mapping[str, str] = {}
+) -> schemas.ParsedFeed:
+    """Parse in the pool, if there is one, or right here otherwise.
+
+    Parsing is the CPU-heavy part of fetching. With PARSE_WORKERS set, it
+    runs in that many processes, and the threads doing the I/O only wait for
+    the results - for up to PARSE_TIMEOUT, then ParseTimeoutError is raised.
+    """
+    if settings.PARSE_WORKERS <= 0:
+        return parse(body, headers, known)
+
+    pool = get_pool()
+    future = pool.submit(parse, body, dict(headers), dict(known))
+    try:
+        return future.result(timeout=settings.PARSE_TIMEOUT)
+    except TimeoutError:
+        # Nobody waits for it anymore, though a parser that has started
+        # finishes in its own time - the size caps keep that bounded, and
+        # killing it would take the other parses in the pool down with it.
+        future.cancel()
+        raise ParseTimeoutError()
+    except BrokenProcessPool:
+        # A parser died, most likely killed for its memory use. Whoever is
+        # next gets a fresh pool.
+        _reset_pool(pool)
+        raise
@@ -0,0 +1,186 @@
+"""Query plan checks.
+
+Runs EXPLAIN on the queries behind the API and the scheduler, and reports
+any that scan a whole table. The planner happily seq-scans small tables, so
+by default the check seeds a realistic amount of data first - inside a
+transaction that gets rolled back at the end.
+"""
+
+import datetime
+from collections.abc import Callable, Iterator
+from typing import Any
+
+from sqlalchemy import ClauseElement, text
+from sqlalchemy.orm import Session
+
+from czytacz import feeds, search, sync, tasks, websub
+
+SEED_PREFIX = "plan-check"
+
+SEED_STATEMENTS = [
+    """
+    INSERT INTO "user" (email)
+    SELECT :prefix || '-' || g || '@example.invalid'
+    FROM generate_series(1, :users) AS g
+    """,
+    # Nearly everything was fetched recently; every 50th source is due.
+    """
+    INSERT INTO source (url, status, last_fetch, next_fetch_at)
+    SELECT
+        'https://' || :prefix || '-' || g || '.example.com/feed',
+        'OK',
+        now() - interval '1 hour',
+        CASE WHEN g % 50 = 0
+            THEN now() - interval '1 minute'
+            ELSE now() + interval '1 hour'
+        END
+    FROM generate_series(1, :sources) AS g
+    """,
+    # Every source has a couple of subscribers.
+    """
+    INSERT INTO feed (user_id, name, source_id)
+    SELECT u.id, 'Feed', s.id
+    FROM (
+        SELECT id, row_number() OVER (ORDER BY id) AS n
+        FROM "user" WHERE email LIKE :prefix || '-%'
+    ) AS u
+    JOIN (
+        SELECT id, row_number() OVER (ORDER BY id) AS n
+        FROM source WHERE url LIKE 'https://' || :prefix || '-%'
+    ) AS s ON s.n % 50 = u.n % 50
+    """,
+    """
+    INSERT INTO item (source_id, item_id, first_seen, title, updated, search)
+    SELECT s.id, s.id || '-' || g, now(), 'Item ' || g,
+        now() - g * interval '1 hour', to_tsvector('simple', 'Item ' || g)
+    FROM source AS s
+    CROSS JOIN generate_series(1, :items) AS g
+    WHERE s.url LIKE 'https://' || :prefix || '-%'
+    """,
+    # Mostly read, like a real reader's backlog.
+    """
+    INSERT INTO entry (feed_id, item_id, user_id, updated, read)
+    SELECT f.id, i.id, f.user_id, i.updated, random() < 0.9
+    FROM feed AS f
+    JOIN item AS i ON i.source_id = f.source_id
+    JOIN "user" AS u ON u.id = f.user_id
+    WHERE u.email LIKE :prefix || '-%'
+    """,
+]
+
+ANALYZED_TABLES = ["user", "source", "feed", "item", "entry"]
+
+
+def seed(db: Session, users: int, sources: int, items: int):
+    for statement in SEED_STATEMENTS:
+        db.execute(
+            text(statement),
+            {"prefix": SEED_PREFIX, "users": users, "sources": sources, "items": items},
+        )
+    for table in ANALYZED_TABLES:
+        db.execute(text(f'ANALYZE "{table}"'))
+
+
+def _sample_ids(db: Session) -> dict[str, Any]:
+    """Pick a user and a feed in the middle of the data to query for."""
+    row = db.execute(text("""
+        SELECT f.user_id, f.id AS feed_id, e.updated, e.item_id
+        FROM feed AS f
+        JOIN entry AS e ON e.feed_id = f.id
+        ORDER BY f.id, e.updated DESC
+        OFFSET (SELECT count(*) / 2 FROM entry)
+        LIMIT 1
+        """)).one_or_none()
+    if row is None:
+        raise LookupError("No data to check the plans against, try seeding")
+    return row._asdict()
+
+
+def checked_queries(sample: dict[str, Any]) -> dict[str, Callable[[], ClauseElement]]:
+    """Build the queries to check, named by where they come from."""
+    user_id = sample["user_id"]
+    feed_id = sample["feed_id"]
+    after = (sample["updated"], sample["item_id"])
+    return {
+        "feeds.get_user_feeds": lambda: feeds.select_user_feeds(user_id, None, 51),
+        "feeds.get_user_feeds (cursor)": lambda: feeds.select_user_feeds(
+            user_id, feed_id, 51
+        ),
+        "feeds.get_feed": lambda: feeds.select_feed(user_id, feed_id),
+        "feeds.get_feed (version)": lambda: feeds.select_feed_version(user_id, feed_id),
+        "feeds.get_feed (items)": lambda: feeds.select_feed_items(
+            feed_id, None, None, 51
+        ),
+        "feeds.get_feed (unread items)": lambda: feeds.select_feed_items(
+            feed_id, False, None, 51
+        ),
+        "feeds.get_feed (items, cursor)": lambda: feeds.select_feed_items(
+            feed_id, None, after, 51
+        ),
+        "feeds.get_user_items": lambda: feeds.select_user_items(
+            user_id, None, None, None, 51
+        ),
+        "feeds.get_user_items (unread)": lambda: feeds.select_user_items(
+            user_id, False, None, None, 51
+        ),
+        "feeds.get_user_items (cursor)": lambda: feeds.select_user_items(
+            user_id, None, None, (*after, feed_id), 51
+        ),
+        "feeds.get_user_items (feeds)": lambda: feeds.select_user_items(
+            user_id, None, [feed_id], None, 51
+        ),
+        "search.search_items": lambda: search.select_search(
+            user_id, "item", None, None, 51
+        ),
+        "search.search_items (feed)": lambda: search.select_search(
+            user_id, "item", feed_id, None, 51
+        ),
+        "sync.get_changes": lambda: sync.select_changes(user_id, 0, 2**62, 51),
+        "tasks.queue_feeds": lambda: tasks.claim_due_sources(
+            datetime.datetime.now(), 100
+        ),
+        "tasks.queue_feeds (leases)": lambda: tasks.reclaim_expired_leases(
+            datetime.datetime.now()
+        ),
+        "tasks.renew_subscriptions": lambda: websub.claim_renewals(
+            datetime.datetime.now(), 100
+        ),
+    }
+
+
+def _walk(plan: dict[str, Any]) -> Iterator[dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _walk(child)
+
+
+def explain(db: Session, query: ClauseElement) -> dict[str, Any]:
+    compiled = query.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True}
+    )
+    result = db.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    )
+    return result.scalar_one()[0]["Plan"]
+
+
+def sequential_scans(plan: dict[str, Any]) -> list[str]:
+    return [
+        node["Relation Name"] for node in _walk(plan) if node["Node Type"] == "Seq Scan"
+    ]
+
+
+def check(db: Session, missing_indexes: bool = False) -> dict[str, list[str]]:
+    """Return the tables each query scans sequentially.
+
+    With `missing_indexes`, sequential scans are made as expensive as they
+    get, so that the planner only picks one where no index can serve the
+    query - that doesn't depend on how much data there is, but says nothing
+    about whether the planner would really use the index.
+    """
+    if missing_indexes:
+        db.execute(text("SET LOCAL enable_seqscan = off"))
+    queries = checked_queries(_sample_ids(db))
+    return {
+        name: sequential_scans(explain(db, build())) for name, build in queries.items()
+    }
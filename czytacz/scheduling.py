@@ -0,0 +1,169 @@
+"""When to fetch a source next.
+
+Every source gets its own fetch interval, which follows how often it
+actually posts: it shrinks towards the gaps between recent items, and grows
+while nothing changes. Servers get a say through Cache-Control, Expires and
+Retry-After, and feeds through RSS' <ttl> and <skipHours>. The result is
+jittered, so that sources added together don't stay in lockstep.
+"""
+
+import datetime
+import email.utils
+import random
+import re
+import statistics
+from collections.abc import Iterable, Mapping
+from typing import Optional
+
+from czytacz.settings import settings
+
+# Consecutive failures to wait for before giving up on a source, and how long
+# to wait after each. I would actually use exponential back-off, but I'm
+# following the specification. I'm keeping the jitter, though.
+RETRY_DELAYS = [120, 300, 480]
+
+# How many recent items the posting interval is estimated from.
+POSTING_SAMPLE = 10
+# Growth of the interval for every fetch that brings nothing new.
+QUIET_GROWTH = 1.5
+
+_MAX_AGE = re.compile(r"(?:^|,)\s*(s-maxage|max-age)\s*=\s*\"?(\d+)", re.IGNORECASE)
+_NO_CACHE = re.compile(r"(?:^|,)\s*(no-cache|no-store)\b", re.IGNORECASE)
+
+
+def _clamp(interval: float) -> float:
+    return min(max(interval, settings.FETCH_MIN_INTERVAL), settings.FETCH_MAX_INTERVAL)
+
+
+def _http_date(value: Optional[str]) -> Optional[datetime.datetime]:
+    if value is None:
+        return None
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+
+def cache_lifetime(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds the response stays fresh for, if the server says so.
+
+    Expects lowercase header names, like http_client.Response has.
+    """
+    cache_control = headers.get("cache-control", "")
+    if _NO_CACHE.search(cache_control):
+        return 0
+
+    max_age = None
+    for directive, value in _MAX_AGE.findall(cache_control):
+        # s-maxage is meant for shared caches - which we pretty much are.
+        if max_age is None or directive.lower() == "s-maxage":
+            max_age = float(value)
+    if max_age is not None:
+        age = headers.get("age", "")
+        return max(max_age - (float(age) if age.isdigit() else 0), 0)
+
+    expires = _http_date(headers.get("expires"))
+    if expires is None:
+        return None
+    date = _http_date(headers.get("date")) or datetime.datetime.now(
+        datetime.timezone.utc
+    )
+    return max((expires - date).total_seconds(), 0)
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    when = _http_date(value)
+    if when is None:
+        return None
+    return max((when - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0)
+
+
+def posting_interval(dates: Iterable[datetime.datetime]) -> Optional[float]:
+    """Median gap between the most recent items, in seconds."""
+    recent = sorted(set(dates), reverse=True)[:POSTING_SAMPLE]
+    if len(recent) < 2:
+        return None
+    return statistics.median(
+        (newer - older).total_seconds() for newer, older in zip(recent, recent[1:])
+    )
+
+
+def fetch_interval(
+    previous: Optional[float],
+    changed: bool,
+    dates: Iterable[datetime.datetime] = (),
+) -> float:
+    """Pick the interval to keep for a source after a successful fetch."""
+    if previous is None:
+        previous = settings.FETCH_DEFAULT_INTERVAL
+    if not changed:
+        return _clamp(previous * QUIET_GROWTH)
+
+    observed = posting_interval(dates)
+    if observed is None:
+        return _clamp(previous)
+    # Checking twice per posting interval keeps us reasonably fresh.
+    return _clamp(observed / 2)
+
+
+def _skip_hours(
+    when: datetime.datetime, skip_hours: Iterable[int]
+) -> datetime.datetime:
+    skipped = set(skip_hours)
+    if len(skipped) >= 24:
+        return when
+    # skipHours are in GMT, our timestamps are naive local time - and not
+    # every zone is a whole number of hours off.
+    utc = when.astimezone(datetime.timezone.utc)
+    if utc.hour not in skipped:
+        return when
+    while utc.hour in skipped:
+        utc = utc.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(
+            hours=1
+        )
+    return utc.astimezone().replace(tzinfo=None)
+
+
+def next_fetch_at(
+    now: datetime.datetime,
+    interval: float,
+    lifetime: Optional[float] = None,
+    ttl: Optional[int] = None,
+    skip_hours: Iterable[int] = (),
+) -> datetime.datetime:
+    """When to fetch a source that was fetched fine at `now`.
+
+    `lifetime` is what the server gave as cache lifetime, `ttl` is the feed's
+    <ttl> in minutes. Both can only push the fetch later, up to the maximum
+    interval.
+    """
+    for hint in (lifetime, ttl * 60 if ttl is not None else None):
+        if hint is not None:
+            interval = max(interval, min(hint, settings.FETCH_MAX_INTERVAL))
+    jitter = settings.FETCH_JITTER
+    interval *= random.uniform(1 - jitter, 1 + jitter)
+    return _skip_hours(now + datetime.timedelta(seconds=interval), skip_hours)
+
+
+def retry_at(
+    now: datetime.datetime, failure_count: int, after: Optional[float] = None
+) -> Optional[datetime.datetime]:
+    """When to retry a source that failed `failure_count` times in a row.
+
+    None means it's time to give up.
+    """
+    if failure_count > len(RETRY_DELAYS):
+        return None
+    delay: float = RETRY_DELAYS[failure_count - 1]
+    if after is not None:
+        delay = max(delay, min(after, settings.FETCH_MAX_INTERVAL))
+    delay *= random.uniform(1, 1 + settings.FETCH_JITTER)
+    return now + datetime.timedelta(seconds=delay)
@@ -2,27 +2,58 @@ from __future__ import annotations
 
 import datetime
 import enum
-from typing import Optional, Annotated
+import functools
+from typing import Generic, Optional, Annotated, TypeVar
 
-from pydantic import BaseModel, HttpUrl, AfterValidator
+from pydantic import AfterValidator, BaseModel, Field, HttpUrl, ValidationInfo
 
 import tldextract
 from czytacz import FeedStatus
 
-
-def ensure_public(url: HttpUrl) -> HttpUrl:
-    # This can be sometimes slow
-    extracted = tldextract.extract(str(url), include_psl_private_domains=True)
-    assert not extracted.is_private, f"{url} is not a public URL"
-    assert bool(extracted.suffix), f"{url} doesn't have a suffix"
-    assert bool(extracted.domain), f"{url} doesn't have a domain"
-    assert bool(extracted.fqdn), f"{url} is not an fqdn"
-
+# The snapshot of the Public Suffix List that comes with tldextract - never
+# fetched over the network, and loaded once, right here.
+_tld_extract = tldextract.TLDExtract(
+    suffix_list_urls=(), cache_dir=None, include_psl_private_domains=True
+)
+_tld_extract("example.com")
+
+TRUSTED = {"trusted": True}
+"""Validation context for data from our own database, checked on the way in."""
+
+
+@functools.lru_cache(maxsize=10_000)
+def _host_problem(host: str) -> Optional[str]:
+    extracted = _tld_extract(host)
+    if extracted.is_private:
+        return "is not a public URL"
+    if not extracted.suffix:
+        return "doesn't have a suffix"
+    if not extracted.domain:
+        return "doesn't have a domain"
+    if not extracted.fqdn:
+        return "is not an fqdn"
+    return None
+
+
+def ensure_public(url: HttpUrl, info: ValidationInfo) -> HttpUrl:
+    if info.context is not None and info.context.get("trusted"):
+        return url
+
+    problem = _host_problem((url.host or "").lower())
+    assert problem is None, f"{url} {problem}"
     return url
 
 
 PublicUrl = Annotated[HttpUrl, AfterValidator(ensure_public)]
 
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T]
+    next_cursor: Optional[str] = None
+    """Pass as `cursor` to get the next page. Missing on the last page."""
+
 
 class ItemContent(BaseModel):
     content_type: str
@@ -36,15 +67,16 @@ class ItemBase(BaseModel):
     author: Optional[str]
     summary: Optional[str]
     published: Optional[datetime.datetime]
-    
-    content: list[ItemContent] = []
 
 
 class ItemFetched(ItemBase):
     updated: Optional[datetime.datetime]
+    content: list[ItemContent] = []
 
 
 class Item(ItemBase):
+    """An item as listed - everything but the content."""
+
     id: int
     updated: datetime.datetime
     read: bool = False
@@ -52,9 +84,57 @@ class Item(ItemBase):
     class Config:
         from_attributes = True
 
+
+class ItemWithContent(Item):
+    content: list[ItemContent] = []
+
+
+class ItemInFeed(Item):
+    feed_id: int
+
+
+class SearchResult(ItemInFeed):
+    rank: float
+
+
+class ChangedItem(ItemInFeed):
+    change_seq: int
+    content: list[ItemContent] = []
+
+
+class Changes(BaseModel):
+    items: list[ChangedItem]
+    since: int
+    """Pass as `since` next time."""
+    more: bool
+    """Whether there's more to get right away."""
+
+
 class ItemForUpdate(BaseModel):
     read: Optional[bool]
 
+
+class ItemsForUpdate(BaseModel):
+    item_ids: Annotated[list[int], Field(min_length=1, max_length=1000)]
+    read: bool = True
+
+
+class MarkRead(BaseModel):
+    """Marks items as read.
+
+    Everything, or only what's older than `until`, or what came before
+    `cursor` - a cursor of the listing the client is paging through. With
+    both, both apply.
+    """
+
+    until: Optional[datetime.datetime] = None
+    cursor: Optional[str] = None
+
+
+class UpdatedCount(BaseModel):
+    updated: int
+
+
 class FeedBase(BaseModel):
     name: Optional[str]
     source: PublicUrl
@@ -69,31 +149,59 @@ class Feed(FeedBase):
     user_id: int
     status: Optional[FeedStatus]
     last_fetch: Optional[datetime.datetime]
+    item_count: int = 0
+    unread_count: int = 0
 
     items: list[Item] = []
+    next_cursor: Optional[str] = None
+    """Pass as `cursor` to get the next page of items."""
 
     class Config:
         from_attributes = True
 
 
-class FeedForFetch(FeedBase):
+class Source(BaseModel):
     id: int
-    etag: Optional[str]
-    last_modified: Optional[str]
+    url: str
+    actual_url: Optional[str]
+    status: Optional[FeedStatus]
+    last_fetch: Optional[datetime.datetime]
 
     class Config:
         from_attributes = True
 
 
+class SourceForFetch(BaseModel):
+    id: int
+    source: PublicUrl
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_digest: Optional[str] = None
+    known_items: dict[str, str] = {}
+    """Digests of stored items by their IDs, for parsing to stop early"""
+
+
 class FeedForList(FeedBase):
     id: int
-    status: FeedStatus
-    last_fetch: datetime.datetime
+    status: Optional[FeedStatus]
+    last_fetch: Optional[datetime.datetime]
+    item_count: int = 0
+    unread_count: int = 0
 
     class Config:
         from_attributes = True
 
 
+class ParsedFeed(BaseModel):
+    items: list[ItemFetched] = []
+    truncated: bool = False
+    """Whether parsing stopped before the end of the document."""
+    ttl: Optional[int] = None
+    skip_hours: list[int] = []
+    hub: Optional[str] = None
+    self_url: Optional[str] = None
+
+
 class FeedFetchStatus(enum.Enum):
     FETCHED = enum.auto()
     PERMANENT_REDIRECT = enum.auto()
@@ -118,9 +226,24 @@ class FeedFetchResult(BaseModel):
     status: FeedFetchStatus
     etag: Optional[str]
     last_modified: Optional[str]
+    content_digest: Optional[str] = None
+    """sha256 of the body, set whenever one was downloaded."""
+    cache_lifetime: Optional[float] = None
+    retry_after: Optional[float] = None
+    ttl: Optional[int] = None
+    """RSS <ttl>, in minutes."""
+    skip_hours: Optional[list[int]] = None
+    hub: Optional[str] = None
+    """WebSub hub the feed links to."""
+    self_url: Optional[str] = None
     items: list[ItemFetched] = []
 
 
+class ItemUpsertResult(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -128,6 +251,8 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: str | None = None
+    user_id: int | None = None
+    expires: datetime.datetime | None = None
 
 
 class UserBase(BaseModel):
@@ -0,0 +1,158 @@
+"""Full-text search over the items in a user's feeds.
+
+Every item has a tsvector of its title, summary and content - weighted in
+that order - in item.search, behind a GIN index. The fetcher refreshes it
+for the items it writes, in the same transaction, so it never goes stale.
+"""
+
+from collections.abc import Collection, Iterator, Sequence
+from typing import Optional
+
+from sqlalchemy import (
+    ColumnElement,
+    Row,
+    Select,
+    cast,
+    func,
+    literal,
+    literal_column,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects.postgresql import JSONPATH, REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from czytacz import models
+from czytacz.feeds import ITEM_COLUMNS
+from czytacz.pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor
+from czytacz.settings import settings
+
+
+def _config() -> ColumnElement:
+    return cast(literal(settings.SEARCH_CONFIG), REGCONFIG)
+
+
+def _weight(weight: str) -> ColumnElement:
+    # setweight takes a "char", which a bound parameter - a varchar, as far
+    # as Postgres is told - doesn't turn into by itself.
+    return literal_column(f"'{weight}'::\"char\"")
+
+
+def document() -> ColumnElement:
+    """Build the tsvector of an item, for a query joining item and item_content."""
+    config = _config()
+    return (
+        func.setweight(
+            func.to_tsvector(config, func.coalesce(models.Item.title, "")), _weight("A")
+        )
+        .op("||")(
+            func.setweight(
+                func.to_tsvector(config, func.coalesce(models.Item.summary, "")),
+                _weight("B"),
+            )
+        )
+        .op("||")(
+            # Only the values: the jsonb flavour of to_tsvector skips keys, and
+            # the default parser skips HTML tags.
+            func.setweight(
+                func.to_tsvector(
+                    config,
+                    func.jsonb_path_query_array(
+                        models.ItemContent.content,
+                        cast(literal("$[*].value"), JSONPATH),
+                    ),
+                ),
+                _weight("C"),
+            )
+        )
+    )
+
+
+def update_documents(db: Session, item_ids: Collection[int]):
+    """Refresh the search vectors of the given items, after they were written."""
+    if not item_ids:
+        return
+    db.execute(
+        update(models.Item)
+        .where(
+            models.Item.id == models.ItemContent.item_id,
+            models.Item.id.in_(item_ids),
+        )
+        .values(search=document())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reindex(db: Session, batch_size: int) -> Iterator[int]:
+    """Refresh every item's search vector, a batch at a time.
+
+    Yields the number of items done after every batch.
+    """
+    done = 0
+    last_id = 0
+    while True:
+        item_ids = db.scalars(
+            select(models.Item.id)
+            .where(models.Item.id > last_id)
+            .order_by(models.Item.id)
+            .limit(batch_size)
+        ).all()
+        if not item_ids:
+            return
+        update_documents(db, item_ids)
+        db.commit()
+        done += len(item_ids)
+        last_id = item_ids[-1]
+        yield done
+
+
+def select_search(
+    user_id: int,
+    query: str,
+    feed_id: Optional[int],
+    after: Optional[tuple[float, int, int]],
+    limit: int,
+) -> Select:
+    tsquery = func.websearch_to_tsquery(_config(), query)
+    rank = func.ts_rank_cd(models.Item.search, tsquery).label("rank")
+    statement = (
+        select(*ITEM_COLUMNS, models.Entry.feed_id, rank)
+        .select_from(models.Entry)
+        .join(models.Entry.item)
+        .where(models.Entry.user_id == user_id, models.Item.search.op("@@")(tsquery))
+    )
+    if feed_id is not None:
+        statement = statement.where(models.Entry.feed_id == feed_id)
+    if after is not None:
+        statement = statement.where(
+            tuple_(rank, models.Entry.item_id, models.Entry.feed_id) < after
+        )
+    # The same item can be in more than one of the user's feeds, hence the
+    # feed in the sort key.
+    return statement.order_by(
+        rank.desc(), models.Entry.item_id.desc(), models.Entry.feed_id.desc()
+    ).limit(limit)
+
+
+async def search_rows(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    feed_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+) -> tuple[Sequence[Row], Optional[str]]:
+    """Get a page of the user's items matching `query`, best first, and the cursor.
+
+    The query has web search syntax: quotes, "or", and a minus for "not".
+    """
+    after = decode_cursor(cursor, (float, int, int)) if cursor is not None else None
+    items = (
+        await db.execute(select_search(user_id, query, feed_id, after, limit + 1))
+    ).all()
+    last = items[limit - 1] if len(items) > limit else None
+    return items[:limit], (
+        encode_cursor(last.rank, last.id, last.feed_id) if last is not None else None
+    )
@@ -13,6 +13,81 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     SQLALCHEMY_DATABASE_URI: Optional[PostgresDsn] = None
 
+    # Connection pool, per process. Mind that API replicas and worker
+    # processes add up - Postgres' max_connections has to cover all of them.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Bearer token for /monitoring/pool, which shows the pools of the process
+    # serving the request. Unset, the endpoint isn't there.
+    MONITORING_TOKEN: Optional[str] = None
+    # Workers have no endpoint, they log their pools instead - between tasks,
+    # at most every this many seconds. 0 turns that off.
+    DB_POOL_LOG_INTERVAL: float = 300
+
+    # Signs bearer tokens. Must be the same for every API replica.
+    SECRET_KEY: str
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
+    # Successful Basic authentications are remembered for this long, so that
+    # argon2 doesn't run on every request.
+    CREDENTIAL_CACHE_TTL: int = 60
+    CREDENTIAL_CACHE_SIZE: int = 10_000
+
+    # Feed downloads. Pools are per host, NUM_POOLS is how many hosts we keep
+    # connections to.
+    FETCH_CONNECT_TIMEOUT: float = 10
+    FETCH_READ_TIMEOUT: float = 30
+    FETCH_MAX_BYTES: int = 10 * 1024 * 1024
+    FETCH_NUM_POOLS: int = 100
+    FETCH_POOL_MAXSIZE: int = 4
+    FETCH_USER_AGENT: str = "czytacz/0.1"
+
+    # Fetch scheduling, in seconds. Every source's interval stays between the
+    # minimum and the maximum, and is randomly stretched by up to JITTER.
+    FETCH_MIN_INTERVAL: int = 5 * 60
+    FETCH_MAX_INTERVAL: int = 24 * 60 * 60
+    FETCH_DEFAULT_INTERVAL: int = 60 * 60
+    FETCH_JITTER: float = 0.1
+    # Schedulers claim due sources in batches, and a claim lasts for LEASE
+    # seconds - if the fetch isn't done by then, the source is up for grabs.
+    FETCH_CLAIM_BATCH: int = 100
+    FETCH_LEASE: int = 10 * 60
+    # Politeness, per host and across all workers: a token bucket refilled at
+    # RATE fetches a second up to BURST, and at most CONCURRENCY fetches at
+    # once. Hosts can be given their own limits in the host table.
+    FETCH_HOST_RATE: float = 0.5
+    FETCH_HOST_BURST: int = 5
+    FETCH_HOST_CONCURRENCY: int = 2
+
+    # Parsing stops after this many bytes or entries, or after this many
+    # entries in a row that are stored already (0 to never stop early).
+    PARSE_MAX_BYTES: int = 10 * 1024 * 1024
+    PARSE_MAX_ENTRIES: int = 500
+    PARSE_STOP_AFTER_KNOWN: int = 10
+    # Processes to parse in, apart from the ones doing the I/O. With 0,
+    # parsing happens in the fetching thread. With workers, a document that
+    # takes longer than TIMEOUT seconds (waiting for a worker included) is
+    # given up on, and the source tried again later.
+    PARSE_WORKERS: int = 0
+    PARSE_TIMEOUT: float = 60
+
+    # Text search configuration items are indexed and searched with, "simple"
+    # works for any language. Changing it takes re-indexing: `czytacz
+    # reindex-search`.
+    SEARCH_CONFIG: str = "simple"
+
+    # Where hubs can reach the API, for WebSub callbacks - without it, sources
+    # are only ever polled. Subscriptions are asked for LEASE seconds, and
+    # sources with one are still polled every POLL_INTERVAL, just in case.
+    PUBLIC_BASE_URL: Optional[str] = None
+    WEBSUB_LEASE: int = 10 * 24 * 60 * 60
+    WEBSUB_POLL_INTERVAL: int = 24 * 60 * 60
+    # Hubs taken even though they aren't on the public internet, like a local
+    # `czytacz websub-hub` - a JSON list of URLs, as feeds link to them.
+    WEBSUB_TRUSTED_HUBS: list[str] = []
+
     @validator("SQLALCHEMY_DATABASE_URI", pre=True)
     @classmethod
     def assemble_db_connection(cls, v: Optional[str], values: dict[str, Any]) -> Any:
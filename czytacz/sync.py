@@ -0,0 +1,87 @@
+"""What changed since a point, for clients that keep a copy of their items.
+
+Every write to an entry - a new item, an updated item, a change of read
+state - takes a number from the change_seq sequence, and clients ask for the
+entries with numbers above the last one they've seen.
+
+Numbers are taken as rows are written, but show up when their transaction
+commits, which isn't necessarily in the same order. Handing out 12 while 11
+is still in flight would make the client skip 11 for good. So writers
+register first: they take a number of their own, and hold an advisory lock
+keyed by it until they commit. Every session sees the lock in pg_locks right
+away, and sync only goes up to just below the lowest registered number.
+"""
+
+from collections.abc import Sequence
+
+from sqlalchemy import Executable, Row, Select, func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from czytacz import feeds, models
+
+_LAST_VALUE = text("SELECT last_value FROM change_seq")
+# Advisory locks with a bigint key have it split between classid and objid,
+# and objsubid set to 1.
+_LOWEST_WRITER = text("""
+    SELECT min((classid::bigint << 32) | objid::bigint)
+    FROM pg_locks
+    WHERE locktype = 'advisory'
+        AND objsubid = 1
+        AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+    """)
+
+
+def register_writer() -> Executable:
+    """To execute before writing entries, in the same transaction."""
+    return select(func.pg_advisory_xact_lock(models.change_sequence.next_value()))
+
+
+async def horizon(db: AsyncSession) -> int:
+    """Find the highest number below which nothing can show up anymore."""
+    # In this order: writers number their rows after they've registered, so
+    # any writer with rows up to the last value is in pg_locks, or done.
+    last_value = (await db.execute(_LAST_VALUE)).scalar_one()
+    lowest_writer = (await db.execute(_LOWEST_WRITER)).scalar_one()
+    if lowest_writer is None:
+        return last_value
+    return min(last_value, lowest_writer - 1)
+
+
+def select_changes(user_id: int, since: int, until: int, limit: int) -> Select:
+    return (
+        select(
+            *feeds.ITEM_COLUMNS,
+            models.Entry.feed_id,
+            models.Entry.change_seq,
+            func.coalesce(models.ItemContent.content, text("'[]'::jsonb")).label(
+                "content"
+            ),
+        )
+        .select_from(models.Entry)
+        .join(models.Entry.item)
+        .outerjoin(models.Item.content)
+        .where(
+            models.Entry.user_id == user_id,
+            models.Entry.change_seq > since,
+            models.Entry.change_seq <= until,
+        )
+        .order_by(models.Entry.change_seq)
+        .limit(limit)
+    )
+
+
+async def get_changes(
+    db: AsyncSession, user_id: int, since: int, limit: int
+) -> tuple[Sequence[Row], int, bool]:
+    """Get the entries changed after `since`.
+
+    Also returns what to pass as `since` next time, and whether there's more
+    to get right away.
+    """
+    until = await horizon(db)
+    if until <= since:
+        return [], since, False
+    changes = (await db.execute(select_changes(user_id, since, until, limit + 1))).all()
+    if len(changes) > limit:
+        return changes[:limit], changes[limit - 1].change_seq, True
+    return changes, until, False
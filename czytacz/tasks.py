@@ -1,78 +1,244 @@
+import base64
 import datetime
+import logging
+import random
+import time
 
 from celery import Celery
-from sqlalchemy import select, update, or_, and_
+from celery.signals import task_postrun, worker_process_init
+from sqlalchemy import Select, Update, case, cast, func, literal, or_, select, update
 
-from czytacz import models, FeedStatus, fetcher
+from czytacz import database, models, FeedStatus, fetcher, hosts, scheduling, websub
 from czytacz.dependencies import get_db_cli, get_settings
 
+logger = logging.getLogger(__name__)
+
 settings = get_settings()
 app = Celery("tasks", broker=str(settings.RABBITMQ_URI))
 
 
+@worker_process_init.connect
+def reset_connections(**kwargs):
+    # Prefork children inherit the parent's pool, sockets and all.
+    database.dispose_engine()
+
+
+# When this process last logged its pools.
+_pool_logged_at = 0.0
+
+
+@task_postrun.connect
+def log_pool_status(**kwargs):
+    # /monitoring/pool only sees the API process it's served from, so
+    # workers, whose pools matter the most, tell the logs instead.
+    global _pool_logged_at
+    now = time.monotonic()
+    if (
+        not settings.DB_POOL_LOG_INTERVAL
+        or now - _pool_logged_at < settings.DB_POOL_LOG_INTERVAL
+    ):
+        return
+    _pool_logged_at = now
+    logger.info("Connection pools: %s", database.pool_status())
+
+
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
+    # Cheap when nothing is due - every source carries its own schedule.
     sender.add_periodic_task(
-        datetime.timedelta(minutes=5), queue_feeds, name="queue-feeds"
+        datetime.timedelta(minutes=1), queue_feeds, name="queue-feeds"
+    )
+    sender.add_periodic_task(
+        datetime.timedelta(minutes=10),
+        renew_subscriptions,
+        name="renew-subscriptions",
     )
 
 
-RETRY_MAP = {
-    0: 120,
-    1: 300,
-    2: 480,
-}
-
-
-@app.task(max_retries=None, rate_limit="100/m")
-def fetch_feed(feed_id: int, force_fetch=False):
+@app.task(max_retries=None)
+def fetch_source(source_id: int, force_fetch=False):
+    # Failures are retried by the scheduler, see czytacz.scheduling.
     with get_db_cli() as db:
-        feed = fetcher.fetch_feed_by_id(db, feed_id)
+        source = db.execute(
+            select(
+                models.Source.status,
+                func.coalesce(models.Source.actual_url, models.Source.url).label("url"),
+            ).where(models.Source.id == source_id)
+        ).one_or_none()
+        if source is None or source.status != FeedStatus.FETCHING:
+            # Our lease ran out while queued, and the source was dealt with.
+            logger.info("Source %s is no longer claimed, skipping", source_id)
+            return
 
-    # I would actually use the built-in exponential back-off mechanism, but
-    # I'm following the specification. I'm keeping the jitter enabled, though.
-    if feed.status == FeedStatus.TRY_LATER:
-        countdown = RETRY_MAP.get(fetch_feed.request.retries)
-        if countdown is None:
+        now = datetime.datetime.now()
+        host = hosts.host_of(source.url)
+        wait = hosts.acquire(db, host, source_id, now)
+        if wait is not None:
+            # Spread out the retries of everyone waiting for the same host.
+            countdown = wait + random.uniform(0, wait / 2 + 1)
             db.execute(
-                update(models.Feed)
-                .where(models.Feed.id == feed.id)
-                .values(status=FeedStatus.FAILED)
+                update(models.Source)
+                .where(models.Source.id == source_id)
+                .values(
+                    lease_expires_at=now
+                    + datetime.timedelta(seconds=settings.FETCH_LEASE + countdown)
+                )
             )
             db.commit()
-        else:
-            raise fetch_feed.retry(countdown=countdown)
+            raise fetch_source.retry(countdown=countdown)
+
+        try:
+            fetcher.fetch_source_by_id(db, source_id, force_fetch=force_fetch)
+        finally:
+            db.rollback()
+            hosts.release(db, source_id)
+
+
+def select_due_sources(now: datetime.datetime, limit: int) -> Select:
+    return (
+        select(models.Source.id)
+        .where(
+            models.Source.next_fetch_at <= now,
+            or_(
+                models.Source.status.in_([FeedStatus.OK, FeedStatus.TRY_LATER]),
+                models.Source.status.is_(None),
+            ),
+            # Nobody reads sources without feeds.
+            models.Source.feeds.any(),
+        )
+        .order_by(models.Source.next_fetch_at)
+        .limit(limit)
+        # Rows another scheduler is claiming right now are simply left to it.
+        .with_for_update(of=models.Source, skip_locked=True)
+    )
+
+
+def claim_due_sources(now: datetime.datetime, limit: int) -> Update:
+    due = select_due_sources(now, limit).cte("due")
+    return (
+        update(models.Source)
+        .where(models.Source.id == due.c.id)
+        .values(
+            status=FeedStatus.FETCHING,
+            lease_expires_at=now + datetime.timedelta(seconds=settings.FETCH_LEASE),
+        )
+        .returning(models.Source.id)
+    )
+
+
+def reclaim_expired_leases(now: datetime.datetime) -> Update:
+    """Release sources whose worker died, counting that as a failure.
+
+    A source that keeps killing workers ends up failed, like one that keeps
+    timing out.
+    """
+    return (
+        update(models.Source)
+        .where(
+            models.Source.status == FeedStatus.FETCHING,
+            models.Source.lease_expires_at < now,
+        )
+        .values(
+            status=case(
+                (
+                    models.Source.failure_count >= len(scheduling.RETRY_DELAYS),
+                    # psycopg sends bound values untyped, and Postgres
+                    # won't take text for the enum without a cast.
+                    cast(literal(FeedStatus.FAILED.name), models.Source.status.type),
+                ),
+                else_=cast(
+                    literal(FeedStatus.TRY_LATER.name), models.Source.status.type
+                ),
+            ),
+            failure_count=models.Source.failure_count + 1,
+            next_fetch_at=now,
+            lease_expires_at=None,
+        )
+        .returning(models.Source.id)
+    )
+
+
+# Per run - the rest waits for the next one, rather than for its lease to
+# run out in the queue.
+MAX_CLAIM_BATCHES = 10
 
 
 @app.task()
 def queue_feeds():
-    now = datetime.datetime.now()
-    fetch_since = now - datetime.timedelta(minutes=5)
+    """Claim due sources in batches and queue their fetches.
+
+    Claims are leases - several of these can run at once, against the same
+    database, without fetching anything twice.
+    """
+    start = time.perf_counter()
+    claimed = batches = 0
     with get_db_cli() as db:
-        feed_ids = (
-            db.execute(
-                select(models.Feed.id)
-                .where(
-                    and_(
-                        or_(
-                            models.Feed.last_fetch < fetch_since,
-                            models.Feed.last_fetch.is_(None),
-                        ),
-                        or_(
-                            models.Feed.status.in_ == FeedStatus.OK,
-                            models.Feed.status.is_(None),
-                        ),
-                    )
-                )
-                .with_for_update()
+        now = datetime.datetime.now()
+        reclaimed = db.execute(reclaim_expired_leases(now)).scalars().all()
+        db.commit()
+        if reclaimed:
+            logger.warning("Reclaimed expired leases of sources %s", reclaimed)
+
+        while True:
+            source_ids = (
+                db.execute(claim_due_sources(now, settings.FETCH_CLAIM_BATCH))
+                .scalars()
+                .all()
             )
+            db.commit()
+            for source_id in source_ids:
+                fetch_source.delay(source_id)
+            claimed += len(source_ids)
+            batches += 1
+            if (
+                len(source_ids) < settings.FETCH_CLAIM_BATCH
+                or batches >= MAX_CLAIM_BATCHES
+            ):
+                break
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        "Claimed %d sources in %.3fs (%.1f/s)",
+        claimed,
+        elapsed,
+        claimed / elapsed if elapsed > 0 else 0,
+    )
+
+
+@app.task()
+def renew_subscriptions():
+    """Claim sources whose WebSub subscription is missing or running out.
+
+    The requests to their hubs are queued, one task a source.
+    """
+    if not websub.enabled():
+        return
+    with get_db_cli() as db:
+        now = datetime.datetime.now()
+        source_ids = (
+            db.execute(websub.claim_renewals(now, settings.FETCH_CLAIM_BATCH))
             .scalars()
             .all()
         )
-        db.execute(
-            update(models.Feed)
-            .where(models.Feed.id.in_(feed_ids))
-            .values(status=FeedStatus.FETCHING)
-        )
         db.commit()
-    fetch_feed.chunks(feed_ids, 10).delay()
+    for source_id in source_ids:
+        subscribe_source.delay(source_id)
+    if source_ids:
+        logger.info("Renewing WebSub subscriptions of %d sources", len(source_ids))
+
+
+@app.task()
+def subscribe_source(source_id: int):
+    # Nothing to retry here - an unverified request is asked again after
+    # websub.VERIFY_TIMEOUT.
+    with get_db_cli() as db:
+        websub.subscribe(db, source_id)
+
+
+@app.task()
+def ingest_push(source_id: int, body: str, content_type: str):
+    """Take in content a hub pushed, base64 encoded for the broker."""
+    with get_db_cli() as db:
+        fetcher.ingest_pushed(
+            db, source_id, base64.b64decode(body), {"content-type": content_type}
+        )
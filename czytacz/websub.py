@@ -0,0 +1,248 @@
+"""WebSub (formerly PubSubHubbub) subscriptions, for sources with a hub.
+
+Feeds can link to a hub that pushes their new content to subscribers as
+soon as it's published. Fetching such a feed notes the hub, and
+renew_subscriptions subscribes to it - the hub then checks with our callback
+(czytacz.api.routers.websub) that we really asked, and starts pushing.
+Subscriptions are leases, and get renewed a day before they run out.
+
+While a subscription is active the source is only polled every
+WEBSUB_POLL_INTERVAL, in case the hub misses something. None of this
+happens without PUBLIC_BASE_URL, hubs need a callback they can reach.
+
+Only hubs on https get a secret to sign pushes with - over plain http it
+would be there for anyone on the way to read. Pushes from the others can't
+be told from forgeries, so they just make the source due for a fetch.
+"""
+
+import datetime
+import hashlib
+import hmac
+import logging
+import secrets
+import urllib.parse
+from typing import Optional
+
+import pydantic
+import urllib3
+from sqlalchemy import Row, Select, Update, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from czytacz import http_client, models, schemas
+from czytacz.settings import settings
+
+logger = logging.getLogger(__name__)
+
+RENEW_BEFORE = datetime.timedelta(days=1)
+# How long to wait for a hub to verify a subscription before asking again.
+VERIFY_TIMEOUT = datetime.timedelta(hours=1)
+# Hubs are free to pick any of these for signing content.
+SIGNATURE_METHODS = {
+    "sha1": hashlib.sha1,
+    "sha256": hashlib.sha256,
+    "sha384": hashlib.sha384,
+    "sha512": hashlib.sha512,
+}
+
+_public_url = pydantic.TypeAdapter(schemas.PublicUrl)
+
+
+def enabled() -> bool:
+    return settings.PUBLIC_BASE_URL is not None
+
+
+def callback_url(source_id: int) -> str:
+    assert settings.PUBLIC_BASE_URL is not None
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}/websub/{source_id}"
+
+
+def _checked_hub(hub: Optional[str]) -> Optional[str]:
+    # Coming from the feed, the hub gets the same checks as any URL a user
+    # gives us - we're going to send requests there.
+    if hub is None:
+        return None
+    if hub.rstrip("/") in (
+        trusted.rstrip("/") for trusted in settings.WEBSUB_TRUSTED_HUBS
+    ):
+        return hub
+    try:
+        return str(_public_url.validate_python(hub))
+    except pydantic.ValidationError:
+        return None
+
+
+def _gets_secret(hub: str) -> bool:
+    return urllib.parse.urlsplit(hub).scheme == "https"
+
+
+def update_hub(source: models.Source, hub: Optional[str], topic: Optional[str]):
+    """Note the hub a freshly parsed feed links to, if any."""
+    hub = _checked_hub(hub)
+    if hub is not None and topic is None:
+        topic = source.actual_url if source.actual_url is not None else source.url
+    if (hub, topic) == (source.websub_hub, source.websub_topic):
+        return
+    # A new hub, or none at all - what we had with the old one is over.
+    source.websub_hub = hub
+    source.websub_topic = topic if hub is not None else None
+    source.websub_secret = (
+        secrets.token_urlsafe(32) if hub is not None and _gets_secret(hub) else None
+    )
+    source.websub_requested_at = None
+    source.websub_expires_at = None
+
+
+def is_active(source: models.Source, now: datetime.datetime) -> bool:
+    return source.websub_expires_at is not None and source.websub_expires_at > now
+
+
+def select_renewals(now: datetime.datetime, limit: int) -> Select:
+    """Select sources to (re)subscribe, that aren't waiting for their hub already."""
+    return (
+        select(models.Source.id)
+        .where(
+            models.Source.websub_hub.is_not(None),
+            (models.Source.websub_expires_at.is_(None))
+            | (models.Source.websub_expires_at < now + RENEW_BEFORE),
+            (models.Source.websub_requested_at.is_(None))
+            | (models.Source.websub_requested_at < now - VERIFY_TIMEOUT),
+            # Nobody reads sources without feeds - their subscriptions lapse.
+            models.Source.feeds.any(),
+        )
+        .order_by(models.Source.websub_expires_at.nulls_first())
+        .limit(limit)
+        .with_for_update(of=models.Source, skip_locked=True)
+    )
+
+
+def claim_renewals(now: datetime.datetime, limit: int) -> Update:
+    """Like tasks.claim_due_sources, so that renewals don't run twice."""
+    due = select_renewals(now, limit).cte("due")
+    return (
+        update(models.Source)
+        .where(models.Source.id == due.c.id)
+        .values(websub_requested_at=now)
+        .returning(models.Source.id)
+    )
+
+
+def subscribe(db: Session, source_id: int) -> bool:
+    """Ask the source's hub for a subscription.
+
+    Returns whether the hub took the request - it's only active once the hub
+    has verified it with the callback.
+    """
+    source = db.execute(
+        select(
+            models.Source.websub_hub,
+            models.Source.websub_topic,
+            models.Source.websub_secret,
+        ).where(models.Source.id == source_id)
+    ).one_or_none()
+    # Hand the connection back before talking to the hub - which may well
+    # call back before it answers.
+    db.rollback()
+    if source is None or source.websub_hub is None:
+        return False
+
+    fields = {
+        "hub.mode": "subscribe",
+        "hub.topic": source.websub_topic,
+        "hub.callback": callback_url(source_id),
+        "hub.lease_seconds": str(settings.WEBSUB_LEASE),
+    }
+    # Never over plain http, whatever is stored.
+    if source.websub_secret is not None and _gets_secret(source.websub_hub):
+        fields["hub.secret"] = source.websub_secret
+    try:
+        response = http_client.post_form(source.websub_hub, fields)
+    except (urllib3.exceptions.HTTPError, http_client.ResponseTooLargeError) as e:
+        logger.info("Subscribing source %s failed: %s", source_id, e)
+        return False
+    if response.status not in (202, 204):
+        logger.info(
+            "Hub of source %s refused to subscribe: HTTP %s %r",
+            source_id,
+            response.status,
+            response.body[:200],
+        )
+        return False
+    return True
+
+
+async def verify(
+    db: AsyncSession,
+    source_id: int,
+    mode: str,
+    topic: str,
+    lease_seconds: Optional[int],
+) -> bool:
+    """Whether to confirm what the hub is verifying.
+
+    Also takes note of confirmed subscriptions, and of denied ones.
+    """
+    source = await db.get(models.Source, source_id, with_for_update=True)
+    if source is None:
+        return mode == "unsubscribe"
+    now = datetime.datetime.now()
+    ours = source.websub_hub is not None and topic == source.websub_topic
+
+    if mode == "subscribe":
+        if not ours or source.websub_requested_at is None:
+            return False
+        lease = lease_seconds if lease_seconds is not None else settings.WEBSUB_LEASE
+        source.websub_expires_at = now + datetime.timedelta(seconds=lease)
+        source.websub_requested_at = None
+        await db.commit()
+        return True
+    if mode == "unsubscribe":
+        # Only what we don't want anymore.
+        return not ours
+    if mode == "denied" and ours:
+        logger.info("Hub of source %s denied the subscription", source_id)
+        source.websub_expires_at = None
+        await db.commit()
+    return False
+
+
+def signature_matches(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Check X-Hub-Signature, which is method=hexdigest."""
+    if signature is None:
+        return False
+    method, _, digest = signature.partition("=")
+    algorithm = SIGNATURE_METHODS.get(method.strip().lower())
+    if algorithm is None:
+        return False
+    expected = hmac.new(secret.encode(), body, algorithm).hexdigest()
+    return hmac.compare_digest(expected, digest.strip().lower())
+
+
+async def get_push_source(db: AsyncSession, source_id: int) -> Optional[Row]:
+    """Get what a push to the source is checked against, None if it's gone.
+
+    That's the secret pushes must be signed with, and whether the source's
+    subscription is active.
+    """
+    now = datetime.datetime.now()
+    return (
+        await db.execute(
+            select(
+                models.Source.websub_secret,
+                func.coalesce(models.Source.websub_expires_at > now, False).label(
+                    "active"
+                ),
+            ).where(models.Source.id == source_id)
+        )
+    ).one_or_none()
+
+
+async def fetch_soon(db: AsyncSession, source_id: int):
+    """Make the source due for a fetch, for a push that can't be taken as is."""
+    now = datetime.datetime.now()
+    await db.execute(
+        update(models.Source)
+        .where(models.Source.id == source_id, models.Source.next_fetch_at > now)
+        .values(next_fetch_at=now)
+    )
+    await db.commit()
@@ -1,4 +1,7 @@
 #!/bin/bash
 
 poetry run alembic upgrade head
-poetry run celery -A czytacz.tasks worker --loglevel=INFO -B
+# Fetches wait on the network in threads, parsing runs in PARSE_WORKERS
+# processes.
+poetry run celery -A czytacz.tasks worker --loglevel=INFO -B \
+    --pool threads --concurrency "${WORKER_CONCURRENCY:-16}"
@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import argon2
+import pytest
+from sqlalchemy import update
+
+from czytacz import dependencies, models, schemas
+from czytacz.api.authentication import (
+    CredentialCache,
+    create_access_token,
+    decode_access_token,
+)
+
+USER = schemas.User(id=1, email="reader@example.com")
+
+
+@pytest.fixture
+def settings():
+    return dependencies.get_settings().model_copy()
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def signed(settings, claims) -> str:
+    payload = b64encode(json.dumps(claims).encode())
+    signature = hmac.digest(
+        settings.SECRET_KEY.encode(), payload.encode(), hashlib.sha256
+    )
+    return f"{payload}.{b64encode(signature)}"
+
+
+def test_tokens_identify_the_user(settings):
+    token = create_access_token(settings, USER).access_token
+
+    token_data = decode_access_token(settings, token)
+
+    assert token_data is not None
+    assert (token_data.user_id, token_data.username) == (1, "reader@example.com")
+
+
+def test_expired_tokens_are_refused(settings):
+    settings.ACCESS_TOKEN_EXPIRE_MINUTES = -1
+    token = create_access_token(settings, USER).access_token
+
+    assert decode_access_token(settings, token) is None
+
+
+def test_tampered_tokens_are_refused(settings):
+    token = create_access_token(settings, USER).access_token
+    _, signature = token.split(".")
+    claims = {"sub": "other@example.com", "uid": 2, "exp": 2**32}
+    payload = b64encode(json.dumps(claims).encode())
+
+    assert decode_access_token(settings, f"{payload}.{signature}") is None
+
+
+def test_tokens_signed_with_another_key_are_refused(settings):
+    token = create_access_token(settings, USER).access_token
+    settings.SECRET_KEY = "another key"
+
+    assert decode_access_token(settings, token) is None
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"sub": "reader@example.com", "uid": 1},
+        {"uid": 1, "exp": 2**32},
+        {"sub": "reader@example.com", "exp": 2**32},
+        {"sub": "reader@example.com", "uid": 1, "exp": "tomorrow"},
+        {"sub": "reader@example.com", "uid": 1, "exp": 10**20},
+        ["reader@example.com", 1, 2**32],
+    ],
+)
+def test_tokens_missing_claims_are_refused(settings, claims):
+    assert decode_access_token(settings, signed(settings, claims)) is None
+
+
+@pytest.mark.parametrize("token", ["", "a.b.c", "not a token", "e30.!!!"])
+def test_garbage_tokens_are_refused(settings, token):
+    assert decode_access_token(settings, token) is None
+
+
+def test_bearer_tokens_authenticate(api):
+    token = api.post("/token").json()["access_token"]
+
+    response = api.get(
+        "/feeds/", headers={"Authorization": f"Bearer {token}"}, auth=None
+    )
+
+    assert response.status_code == 200
+
+
+def test_bearer_tokens_missing_claims_are_unauthorized(api, settings):
+    token = signed(settings, {"sub": "reader@example.com", "uid": 1})
+
+    response = api.get(
+        "/feeds/", headers={"Authorization": f"Bearer {token}"}, auth=None
+    )
+
+    assert response.status_code == 401
+
+
+def test_cached_credentials_expire(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    cache = CredentialCache("key", ttl=60, maxsize=10)
+    cache.put("reader@example.com", "password", "hash", USER)
+
+    now += 59
+    assert cache.get("reader@example.com", "password", "hash") == USER
+    now += 2
+    assert cache.get("reader@example.com", "password", "hash") is None
+
+
+def test_least_recently_used_credentials_are_evicted():
+    cache = CredentialCache("key", ttl=60, maxsize=2)
+    cache.put("a@example.com", "password", "hash", USER)
+    cache.put("b@example.com", "password", "hash", USER)
+    # Used just now, so b goes first.
+    assert cache.get("a@example.com", "password", "hash") == USER
+
+    cache.put("c@example.com", "password", "hash", USER)
+
+    assert cache.get("a@example.com", "password", "hash") == USER
+    assert cache.get("b@example.com", "password", "hash") is None
+    assert cache.get("c@example.com", "password", "hash") == USER
+
+
+def test_cached_credentials_need_the_same_password():
+    cache = CredentialCache("key", ttl=60, maxsize=10)
+    cache.put("reader@example.com", "password", "hash", USER)
+
+    assert cache.get("reader@example.com", "wrong", "hash") is None
+
+
+def test_changed_passwords_are_not_served_from_the_cache(api, db):
+    assert api.get("/feeds/").status_code == 200
+
+    db.execute(
+        update(models.User)
+        .where(models.User.email == "reader@example.com")
+        .values(hashed_password=argon2.PasswordHasher().hash("changed"))
+    )
+    db.commit()
+
+    assert api.get("/feeds/").status_code == 401
+    assert api.get("/feeds/", auth=("reader@example.com", "changed")).status_code == 200
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from czytacz import models
+from czytacz.api.events import QUEUE_SIZE, RESYNC, Broker
+
+
+@pytest.fixture
+def broker(monkeypatch) -> Broker:
+    """Make a broker that gets its events from the test, not from Postgres."""
+
+    async def listen(self):
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(Broker, "_listen", listen)
+    return Broker()
+
+
+def queued(queue: asyncio.Queue) -> list[dict]:
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_read_events_go_to_every_client_of_the_user(broker, run_async):
+    async def main(db):
+        first, second = broker.subscribe(1), broker.subscribe(1)
+        other = broker.subscribe(2)
+
+        await broker._dispatch({"type": "read", "user_id": 1, "feed_id": 3, "count": 2})
+
+        expected = [{"type": "read", "feed_id": 3, "count": 2}]
+        assert queued(first) == queued(second) == expected
+        assert queued(other) == []
+
+    run_async(main)
+
+
+def test_item_events_go_to_the_subscribers_of_the_source(broker, db, run_async):
+    source = models.Source(url="https://example.com/feed")
+    subscribed = models.Feed(
+        user=models.User(email="reader@example.com"), name="Feed", source=source
+    )
+    elsewhere = models.Feed(
+        user=models.User(email="other@example.com"),
+        name="Feed",
+        source=models.Source(url="https://example.com/other"),
+    )
+    db.add_all([subscribed, elsewhere])
+    db.commit()
+
+    async def main(db):
+        queue = broker.subscribe(subscribed.user_id)
+        other = broker.subscribe(elsewhere.user_id)
+
+        await broker._dispatch(
+            {"type": "items", "source_id": source.id, "inserted": 2, "updated": 1}
+        )
+
+        assert queued(queue) == [
+            {"type": "items", "inserted": 2, "updated": 1, "feed_id": subscribed.id}
+        ]
+        assert queued(other) == []
+
+    run_async(main)
+
+
+def test_clients_falling_behind_are_told_to_resync(broker, run_async):
+    async def main(db):
+        queue = broker.subscribe(1)
+
+        for count in range(QUEUE_SIZE + 1):
+            await broker._dispatch(
+                {"type": "read", "user_id": 1, "feed_id": None, "count": count}
+            )
+
+        assert queued(queue) == [RESYNC]
+
+    run_async(main)
+
+
+def test_unsubscribed_clients_get_nothing(broker, run_async):
+    async def main(db):
+        queue = broker.subscribe(1)
+        broker.unsubscribe(1, queue)
+
+        await broker._dispatch(
+            {"type": "read", "user_id": 1, "feed_id": None, "count": 1}
+        )
+
+        assert queued(queue) == []
+        assert broker._queues == {}
+
+    run_async(main)
@@ -0,0 +1,220 @@
+import datetime
+
+from sqlalchemy import func, select, text
+
+from czytacz import fetcher, models, schemas
+
+
+def test_feed_list_shows_feeds(api):
+    created = api.post(
+        "/feeds/", json={"name": "Feed", "source": "https://example.com/feed"}
+    )
+    assert created.status_code == 200
+
+    listed = api.get("/feeds/")
+
+    assert listed.status_code == 200
+    (feed,) = listed.json()["items"]
+    assert feed["id"] == created.json()["id"]
+    assert feed["name"] == "Feed"
+    # Listings never showed whose feeds they are.
+    assert "user_id" not in feed
+
+
+def test_feed_shows_its_owner(api):
+    created = api.post(
+        "/feeds/", json={"name": "Feed", "source": "https://example.com/feed"}
+    ).json()
+
+    shown = api.get(f"/feeds/{created['id']}")
+
+    assert shown.status_code == 200
+    assert shown.json()["user_id"] == created["user_id"]
+
+
+def fetched(item_id: str) -> schemas.ItemFetched:
+    return schemas.ItemFetched(
+        item_id=item_id,
+        title=None,
+        link=None,
+        author=None,
+        summary=None,
+        published=None,
+        updated=datetime.datetime(2024, 1, 1),
+        content=[],
+    )
+
+
+def test_new_feed_counts_existing_items(api, db):
+    source = models.Source(url="https://example.com/feed")
+    db.add(
+        models.Feed(
+            user=models.User(email="other@example.com"), name="Feed", source=source
+        )
+    )
+    db.commit()
+    fetcher.update_items(
+        db,
+        source.id,
+        [fetched("1"), fetched("2")],
+        datetime.datetime.now(),
+    )
+    db.commit()
+
+    created = api.post(
+        "/feeds/", json={"name": "Feed", "source": "https://example.com/feed"}
+    )
+
+    assert created.status_code == 200
+    assert created.json()["item_count"] == 2
+    assert created.json()["unread_count"] == 2
+
+
+def with_content(item_id: str, value: str) -> schemas.ItemFetched:
+    return fetched(item_id).model_copy(
+        update={"content": [schemas.ItemContent(content_type="text/html", value=value)]}
+    )
+
+
+def test_item_content_is_read_back(api, db):
+    feed_id = api.post(
+        "/feeds/", json={"name": "Feed", "source": "https://example.com/feed"}
+    ).json()["id"]
+    source_id = db.scalar(
+        select(models.Feed.source_id).where(models.Feed.id == feed_id)
+    )
+    # Big enough to get compressed.
+    value = "<p>Kangaroos hop.</p>" * 1000
+    fetcher.update_items(
+        db, source_id, [with_content("1", value)], datetime.datetime.now()
+    )
+    db.commit()
+
+    (item,) = api.get(f"/feeds/{feed_id}").json()["items"]
+    assert "content" not in item
+    shown = api.get(f"/feeds/{feed_id}/{item['id']}")
+
+    assert shown.status_code == 200
+    assert shown.json()["content"] == [{"content_type": "text/html", "value": value}]
+    compression = db.scalar(
+        text("SELECT pg_column_compression(content) FROM item_content")
+    )
+    lz4_supported = db.scalar(
+        text(
+            "SELECT 'lz4' = ANY(enumvals) FROM pg_settings"
+            " WHERE name = 'default_toast_compression'"
+        )
+    )
+    assert compression == ("lz4" if lz4_supported else "pglz")
+
+
+def test_item_content_is_replaced_on_update(api, db):
+    feed_id = api.post(
+        "/feeds/", json={"name": "Feed", "source": "https://example.com/feed"}
+    ).json()["id"]
+    source_id = db.scalar(
+        select(models.Feed.source_id).where(models.Feed.id == feed_id)
+    )
+    fetcher.update_items(
+        db, source_id, [with_content("1", "<p>Kangaroos</p>")], datetime.datetime.now()
+    )
+    db.commit()
+    newer = with_content("1", "<p>Kangaroos hop</p>").model_copy(
+        update={"updated": datetime.datetime(2024, 1, 2)}
+    )
+    fetcher.update_items(db, source_id, [newer], datetime.datetime.now())
+    db.commit()
+
+    (item,) = api.get(f"/feeds/{feed_id}").json()["items"]
+    shown = api.get(f"/feeds/{feed_id}/{item['id']}").json()
+
+    assert shown["content"] == [
+        {"content_type": "text/html", "value": "<p>Kangaroos hop</p>"}
+    ]
+    assert db.scalar(select(func.count()).select_from(models.ItemContent)) == 1
+
+
+def test_feed_list_is_not_modified_until_a_feed_is(api):
+    api.post("/feeds/", json={"name": "Feed", "source": "https://example.com/feed"})
+    etag = api.get("/feeds/").headers["ETag"]
+
+    unchanged = api.get("/feeds/", headers={"If-None-Match": etag})
+
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert unchanged.headers["ETag"] == etag
+
+    api.post("/feeds/", json={"name": "Other", "source": "https://example.com/other"})
+    changed = api.get("/feeds/", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()["items"]) == 2
+
+
+def test_feed_is_not_modified_until_its_items_are(api, db):
+    feed_id = api.post(
+        "/feeds/", json={"name": "Feed", "source": "https://example.com/feed"}
+    ).json()["id"]
+    source_id = db.scalar(
+        select(models.Feed.source_id).where(models.Feed.id == feed_id)
+    )
+    etag = api.get(f"/feeds/{feed_id}").headers["ETag"]
+
+    assert (
+        api.get(f"/feeds/{feed_id}", headers={"If-None-Match": etag}).status_code == 304
+    )
+    # Another page is another response.
+    assert (
+        api.get(
+            f"/feeds/{feed_id}", params={"read": False}, headers={"If-None-Match": etag}
+        ).status_code
+        == 200
+    )
+
+    fetcher.update_items(db, source_id, [fetched("1")], datetime.datetime.now())
+    db.commit()
+    changed = api.get(f"/feeds/{feed_id}", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()["items"]) == 1
+
+
+def test_marking_a_missing_feed_read_is_not_found(api):
+    response = api.post("/feeds/1/mark_read", json={})
+
+    assert response.status_code == 404
+
+
+def test_marking_someone_elses_feed_read_is_not_found(api, db):
+    source = models.Source(url="https://example.com/feed")
+    feed = models.Feed(
+        user=models.User(email="other@example.com"), name="Feed", source=source
+    )
+    db.add(feed)
+    db.commit()
+    fetcher.update_items(db, source.id, [fetched("1")], datetime.datetime.now())
+    db.commit()
+
+    response = api.post(f"/feeds/{feed.id}/mark_read", json={})
+
+    assert response.status_code == 404
+    assert db.scalar(select(models.Entry.read)) is False
+
+
+def test_marking_a_feed_read(api, db):
+    feed_id = api.post(
+        "/feeds/", json={"name": "Feed", "source": "https://example.com/feed"}
+    ).json()["id"]
+    source_id = db.scalar(
+        select(models.Feed.source_id).where(models.Feed.id == feed_id)
+    )
+    fetcher.update_items(
+        db, source_id, [fetched("1"), fetched("2")], datetime.datetime.now()
+    )
+    db.commit()
+
+    assert api.post(f"/feeds/{feed_id}/mark_read", json={}).json() == {"updated": 2}
+    # Already read, but still there.
+    assert api.post(f"/feeds/{feed_id}/mark_read", json={}).json() == {"updated": 0}
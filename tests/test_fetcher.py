@@ -0,0 +1,92 @@
+import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from czytacz import fetcher, models, schemas
+
+NOW = datetime.datetime(2024, 1, 2)
+
+
+def fetched(
+    item_id: str, title: str, updated: Optional[datetime.datetime]
+) -> schemas.ItemFetched:
+    return schemas.ItemFetched(
+        item_id=item_id,
+        title=title,
+        link=None,
+        author=None,
+        summary=None,
+        published=None,
+        updated=updated,
+        content=[],
+    )
+
+
+def subscribed_source(db) -> models.Source:
+    source = models.Source(url="https://example.com/feed")
+    db.add(
+        models.Feed(
+            user=models.User(email="reader@example.com"), name="Feed", source=source
+        )
+    )
+    db.commit()
+    return source
+
+
+def upsert(db, source: models.Source, items: list[schemas.ItemFetched]):
+    result = fetcher.update_items(db, source.id, items, NOW)
+    db.commit()
+    return (result.inserted, result.updated)
+
+
+def test_upserts_count_inserted_and_updated_items(db):
+    source = subscribed_source(db)
+    first = datetime.datetime(2024, 1, 1)
+    later = datetime.datetime(2024, 1, 1, 12)
+    document = [fetched("1", "Kangaroos", first), fetched("2", "Wombats", first)]
+
+    assert upsert(db, source, document) == (2, 0)
+    # The same document again changes nothing.
+    assert upsert(db, source, document) == (0, 0)
+    # A newer, changed item is updated, a new one inserted.
+    assert upsert(
+        db,
+        source,
+        [
+            fetched("1", "Kangaroos hop", later),
+            fetched("2", "Wombats", first),
+            fetched("3", "Koalas", first),
+        ],
+    ) == (1, 1)
+
+    titles = db.execute(
+        select(models.Item.item_id, models.Item.title).order_by(models.Item.item_id)
+    ).all()
+    assert titles == [("1", "Kangaroos hop"), ("2", "Wombats"), ("3", "Koalas")]
+    # Every new item reached the feed, once.
+    assert db.scalar(select(func.count()).select_from(models.Entry)) == 3
+
+
+def test_upserts_keep_items_that_are_not_newer(db):
+    source = subscribed_source(db)
+    first = datetime.datetime(2024, 1, 1)
+    assert upsert(db, source, [fetched("1", "Kangaroos", first)]) == (1, 0)
+
+    # Changed, but not updated later - whatever we stored stays.
+    assert upsert(db, source, [fetched("1", "Kangaroos hop", first)]) == (0, 0)
+    # Updated later, but no different.
+    assert upsert(
+        db, source, [fetched("1", "Kangaroos", datetime.datetime(2024, 1, 1, 12))]
+    ) == (0, 0)
+
+    assert db.scalar(select(models.Item.title)) == "Kangaroos"
+
+
+def test_undated_items_are_never_updated(db):
+    source = subscribed_source(db)
+
+    assert upsert(db, source, [fetched("1", "Kangaroos", None)]) == (1, 0)
+    assert upsert(db, source, [fetched("1", "Kangaroos hop", None)]) == (0, 0)
+
+    assert db.scalar(select(models.Item.title)) == "Kangaroos"
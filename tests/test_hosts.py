@@ -0,0 +1,66 @@
+import datetime
+
+import pytest
+
+from czytacz import hosts, models
+from czytacz.settings import settings
+
+NOW = datetime.datetime(2024, 1, 1, 12)
+HOST = "example.com"
+
+
+def sources(db, count: int) -> list[int]:
+    added = [models.Source(url=f"https://{HOST}/{i}") for i in range(count)]
+    db.add_all(added)
+    db.commit()
+    return [source.id for source in added]
+
+
+def later(seconds: float) -> datetime.datetime:
+    return NOW + datetime.timedelta(seconds=seconds)
+
+
+def test_fetches_wait_for_tokens_once_the_bucket_is_empty(db, monkeypatch):
+    # Only the bucket counts here.
+    monkeypatch.setattr(settings, "FETCH_HOST_CONCURRENCY", 100)
+    source_ids = sources(db, settings.FETCH_HOST_BURST + 2)
+
+    for source_id in source_ids[: settings.FETCH_HOST_BURST]:
+        assert hosts.acquire(db, HOST, source_id, NOW) is None
+
+    waiting = source_ids[settings.FETCH_HOST_BURST]
+    assert hosts.acquire(db, HOST, waiting, NOW) == pytest.approx(
+        1 / settings.FETCH_HOST_RATE
+    )
+    # Half a token later, half the wait is left.
+    assert hosts.acquire(
+        db, HOST, waiting, later(0.5 / settings.FETCH_HOST_RATE)
+    ) == pytest.approx(0.5 / settings.FETCH_HOST_RATE)
+    assert hosts.acquire(db, HOST, waiting, later(1 / settings.FETCH_HOST_RATE)) is None
+    # And that was the only token.
+    assert hosts.acquire(
+        db, HOST, source_ids[-1], later(1 / settings.FETCH_HOST_RATE)
+    ) == pytest.approx(1 / settings.FETCH_HOST_RATE)
+
+
+def test_released_slots_let_the_next_fetch_through(db):
+    source_ids = sources(db, settings.FETCH_HOST_CONCURRENCY + 1)
+    *running, waiting = source_ids
+
+    for source_id in running:
+        assert hosts.acquire(db, HOST, source_id, NOW) is None
+    assert hosts.acquire(db, HOST, waiting, NOW) == hosts.SLOT_WAIT
+
+    hosts.release(db, running[0])
+
+    assert hosts.acquire(db, HOST, waiting, NOW) is None
+
+
+def test_slots_of_lost_fetches_expire(db):
+    source_ids = sources(db, settings.FETCH_HOST_CONCURRENCY + 1)
+    *running, waiting = source_ids
+
+    for source_id in running:
+        assert hosts.acquire(db, HOST, source_id, NOW) is None
+
+    assert hosts.acquire(db, HOST, waiting, later(settings.FETCH_LEASE)) is None
@@ -0,0 +1,105 @@
+import pytest
+
+from czytacz import fetcher, http_client, parsing, schemas
+
+FEED = b'<rss version="2.0"><channel><title>Feed</title></channel></rss>'
+
+
+class FakeResponse:
+    def __init__(self, status: int, headers: dict[str, str], body: bytes = b""):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def stream(self, amount, decode_content):
+        yield self.body
+
+    def drain_conn(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakePoolManager:
+    """Serves canned responses by URL, and notes what was asked for."""
+
+    def __init__(self, responses: dict[str, FakeResponse]):
+        self.responses = responses
+        self.requested: list[str] = []
+
+    def request(self, method, url, **kwargs):
+        self.requested.append(url)
+        return self.responses[url]
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    def serve(responses: dict[str, FakeResponse]) -> FakePoolManager:
+        pool_manager = FakePoolManager(responses)
+        monkeypatch.setattr(http_client, "get_pool_manager", lambda: pool_manager)
+        return pool_manager
+
+    return serve
+
+
+def source() -> schemas.SourceForFetch:
+    return schemas.SourceForFetch.model_validate(
+        {
+            "id": 1,
+            "source": "https://example.com/feed",
+            "etag": None,
+            "last_modified": None,
+        }
+    )
+
+
+def test_redirects_to_public_hosts_are_followed(serve):
+    pool_manager = serve(
+        {
+            "https://example.com/feed": FakeResponse(
+                301, {"Location": "https://example.org/feed"}
+            ),
+            "https://example.org/feed": FakeResponse(200, {}, FEED),
+        }
+    )
+
+    result = fetcher.fetch_feed(source())
+
+    assert result.status == schemas.FeedFetchStatus.PERMANENT_REDIRECT
+    assert str(result.source) == "https://example.org/feed"
+    assert pool_manager.requested == [
+        "https://example.com/feed",
+        "https://example.org/feed",
+    ]
+
+
+@pytest.mark.parametrize("status", [301, 302, 307, 308])
+@pytest.mark.parametrize(
+    "location", ["http://127.0.0.1/admin", "http://10.0.0.1/", "http://localhost/"]
+)
+def test_redirects_to_private_hosts_are_not_followed(serve, status, location):
+    pool_manager = serve(
+        {"https://example.com/feed": FakeResponse(status, {"Location": location})}
+    )
+
+    result = fetcher.fetch_feed(source())
+
+    assert result.status == schemas.FeedFetchStatus.GENERIC_ERROR
+    assert pool_manager.requested == ["https://example.com/feed"]
+
+
+def test_parse_timeouts_are_tried_later(serve, monkeypatch):
+    serve({"https://example.com/feed": FakeResponse(200, {}, FEED)})
+
+    def parse_feed(source, response):
+        raise parsing.ParseTimeoutError()
+
+    monkeypatch.setattr(fetcher, "parse_feed", parse_feed)
+
+    result = fetcher.fetch_feed(source())
+
+    assert result.status == schemas.FeedFetchStatus.TRY_LATER
@@ -0,0 +1,38 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from czytacz import dependencies
+from czytacz.api import app
+
+
+@pytest.fixture
+def client():
+    settings = dependencies.get_settings().model_copy()
+    app.dependency_overrides[dependencies.get_settings] = lambda: settings
+    yield TestClient(app), settings
+    app.dependency_overrides.clear()
+
+
+def test_pool_status_is_hidden_without_a_token(client):
+    client, settings = client
+    settings.MONITORING_TOKEN = None
+
+    assert client.get("/monitoring/pool").status_code == 404
+
+
+def test_pool_status_needs_the_token(client):
+    client, settings = client
+    settings.MONITORING_TOKEN = "secret"
+
+    assert client.get("/monitoring/pool").status_code == 401
+    assert (
+        client.get(
+            "/monitoring/pool", headers={"Authorization": "Bearer wrong"}
+        ).status_code
+        == 401
+    )
+    response = client.get(
+        "/monitoring/pool", headers={"Authorization": "Bearer secret"}
+    )
+    assert response.status_code == 200
+    assert "pid" in response.json()
@@ -0,0 +1,159 @@
+import base64
+import datetime
+import json
+
+import pytest
+from sqlalchemy import select
+
+from czytacz import fetcher, models, schemas
+
+SAME_TIME = datetime.datetime(2024, 1, 1)
+
+
+def fetched(
+    item_id: str, updated: datetime.datetime = SAME_TIME
+) -> schemas.ItemFetched:
+    return schemas.ItemFetched(
+        item_id=item_id,
+        title=None,
+        link=None,
+        author=None,
+        summary=None,
+        published=None,
+        updated=updated,
+        content=[],
+    )
+
+
+def subscribe(api, db, url: str, item_count: int = 0) -> int:
+    feed = api.post("/feeds/", json={"name": "Feed", "source": url}).json()
+    if item_count:
+        add_items(db, url, [fetched(str(i)) for i in range(item_count)])
+    return feed["id"]
+
+
+def add_items(db, url: str, items: list[schemas.ItemFetched]):
+    source_id = db.scalar(select(models.Source.id).where(models.Source.url == url))
+    fetcher.update_items(db, source_id, items, datetime.datetime.now())
+    db.commit()
+
+
+def pages(api, url: str, limit: int) -> list[list[dict]]:
+    """Follow the cursors from the first page to the last."""
+    pages = []
+    params: dict = {"limit": limit}
+    while True:
+        response = api.get(url, params=params)
+        assert response.status_code == 200
+        page = response.json()
+        pages.append(page["items"])
+        if page.get("next_cursor") is None:
+            return pages
+        params["cursor"] = page["next_cursor"]
+
+
+def cursor_of(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def test_feed_list_cursors_go_through_every_feed(api, db):
+    feed_ids = [subscribe(api, db, f"https://example.com/{i}") for i in range(5)]
+
+    listed = pages(api, "/feeds/", limit=2)
+
+    assert [len(page) for page in listed] == [2, 2, 1]
+    assert [feed["id"] for page in listed for feed in page] == feed_ids
+
+
+def test_exactly_full_pages_end_without_a_cursor(api, db):
+    for i in range(4):
+        subscribe(api, db, f"https://example.com/{i}")
+
+    assert [len(page) for page in pages(api, "/feeds/", limit=2)] == [2, 2]
+
+
+def test_items_with_the_same_time_are_paged_through_once(api, db):
+    feed_id = subscribe(api, db, "https://example.com/feed", item_count=7)
+
+    listed = pages(api, f"/feeds/{feed_id}", limit=3)
+
+    assert [len(page) for page in listed] == [3, 3, 1]
+    item_ids = [item["id"] for page in listed for item in page]
+    # Ties on the time are broken by the id, newest first.
+    assert item_ids == sorted(set(item_ids), reverse=True)
+    assert len(item_ids) == 7
+
+
+def test_items_of_every_feed_are_newest_first(api, db):
+    first = subscribe(api, db, "https://example.com/first")
+    second = subscribe(api, db, "https://example.com/second")
+    add_items(
+        db,
+        "https://example.com/first",
+        [fetched(str(hour), SAME_TIME.replace(hour=hour)) for hour in (1, 3, 5)],
+    )
+    add_items(
+        db,
+        "https://example.com/second",
+        [fetched(str(hour), SAME_TIME.replace(hour=hour)) for hour in (2, 3, 4)],
+    )
+
+    (everything,) = pages(api, "/items", limit=100)
+
+    assert [(item["item_id"], item["feed_id"]) for item in everything] == [
+        ("5", first),
+        ("4", second),
+        # Both at 3 - the second feed's item was stored later, its id is higher.
+        ("3", second),
+        ("3", first),
+        ("2", second),
+        ("1", first),
+    ]
+    # Small pages go through the same items, in the same order.
+    assert [item for page in pages(api, "/items", limit=2) for item in page] == (
+        everything
+    )
+    assert [len(page) for page in pages(api, "/items", limit=4)] == [4, 2]
+
+
+def test_items_of_some_feeds_only(api, db):
+    first = subscribe(api, db, "https://example.com/first", item_count=3)
+    subscribe(api, db, "https://example.com/second", item_count=3)
+
+    listed = pages(api, f"/items?feed_id={first}", limit=2)
+
+    assert [len(page) for page in listed] == [2, 1]
+    assert {item["feed_id"] for page in listed for item in page} == {first}
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not a cursor!",
+        base64.urlsafe_b64encode(b"not json").decode(),
+        cursor_of({"id": 1}),
+        cursor_of(["2024-01-01T00:00:00", 1, 1, 1]),
+        cursor_of(["yesterday", 1, 1]),
+        cursor_of(["2024-01-01T00:00:00", "one", 1]),
+    ],
+)
+@pytest.mark.parametrize(
+    "method, url",
+    [
+        ("GET", "/feeds/"),
+        ("GET", "/feeds/{feed_id}"),
+        ("GET", "/items"),
+        ("POST", "/feeds/mark_read"),
+        ("POST", "/feeds/{feed_id}/mark_read"),
+    ],
+)
+def test_malformed_cursors_are_bad_requests(api, db, method, url, cursor):
+    feed_id = subscribe(api, db, "https://example.com/feed")
+    url = url.format(feed_id=feed_id)
+
+    if method == "GET":
+        response = api.get(url, params={"cursor": cursor})
+    else:
+        response = api.post(url, json={"cursor": cursor})
+
+    assert response.status_code == 400
@@ -0,0 +1,84 @@
+import concurrent.futures
+import datetime
+import pathlib
+from types import SimpleNamespace
+
+import pytest
+
+from czytacz import parsing
+
+SAMPLES = pathlib.Path(__file__).parent.parent / "samples"
+
+
+def parse_whole(body: bytes):
+    return parsing.parse_stream(
+        body, max_bytes=len(body), max_entries=10_000, stop_after_known=0
+    )
+
+
+@pytest.mark.parametrize("name", ["nu.rss", "tweakers.rss"])
+def test_both_parsers_agree(name):
+    body = (SAMPLES / name).read_bytes()
+
+    streamed = parse_whole(body)
+    whole = parsing.parse_feedparser(body, {"content-type": "application/rss+xml"})
+
+    assert streamed.items
+    assert streamed.items == whole.items
+
+
+@pytest.mark.parametrize("name", ["nu.rss", "tweakers.rss"])
+def test_rss_items_are_dated_by_pub_date(name):
+    items = parse_whole((SAMPLES / name).read_bytes()).items
+
+    assert all(item.updated is not None for item in items)
+    assert all(item.updated == item.published for item in items)
+
+
+def test_atom_dates_are_utc():
+    body = b"""<?xml version="1.0"?>
+    <feed xmlns="http://www.w3.org/2005/Atom">
+        <entry>
+            <id>1</id>
+            <published>2024-01-02T10:00:00.5+02:00</published>
+            <updated>2024-01-03T00:00:00Z</updated>
+        </entry>
+    </feed>"""
+
+    (item,) = parse_whole(body).items
+
+    assert item.published == datetime.datetime(2024, 1, 2, 8, 0)
+    assert item.updated == datetime.datetime(2024, 1, 3)
+
+
+def test_unknown_dates_go_to_feedparser():
+    body = (SAMPLES / "nu.rss").read_bytes().replace(b"<pubDate>", b"<pubDate>x ", 1)
+
+    with pytest.raises(parsing.UnsupportedFeedError):
+        parse_whole(body)
+    assert len(parsing.parse(body, {}).items) == 30
+
+
+def test_html_is_sanitized():
+    body = b"""<?xml version="1.0"?>
+    <rss version="2.0"><channel><item>
+        <guid>1</guid>
+        <description>&lt;p onclick="x()"&gt;Hi&lt;script&gt;x()&lt;/script&gt;&lt;/p&gt;</description>
+    </item></channel></rss>"""
+
+    (item,) = parse_whole(body).items
+
+    assert item.summary == "<p>Hi</p>"
+
+
+def test_pool_parses_time_out(monkeypatch):
+    monkeypatch.setattr(parsing.settings, "PARSE_WORKERS", 1)
+    monkeypatch.setattr(parsing.settings, "PARSE_TIMEOUT", 0.01)
+    stuck = concurrent.futures.Future()
+    monkeypatch.setattr(
+        parsing, "get_pool", lambda: SimpleNamespace(submit=lambda *args: stuck)
+    )
+
+    with pytest.raises(parsing.ParseTimeoutError):
+        parsing.run(b"<rss/>", {})
+    assert stuck.cancelled()
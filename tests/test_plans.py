@@ -0,0 +1,17 @@
+import pytest
+
+from czytacz import plans
+
+
+def test_no_query_needs_a_sequential_scan(db):
+    plans.seed(db, users=20, sources=50, items=20)
+
+    scans = plans.check(db, missing_indexes=True)
+
+    assert scans.keys() == plans.checked_queries(plans._sample_ids(db)).keys()
+    assert {name: tables for name, tables in scans.items() if tables} == {}
+
+
+def test_check_needs_data(db):
+    with pytest.raises(LookupError):
+        plans.check(db)
@@ -0,0 +1,54 @@
+import asyncio
+import gzip
+
+import brotli
+import orjson
+import pytest
+
+from czytacz.api import responses
+
+
+async def body(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress",
+    [("br", brotli.decompress), ("gzip", gzip.decompress), (None, lambda data: data)],
+)
+def test_chunked_page(encoding, decompress):
+    items = [{"id": i} for i in range(responses.STREAM_THRESHOLD + 10)]
+
+    response = responses.page_response(
+        {"id": 1}, items, {"next_cursor": None}, accept_encoding=encoding
+    )
+
+    assert response.headers.get("content-encoding") == encoding
+    assert orjson.loads(decompress(asyncio.run(body(response)))) == {
+        "id": 1,
+        "items": items,
+        "next_cursor": None,
+    }
+
+
+def test_choose_encoding():
+    assert responses.choose_encoding("gzip, br;q=0.5") == "br"
+    assert responses.choose_encoding("gzip, br;q=0") == "gzip"
+    assert responses.choose_encoding("identity") is None
+
+
+@pytest.mark.parametrize(
+    "if_none_match, matches",
+    [
+        (None, False),
+        ("", False),
+        ("*", True),
+        ('W/"abc"', True),
+        ('"abc"', True),
+        ('W/"abd"', False),
+        ('W/"abd", W/"abc"', True),
+        ('"abd" ,"abc"', True),
+    ],
+)
+def test_etag_matches(if_none_match, matches):
+    assert responses.etag_matches('W/"abc"', if_none_match) == matches
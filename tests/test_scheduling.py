@@ -0,0 +1,245 @@
+import datetime
+import email.utils
+from typing import Optional
+
+import pytest
+
+from czytacz import scheduling
+from czytacz.settings import settings
+
+MIN = settings.FETCH_MIN_INTERVAL
+MAX = settings.FETCH_MAX_INTERVAL
+DEFAULT = settings.FETCH_DEFAULT_INTERVAL
+NOW = datetime.datetime(2024, 1, 1, 12)
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    monkeypatch.setattr(scheduling.random, "uniform", lambda a, b: 1.0)
+
+
+def http_date(when: datetime.datetime) -> str:
+    return email.utils.format_datetime(when, usegmt=True)
+
+
+def local(utc_hour: int, minute: int = 0) -> datetime.datetime:
+    """Naive local time, like our timestamps, at an hour in UTC."""
+    when = datetime.datetime(2024, 1, 1, utc_hour, minute, tzinfo=datetime.timezone.utc)
+    return when.astimezone().replace(tzinfo=None)
+
+
+@pytest.mark.parametrize(
+    "headers, lifetime",
+    [
+        ({}, None),
+        ({"cache-control": "no-cache"}, 0),
+        ({"cache-control": "public, no-store"}, 0),
+        ({"cache-control": "max-age=600"}, 600),
+        ({"cache-control": 'max-age="600"'}, 600),
+        ({"cache-control": "max-age=600, s-maxage=900"}, 900),
+        ({"cache-control": "s-maxage=900, max-age=600"}, 900),
+        ({"cache-control": "max-age=600", "age": "100"}, 500),
+        ({"cache-control": "max-age=600", "age": "1000"}, 0),
+        ({"cache-control": "max-age=600", "expires": "0"}, 600),
+        (
+            {
+                "date": "Mon, 01 Jan 2024 12:00:00 GMT",
+                "expires": "Mon, 01 Jan 2024 13:00:00 GMT",
+            },
+            3600,
+        ),
+        (
+            {
+                "date": "Mon, 01 Jan 2024 12:00:00 GMT",
+                "expires": "Mon, 01 Jan 2024 11:00:00 GMT",
+            },
+            0,
+        ),
+        ({"expires": "0"}, None),
+    ],
+)
+def test_cache_lifetime(headers: dict[str, str], lifetime: Optional[float]):
+    assert scheduling.cache_lifetime(headers) == lifetime
+
+
+@pytest.mark.parametrize(
+    "value, seconds",
+    [
+        (None, None),
+        ("120", 120),
+        (" 120 ", 120),
+        ("soon", None),
+        ("-5", None),
+    ],
+)
+def test_retry_after_in_seconds(value: Optional[str], seconds: Optional[float]):
+    headers = {"retry-after": value} if value is not None else {}
+    assert scheduling.retry_after(headers) == seconds
+
+
+def test_retry_after_as_http_date():
+    in_an_hour = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        hours=1
+    )
+
+    seconds = scheduling.retry_after({"retry-after": http_date(in_an_hour)})
+
+    assert seconds is not None
+    assert 3590 < seconds <= 3600
+
+
+def test_retry_after_in_the_past():
+    yesterday = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        days=1
+    )
+
+    assert scheduling.retry_after({"retry-after": http_date(yesterday)}) == 0
+
+
+@pytest.mark.parametrize(
+    "gaps, interval",
+    [
+        ([], None),
+        ([0], None),
+        ([3600], 3600),
+        ([3600, 7200, 60], 3600),
+        ([3600, 3600], 3600),
+        # Only the most recent items count.
+        ([60] * (scheduling.POSTING_SAMPLE - 1) + [10**6] * 5, 60),
+    ],
+)
+def test_posting_interval(gaps: list[int], interval: Optional[float]):
+    dates = [NOW]
+    for gap in gaps:
+        dates.append(dates[-1] - datetime.timedelta(seconds=gap))
+
+    assert scheduling.posting_interval(reversed(dates)) == interval
+
+
+def test_posting_interval_ignores_repeated_dates():
+    assert scheduling.posting_interval([NOW, NOW, NOW]) is None
+
+
+@pytest.mark.parametrize(
+    "previous, changed, gaps, interval",
+    [
+        (None, False, [], DEFAULT * scheduling.QUIET_GROWTH),
+        (1000, False, [], 1000 * scheduling.QUIET_GROWTH),
+        (MAX, False, [], MAX),
+        (None, True, [], DEFAULT),
+        (1000, True, [], 1000),
+        (1000, True, [7200, 7200], 3600),
+        (1000, True, [60, 60], MIN),
+        (1000, True, [10 * MAX, 10 * MAX], MAX),
+        (10, True, [], MIN),
+    ],
+)
+def test_fetch_interval(
+    previous: Optional[float], changed: bool, gaps: list[int], interval: float
+):
+    dates = [
+        NOW - datetime.timedelta(seconds=sum(gaps[:i])) for i in range(len(gaps) + 1)
+    ]
+
+    assert scheduling.fetch_interval(previous, changed, dates) == interval
+
+
+@pytest.mark.parametrize(
+    "lifetime, ttl, interval",
+    [
+        (None, None, 600),
+        (60, None, 600),
+        (3600, None, 3600),
+        (None, 5, 600),
+        (None, 60, 3600),
+        (3600, 120, 7200),
+        # Hints never push past the maximum.
+        (10 * MAX, None, MAX),
+        (None, 10 * MAX, MAX),
+    ],
+)
+def test_next_fetch_at_takes_hints(
+    no_jitter, lifetime: Optional[float], ttl: Optional[int], interval: float
+):
+    assert scheduling.next_fetch_at(
+        NOW, 600, lifetime=lifetime, ttl=ttl
+    ) == NOW + datetime.timedelta(seconds=interval)
+
+
+@pytest.mark.parametrize("bound", [0.9, 1.1])
+def test_next_fetch_at_jitters(monkeypatch, bound: float):
+    monkeypatch.setattr(settings, "FETCH_JITTER", 0.1)
+    calls = []
+
+    def uniform(a, b):
+        calls.append((a, b))
+        return bound
+
+    monkeypatch.setattr(scheduling.random, "uniform", uniform)
+
+    assert scheduling.next_fetch_at(NOW, 1000) == NOW + datetime.timedelta(
+        seconds=1000 * bound
+    )
+    assert calls == [(pytest.approx(0.9), pytest.approx(1.1))]
+
+
+@pytest.mark.parametrize(
+    "due, skip_hours, expected",
+    [
+        (local(10, 30), [], local(10, 30)),
+        (local(10, 30), list(range(24)), local(10, 30)),
+        (local(10, 30), [9, 11], local(10, 30)),
+        (local(10, 30), [10], local(11)),
+        (local(10, 30), [10, 11, 12], local(13)),
+        # Around midnight, in GMT.
+        (local(23, 30), [23, 0], local(1) + datetime.timedelta(days=1)),
+    ],
+)
+def test_next_fetch_at_skips_hours(
+    no_jitter,
+    due: datetime.datetime,
+    skip_hours: list[int],
+    expected: datetime.datetime,
+):
+    now = due - datetime.timedelta(seconds=600)
+
+    assert scheduling.next_fetch_at(now, 600, skip_hours=skip_hours) == expected
+
+
+@pytest.mark.parametrize(
+    "failure_count, after, delay",
+    [
+        (1, None, scheduling.RETRY_DELAYS[0]),
+        (2, None, scheduling.RETRY_DELAYS[1]),
+        (len(scheduling.RETRY_DELAYS), None, scheduling.RETRY_DELAYS[-1]),
+        (len(scheduling.RETRY_DELAYS) + 1, None, None),
+        # Retry-After can only make us wait longer, up to the maximum.
+        (1, 10, scheduling.RETRY_DELAYS[0]),
+        (1, 3600, 3600),
+        (1, 10 * MAX, MAX),
+        (len(scheduling.RETRY_DELAYS) + 1, 3600, None),
+    ],
+)
+def test_retry_at(
+    no_jitter, failure_count: int, after: Optional[float], delay: Optional[float]
+):
+    expected = NOW + datetime.timedelta(seconds=delay) if delay is not None else None
+
+    assert scheduling.retry_at(NOW, failure_count, after) == expected
+
+
+def test_retry_at_only_jitters_later(monkeypatch):
+    calls = []
+
+    def uniform(a, b):
+        calls.append((a, b))
+        return b
+
+    monkeypatch.setattr(scheduling.random, "uniform", uniform)
+
+    retry = scheduling.retry_at(NOW, 1)
+
+    assert calls == [(1, pytest.approx(1 + settings.FETCH_JITTER))]
+    assert retry == NOW + datetime.timedelta(
+        seconds=scheduling.RETRY_DELAYS[0] * (1 + settings.FETCH_JITTER)
+    )
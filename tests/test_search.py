@@ -0,0 +1,60 @@
+import datetime
+
+from sqlalchemy import select
+
+from czytacz import fetcher, models, schemas, search
+
+
+def fetched(item_id: str, title: str, content: str = "") -> schemas.ItemFetched:
+    return schemas.ItemFetched(
+        item_id=item_id,
+        title=title,
+        link=None,
+        author=None,
+        summary=None,
+        published=None,
+        updated=datetime.datetime(2024, 1, 1),
+        content=[schemas.ItemContent(content_type="text/html", value=content)],
+    )
+
+
+def test_fetched_items_are_searchable(db, run_async):
+    user = models.User(email="reader@example.com")
+    source = models.Source(url="https://example.com/feed")
+    db.add(models.Feed(user=user, name="Feed", source=source))
+    db.commit()
+
+    fetcher.update_items(
+        db,
+        source.id,
+        [
+            fetched("1", "Kangaroos", "<p>They hop.</p>"),
+            fetched("2", "Wombats", "<p>Kangaroos hop, wombats dig.</p>"),
+            fetched("3", "Koalas", "<p>They sleep.</p>"),
+        ],
+        datetime.datetime.now(),
+    )
+    db.commit()
+
+    results, cursor = run_async(search.search_rows, user.id, "kangaroos")
+    item_ids = db.scalars(
+        select(models.Item.item_id).where(
+            models.Item.id.in_([result.id for result in results])
+        )
+    ).all()
+    assert sorted(item_ids) == ["1", "2"]
+    # Titles weigh more than content.
+    assert results[0].title == "Kangaroos"
+    assert cursor is None
+
+
+def test_reindex(db):
+    source = models.Source(url="https://example.com/feed")
+    db.add(source)
+    db.commit()
+    fetcher.update_items(
+        db, source.id, [fetched("1", "Kangaroos")], datetime.datetime.now()
+    )
+    db.commit()
+
+    assert list(search.reindex(db, 10)) == [1]
@@ -0,0 +1,81 @@
+import datetime
+from collections.abc import Iterator
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from czytacz import database, fetcher, models, schemas, sync
+
+
+@pytest.fixture
+def writer(migrated_database) -> Iterator[Session]:
+    """Open another session, to write in while the test looks on."""
+    session = database.get_session_factory()()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+def register(session: Session) -> int:
+    """Register as a writer, and get the number taken for it."""
+    session.execute(sync.register_writer())
+    return session.execute(text("SELECT last_value FROM change_seq")).scalar_one()
+
+
+def fetched(item_id: str) -> schemas.ItemFetched:
+    return schemas.ItemFetched(
+        item_id=item_id,
+        title=None,
+        link=None,
+        author=None,
+        summary=None,
+        published=None,
+        updated=datetime.datetime(2024, 1, 1),
+        content=[],
+    )
+
+
+def test_horizon_stays_below_registered_writers(db, writer, run_async):
+    number = register(writer)
+    # Writers coming later and done already don't matter.
+    later = register(db)
+    db.commit()
+
+    assert run_async(sync.horizon) == number - 1
+
+    writer.commit()
+
+    assert run_async(sync.horizon) == later
+
+
+def test_horizon_without_writers_is_the_last_number(db, run_async):
+    number = register(db)
+    db.commit()
+
+    assert run_async(sync.horizon) == number
+
+
+def test_changes_wait_for_writers_still_in_flight(api, db, writer):
+    url = "https://example.com/feed"
+    api.post("/feeds/", json={"name": "Feed", "source": url})
+    source_id = db.scalar(select(models.Source.id).where(models.Source.url == url))
+    fetcher.update_items(db, source_id, [fetched("1")], datetime.datetime.now())
+    db.commit()
+
+    number = register(writer)
+    fetcher.update_items(db, source_id, [fetched("2")], datetime.datetime.now())
+    db.commit()
+
+    # The second item is there, but behind a writer that may still add more.
+    first = api.get("/sync").json()
+    assert [item["item_id"] for item in first["items"]] == ["1"]
+    assert first["since"] == number - 1
+
+    writer.commit()
+    second = api.get("/sync", params={"since": first["since"]}).json()
+
+    assert [item["item_id"] for item in second["items"]] == ["2"]
+    assert second["since"] > number
@@ -0,0 +1,82 @@
+import datetime
+
+from sqlalchemy import select
+
+from czytacz import FeedStatus, models, scheduling, tasks
+
+
+def add_source(db, **values) -> models.Source:
+    user = models.User(email="reader@example.com")
+    source = models.Source(url="https://example.com/feed", **values)
+    db.add(models.Feed(user=user, name="Feed", source=source))
+    db.commit()
+    return source
+
+
+def test_reclaim_expired_leases(db):
+    now = datetime.datetime.now()
+    source = add_source(
+        db,
+        status=FeedStatus.FETCHING,
+        lease_expires_at=now - datetime.timedelta(minutes=1),
+    )
+
+    reclaimed = db.execute(tasks.reclaim_expired_leases(now)).scalars().all()
+    db.commit()
+
+    assert reclaimed == [source.id]
+    db.refresh(source)
+    assert source.status == FeedStatus.TRY_LATER
+    assert source.failure_count == 1
+    assert source.lease_expires_at is None
+
+
+def test_reclaim_expired_leases_gives_up(db):
+    now = datetime.datetime.now()
+    source = add_source(
+        db,
+        status=FeedStatus.FETCHING,
+        lease_expires_at=now - datetime.timedelta(minutes=1),
+        failure_count=len(scheduling.RETRY_DELAYS),
+    )
+
+    db.execute(tasks.reclaim_expired_leases(now))
+    db.commit()
+
+    db.refresh(source)
+    assert source.status == FeedStatus.FAILED
+
+
+def test_queue_feeds(db, monkeypatch):
+    queued = []
+    monkeypatch.setattr(tasks.fetch_source, "delay", queued.append)
+    source = add_source(db, status=FeedStatus.OK)
+
+    tasks.queue_feeds()
+
+    assert queued == [source.id]
+    assert (
+        db.scalar(select(models.Source.status).where(models.Source.id == source.id))
+        == FeedStatus.FETCHING
+    )
+
+
+def test_workers_log_their_pools_now_and_then(monkeypatch, caplog):
+    now = 1000.0
+    monkeypatch.setattr(tasks.time, "monotonic", lambda: now)
+    monkeypatch.setattr(tasks, "_pool_logged_at", 0.0)
+    monkeypatch.setattr(tasks.settings, "DB_POOL_LOG_INTERVAL", 300)
+    # Migrating the test database configures logging, and turns this off.
+    monkeypatch.setattr(tasks.logger, "disabled", False)
+    caplog.set_level("INFO", logger=tasks.__name__)
+
+    tasks.log_pool_status()
+    now += 299
+    tasks.log_pool_status()
+    now += 1
+    tasks.log_pool_status()
+
+    assert [record.message.split(":")[0] for record in caplog.records] == [
+        "Connection pools",
+        "Connection pools",
+    ]
@@ -0,0 +1,141 @@
+import datetime
+import types
+import urllib.parse
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from czytacz import fetcher, http_client, hub, models, tasks, websub
+from czytacz.settings import settings
+
+TOPIC = "https://example.com/feed"
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Feed</title>
+<item><guid>1</guid><title>Kangaroos</title><pubDate>Mon, 01 Jan 2024 00:00:00 GMT</pubDate></item>
+</channel></rss>"""
+
+
+@pytest.fixture
+def hub_client(api, monkeypatch):
+    """Run the stand-in hub, talking to the API and the feed's site in-process."""
+    monkeypatch.setattr(settings, "PUBLIC_BASE_URL", "http://testserver")
+    monkeypatch.setattr(hub, "subscriptions", {})
+    client = TestClient(hub.app)
+
+    def request(method, url, body=None, headers=None):
+        if url == TOPIC:
+            return types.SimpleNamespace(
+                status=200, data=FEED, headers={"content-type": "application/xml"}
+            )
+        response = api.request(method, url, content=body, headers=headers)
+        return types.SimpleNamespace(
+            status=response.status_code,
+            data=response.content,
+            headers=response.headers,
+        )
+
+    def post_form(url, fields):
+        response = client.post(
+            urllib.parse.urlsplit(url).path,
+            content=urllib.parse.urlencode(fields),
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        return http_client.Response(
+            url=url, status=response.status_code, headers={}, body=response.content
+        )
+
+    monkeypatch.setattr(hub, "http", types.SimpleNamespace(request=request))
+    monkeypatch.setattr(http_client, "post_form", post_form)
+    return client
+
+
+def subscribed_source(db, hub_url: str) -> models.Source:
+    source = models.Source(url=TOPIC)
+    db.add(
+        models.Feed(
+            user=models.User(email="other@example.com"), name="Feed", source=source
+        )
+    )
+    websub.update_hub(source, hub_url, None)
+    db.commit()
+    db.execute(websub.claim_renewals(datetime.datetime.now(), 10))
+    db.commit()
+    assert websub.subscribe(db, source.id)
+    db.refresh(source)
+    return source
+
+
+def test_local_hubs_need_trusting(monkeypatch):
+    source = models.Source(url=TOPIC)
+
+    websub.update_hub(source, "http://localhost:8001/", None)
+    assert source.websub_hub is None
+
+    monkeypatch.setattr(settings, "WEBSUB_TRUSTED_HUBS", ["http://localhost:8001"])
+    websub.update_hub(source, "http://localhost:8001/", None)
+    assert source.websub_hub == "http://localhost:8001/"
+
+
+def test_signed_pushes_are_taken(db, hub_client, monkeypatch):
+    monkeypatch.setattr(settings, "WEBSUB_TRUSTED_HUBS", ["https://localhost:8001/"])
+    pushed = []
+    monkeypatch.setattr(tasks.ingest_push, "delay", lambda *args: pushed.append(args))
+
+    source = subscribed_source(db, "https://localhost:8001/")
+
+    assert source.websub_expires_at is not None
+    ((topic, callback),) = hub.subscriptions
+    assert hub.subscriptions[topic, callback].secret == source.websub_secret
+
+    hub_client.post("/", data={"hub.mode": "publish", "hub.url": TOPIC})
+
+    ((source_id, body, content_type),) = pushed
+    tasks.ingest_push(source_id, body, content_type)
+    titles = db.scalars(
+        select(models.Item.title).where(models.Item.source_id == source.id)
+    ).all()
+    assert titles == ["Kangaroos"]
+
+
+def test_hubs_without_https_get_no_secret(db, hub_client, monkeypatch):
+    monkeypatch.setattr(settings, "WEBSUB_TRUSTED_HUBS", ["http://localhost:8001/"])
+    monkeypatch.setattr(
+        tasks.ingest_push, "delay", lambda *args: pytest.fail("Unsigned push taken")
+    )
+
+    source = subscribed_source(db, "http://localhost:8001/")
+
+    assert source.websub_secret is None
+    assert source.websub_expires_at is not None
+    (subscription,) = hub.subscriptions.values()
+    assert subscription.secret is None
+
+    source.next_fetch_at = datetime.datetime.now() + datetime.timedelta(hours=1)
+    db.commit()
+    hub_client.post("/", data={"hub.mode": "publish", "hub.url": TOPIC})
+
+    db.refresh(source)
+    # Fetched soon instead.
+    assert source.next_fetch_at <= datetime.datetime.now()
+
+
+def test_pushes_to_unknown_sources_are_gone(api):
+    assert api.post("/websub/1", content=FEED).status_code == 410
+
+
+def test_oversized_pushes_are_refused(db, api, monkeypatch):
+    monkeypatch.setattr(settings, "PARSE_MAX_BYTES", 100)
+
+    def body():
+        for _ in range(10):
+            yield FEED
+
+    assert api.post("/websub/1", content=body()).status_code == 413
+
+
+def test_pushes_to_deleted_sources_are_dropped(db):
+    result = fetcher.ingest_pushed(db, 1, FEED, {"content-type": "application/xml"})
+
+    assert result.inserted == 0
+    assert db.scalars(select(models.Item)).all() == []